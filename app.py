@@ -1,39 +1,56 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
 from models.llm_handler import llm
-from db.connection import db_manager
+from models.llm_queue import llm_queue, QueueFullError
+from models.generation_cache import generation_cache
+from models.candidates import candidate_generator
+from db.connection import db_manager, encode_page_token, decode_page_token
+from db.schema_catalog import schema_catalog
+from db.history_store import history_store
+from db.stats_engine import compute_stats, compute_stats_pushdown, StatsAccumulator
+from db.explain import explain_gate
+from db.query_registry import query_registry, socket_closed
+from db.query_cache import query_cache
+from db.sql_safety import sql_safety
+from db.script_runner import script_runner
+from db import result_format
+from db.result_export import result_exporter
+from metrics import metrics
 import json
+import logging
+import math
 import os
-from datetime import datetime
 from dotenv import load_dotenv
 import sqlparse
-import re
-import pandas as pd
-import numpy as np
 
-from db.seed_data import run_seeding
+from db.seed_data import run_seeding, SEED_TABLES
 
 load_dotenv()
 
+# Niveau des traces (DEBUG, INFO, WARNING...) : les traces DEBUG (SQL, réponses brutes du modèle) sont coûteuses
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+)
+logger = logging.getLogger(__name__)
+
 app = Flask(__name__)
+# Durées par phase : en-tête Server-Timing et histogrammes exposés sur /metrics
+metrics.instrument_flask(app)
 
-HISTORY_FILE = "db/history.json"
+# Préchargement du modèle et du préfixe de prompt au démarrage (optionnel)
+OLLAMA_WARMUP = os.getenv("OLLAMA_WARMUP", "0") == "1"
+if OLLAMA_WARMUP:
+    llm.warm_up_async()
 
-def load_history():
-    if os.path.exists(HISTORY_FILE):
-        try:
-            with open(HISTORY_FILE, "r", encoding="utf-8") as f:
-                content = f.read().strip()
-                if not content:
-                    return []
-                return json.loads(content)
-        except (json.JSONDecodeError, Exception) as e:
-            print(f"Erreur lecture historique: {e}")
-            return []
-    return []
-
-def save_history(history):
-    with open(HISTORY_FILE, "w", encoding="utf-8") as f:
-        json.dump(history, f, indent=4, ensure_ascii=False)
+# Backend des statistiques de résultat : "python" (lignes rapatriées) ou "oracle" (calcul côté base)
+STATS_BACKEND = os.getenv("STATS_BACKEND", "python")
+STATS_PUSHDOWN_PAGE_SIZE = int(os.getenv("STATS_PUSHDOWN_PAGE_SIZE", "100"))
+# Streaming : seuil des sketches inférieur au plafond de lignes, sinon toutes les valeurs restent en mémoire jusqu'au résumé
+STATS_STREAM_SKETCH_THRESHOLD = int(os.getenv("STATS_STREAM_SKETCH_THRESHOLD", "10000"))
+
+def current_user_id():
+    """Partition de l'historique : en-tête X-User-Id (posé par le proxy d'authentification), sinon anonyme."""
+    return request.headers.get("X-User-Id", "").strip()[:128]
 
 @app.route("/")
 def index():
@@ -61,81 +78,211 @@ def upload_schema():
         content = f.read()
     with open(static_path, 'wb') as f:
         f.write(content)
-        
-    return jsonify({"status": "Schéma mis à jour avec succès"})
+
+    # Prompts reconstruits et générations faites avec l'ancien schéma invalidées
+    llm.invalidate_schema()
+    generation_cache.invalidate_schema(llm.get_schema_version())
+    if OLLAMA_WARMUP:
+        llm.warm_up_async()
+
+    if llm.uses_catalog():
+        # Le catalogue Oracle reste prioritaire : le fichier est conservé (repli si le catalogue disparaît,
+        # SCHEMA_SOURCE=markdown) mais n'est pas celui injecté dans les prompts
+        logger.warning("Schéma importé enregistré mais non utilisé : SCHEMA_SOURCE=%s et catalogue Oracle chargé", llm.schema_source)
+        return jsonify({
+            "status": "Schéma enregistré",
+            "schema_source": "catalog",
+            "warning": "Le catalogue Oracle reste la source du schéma pour l'IA ; le fichier importé n'est utilisé "
+                       "qu'avec SCHEMA_SOURCE=markdown ou sans catalogue."
+        })
+    return jsonify({"status": "Schéma mis à jour avec succès", "schema_source": "markdown"})
 
 @app.route("/api/generate", methods=["POST"])
 def generate():
     data = request.json
     user_query = data.get("query")
     mode = data.get("mode", "editor") # Default to editor
-    print(f"DEBUG: Requête reçue (Mode: {mode}): {user_query}")
+    logger.debug("Requête reçue (Mode: %s): %s", mode, user_query)
     if not user_query:
         return jsonify({"error": "La requête est vide"}), 400
-    
-    llm_res = llm.generate_sql(user_query, mode=mode)
-    
+
+    # Génération multi-candidats : {"candidates": 3, "budget": 15} (défaut GENERATION_CANDIDATES), 1 = désactivée
+    try:
+        candidates = candidate_generator.resolve_count(data.get("candidates"))
+        budget = candidate_generator.resolve_budget(data.get("budget"))
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Paramètre invalide : {e}"}), 400
+
+    try:
+        if candidates > 1 and data.get("async"):
+            job, llm_res = candidate_generator.submit(user_query, db_manager, mode, candidates, budget)
+            if job is not None:
+                return jsonify({"job_id": job.id, "status": job.status, "position": llm_queue.position(job)}), 202
+        elif candidates > 1:
+            llm_res = candidate_generator.generate(user_query, db_manager, mode, candidates, budget)
+        elif data.get("async"):
+            # Mode asynchrone : 202 + identifiant à consulter sur /api/jobs/<id>
+            job, llm_res = llm.submit_generation(user_query, mode=mode)
+            if job is not None:
+                return jsonify({"job_id": job.id, "status": job.status, "position": llm_queue.position(job)}), 202
+        else:
+            llm_res = llm.generate_sql(user_query, mode=mode)
+    except QueueFullError as e:
+        return queue_full_response(e)
+
+    return jsonify(generation_response(llm_res))
+
+def generation_response(llm_res):
     if isinstance(llm_res, str):
-        return jsonify({"sql": llm_res, "explanation": "Erreur ou requête invalide."})
+        return {"sql": llm_res, "explanation": "Erreur ou requête invalide."}
 
-    sql = llm_res.get("sql", "")
+    sql = format_generated_sql(llm_res.get("sql", ""))
     explanation = llm_res.get("explanation", "Voici votre requête.")
 
+    logger.debug("SQL généré: %s", sql)
+    response = {"sql": sql, "explanation": explanation}
+    # Génération multi-candidats (models/candidates.py) : validation, coût estimé et détail des candidats
+    for field in ("validated", "cost", "selected", "candidates"):
+        if field in llm_res:
+            response[field] = llm_res[field]
+    return response
+
+def queue_full_response(error):
+    response = jsonify(error.to_dict())
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response, 429
+
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    job = llm_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job inconnu ou expiré"}), 404
+
+    payload = job.to_dict()
+    payload["position"] = llm_queue.position(job)
+    if job.status == "done":
+        result = job.future.result()
+        payload["result"] = generation_response(result) if job.kind == "generate" else result
+    elif job.status == "error":
+        payload["error"] = str(job.future.exception())
+    return jsonify(payload)
+
+@app.route("/api/llm/queue", methods=["GET"])
+def llm_queue_stats():
+    return jsonify(llm_queue.get_stats())
+
+@app.route("/api/llm/candidates", methods=["GET"])
+def llm_candidates_stats():
+    return jsonify(candidate_generator.get_stats())
+
+def format_generated_sql(sql):
     # Formatage SQL
-    if sql and not sql.startswith("Error:"):
+    if sql and not sql.startswith("Error:") and sql != "INVALID_QUERY":
+        with metrics.phase("sql_parse"):
+            try:
+                sql = sqlparse.format(sql, reindent=True, keyword_case='upper', strip_comments=False)
+            except:
+                pass
+    return sql
+
+@app.route("/api/generate/stream", methods=["POST"])
+def generate_stream():
+    """Variante SSE de /api/generate : événements token / explanation / sql, puis done."""
+    data = request.json
+    user_query = data.get("query")
+    mode = data.get("mode", "editor")
+    logger.debug("Requête streaming reçue (Mode: %s): %s", mode, user_query)
+    if not user_query:
+        return jsonify({"error": "La requête est vide"}), 400
+
+    def generate_events():
+        events = llm.generate_sql_stream(user_query, mode=mode)
         try:
-            sql = sqlparse.format(sql, reindent=True, keyword_case='upper', strip_comments=False)
-        except:
-            pass
-        
-    print(f"DEBUG: SQL généré: {sql}")
-    return jsonify({"sql": sql, "explanation": explanation})
+            for event in events:
+                if event["event"] == "done":
+                    event["sql"] = format_generated_sql(event["sql"])
+                yield f"event: {event['event']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        finally:
+            # Client déconnecté : fermer le générateur coupe la connexion vers Ollama
+            events.close()
 
-def compute_stats(columns, data):
-    if not data:
-        return []
-    
-    df = pd.DataFrame(data, columns=columns)
-    stats = []
-    
-    for col in columns:
-        col_data = df[col]
-        
-        # Basic stats
-        total_rows = len(df)
-        null_count = col_data.isna().sum()
-        unique_count = col_data.nunique()
-        
-        # Type detection (simple)
-        dtype = "string"
-        if pd.api.types.is_numeric_dtype(col_data):
-            dtype = "numeric"
-        elif pd.api.types.is_datetime64_any_dtype(col_data):
-            dtype = "date"
-            
-        # Value distribution (Top 5)
-        top_values = []
-        counts = col_data.value_counts().head(5)
-        for val, count in counts.items():
-            top_values.append({
-                "value": str(val),
-                "count": int(count),
-                "percentage": round((count / total_rows) * 100, 1)
-            })
-            
-        stats.append({
-            "column": col,
-            "type": dtype,
-            "null_count": int(null_count),
-            "null_percentage": round((null_count / total_rows) * 100, 1),
-            "unique_count": int(unique_count),
-            "top_values": top_values,
-            "min": str(col_data.min()) if dtype == "numeric" else None,
-            "max": str(col_data.max()) if dtype == "numeric" else None,
-            "mean": float(col_data.mean()) if dtype == "numeric" else None
-        })
-        
-    return stats
+    return Response(
+        stream_with_context(generate_events()),
+        mimetype="text/event-stream",
+        headers={"X-Accel-Buffering": "no", "Cache-Control": "no-cache"}
+    )
+
+def check_sql_security(sql):
+    """Renvoie un message d'erreur si la requête n'est pas une lecture autorisée (db/sql_safety.py), sinon None."""
+    with metrics.phase("sql_parse"):
+        return sql_safety.check(sql)
+
+def disconnect_probe():
+    """Fonction indiquant si le client HTTP est parti, ou None si le serveur ne permet pas de le savoir."""
+    # Mode ASGI : jeton posé par asgi.py, l'évènement est levé à la réception de http.disconnect
+    token = request.headers.get("X-Request-Token")
+    if token:
+        event = query_registry.request_event(token)
+        if event is not None:
+            return event.is_set
+    # gunicorn (workers sync/gthread) et serveur de développement : socket du client
+    sock = request.environ.get("gunicorn.socket") or request.environ.get("werkzeug.socket")
+    if sock is not None:
+        return lambda: socket_closed(sock)
+    return None
+
+def stream_execute(sql, chunk_size=None, max_rows=None, with_stats=True, plan=None, tracker=None, fmt="rows"):
+    """
+    Exécution en streaming NDJSON : colonnes, puis paquets de lignes ({"rows": [...]}, ou {"data": [...]}
+    colonne par colonne en format "columnar"), puis un résumé (avec stats).
+    """
+    import time
+    start_time = time.perf_counter()
+
+    stream, error = db_manager.open_stream(sql, chunk_size=chunk_size, max_rows=max_rows, tracker=tracker)
+    if error:
+        execution_time = (time.perf_counter() - start_time) * 1000
+        logger.debug("Erreur Oracle détectée: %s", error)
+        return jsonify({"error": error, "execution_time": round(execution_time, 2), "query_id": tracker.id}), 200
+
+    def generate_lines():
+        try:
+            header = {"columns": stream.columns}
+            if plan:
+                header["plan"] = plan
+            yield app.json.dumps(header) + "\n"
+            # Les stats sont alimentées au fil des paquets ; mémoire bornée par les sketches au-delà de
+            # STATS_STREAM_SKETCH_THRESHOLD lignes
+            accumulator = StatsAccumulator(stream.columns, sketch_threshold=STATS_STREAM_SKETCH_THRESHOLD) if with_stats else None
+            for rows in stream.chunks():
+                if accumulator is not None:
+                    with metrics.phase("stats"):
+                        accumulator.update(rows)
+                if fmt == "columnar":
+                    yield result_format.dumps({"data": result_format.to_columns(rows, len(stream.columns))}) + b"\n"
+                else:
+                    yield app.json.dumps({"rows": rows}) + "\n"
+            execution_time = (time.perf_counter() - start_time) * 1000
+            summary = {
+                "row_count": stream.row_count,
+                "truncated": stream.truncated,
+                "execution_time": round(execution_time, 2)
+            }
+            if accumulator is not None:
+                with metrics.phase("stats"):
+                    summary["stats"] = accumulator.result()
+            yield app.json.dumps(summary) + "\n"
+        except Exception as e:
+            yield app.json.dumps({"error": stream.error_message(e)}) + "\n"
+        finally:
+            # Déconnexion du client : le générateur est fermé, on rend la session au pool
+            stream.close()
+
+    return Response(
+        stream_with_context(generate_lines()),
+        mimetype="application/x-ndjson",
+        headers={"X-Accel-Buffering": "no", "Cache-Control": "no-cache", "X-Query-Id": tracker.id}
+    )
 
 @app.route("/api/execute", methods=["POST"])
 def execute():
@@ -144,121 +291,441 @@ def execute():
     if sql.endswith(';'):
         sql = sql[:-1].strip()
         
-    print(f"DEBUG: Exécution SQL demandée (nettoyée): {sql}")
+    logger.debug("Exécution SQL demandée (nettoyée): %s", sql)
     if not sql:
         return jsonify({"error": "Le SQL est vide"}), 400
     
     # --- VÉRIFICATION DE SÉCURITÉ ---
-    sql_upper = sql.upper()
-    forbidden_keywords = ["DROP", "DELETE", "TRUNCATE", "UPDATE", "ALTER", "CREATE", "GRANT", "REVOKE", "INSERT"]
-    
-    for kw in forbidden_keywords:
-        # On vérifie avec un regex pour s'assurer que c'est le mot entier (pas une colonne type 'STATUT_UPDATE')
-        if re.search(r'\b' + kw + r'\b', sql_upper):
-            return jsonify({"error": f"Sécurité : L'instruction '{kw}' n'est pas autorisée dans cet éditeur."}), 403
+    security_error = check_sql_security(sql)
+    if security_error:
+        return jsonify({"error": security_error}), 403
+
+    # Statistiques par colonne : {"stats": false} pour les désactiver, {"stats_sample": 10000} pour échantillonner
+    with_stats = data.get("stats", True) is not False
+    stats_sample = data.get("stats_sample")
+    if stats_sample is not None:
+        try:
+            if isinstance(stats_sample, bool) or int(stats_sample) < 0:
+                raise ValueError
+        except (TypeError, ValueError):
+            return jsonify({"error": f"Paramètre invalide : stats_sample={stats_sample!r} (entier positif ou 0 attendu)"}), 400
+        stats_sample = int(stats_sample)
+    # {"stats_backend": "oracle"} : stats calculées par Oracle sur tout le résultat, seule la première page est renvoyée
+    stats_backend = data.get("stats_backend") or STATS_BACKEND
+    if stats_backend not in ("python", "oracle"):
+        return jsonify({"error": f"Backend de statistiques inconnu : {stats_backend}"}), 400
+    pushdown = with_stats and stats_backend == "oracle"
+
+    # Format de la réponse : "rows" (lignes, par défaut), "columnar" (une liste par colonne) ou "arrow" (Arrow IPC)
+    fmt = data.get("format") or "rows"
+    if fmt not in result_format.FORMATS:
+        return jsonify({"error": f"Format de résultat inconnu : {fmt} (disponibles : {', '.join(result_format.FORMATS)})"}), 400
+    if fmt == "arrow" and data.get("stream"):
+        return jsonify({"error": "Le format arrow n'est pas disponible en streaming."}), 400
+    if fmt == "arrow" and not result_format.arrow_available():
+        return jsonify({"error": "Format arrow indisponible : installez pyarrow (pip install pyarrow)."}), 400
+
+    # Tailles (pagination, streaming) validées avant tout accès à la base : entiers strictement positifs
+    sizes = {}
+    for name in ("page_size", "chunk_size", "max_rows"):
+        value = data.get(name)
+        if value is None:
+            continue
+        try:
+            if isinstance(value, bool) or int(value) < 1:
+                raise ValueError
+        except (TypeError, ValueError):
+            return jsonify({"error": f"Paramètre invalide : {name}={value!r} (entier positif attendu)"}), 400
+        sizes[name] = int(value)
+
+    # Cache des résultats (QUERY_CACHE_ENABLED=1) : exécution complète uniquement, {"cache": false} pour l'ignorer
+    cache_key = None
+    if (data.get("cache", True) is not False and not data.get("stream") and not sizes.get("page_size")
+            and not data.get("page_token") and not pushdown and fmt != "arrow" and query_cache.cacheable(sql)):
+        cache_key = query_cache.make_key(sql, {"stats": with_stats, "stats_sample": stats_sample, "format": fmt})
+        cached = query_cache.get(cache_key)
+        if cached is not None:
+            return Response(cached, mimetype="application/json", headers={"X-Cache": "HIT"})
+
+    # Plan d'exécution estimé (EXPLAIN_MODE=warn|reject) ; les pages suivantes ont déjà été contrôlées
+    plan = None
+    if explain_gate.enabled() and not data.get("page_token"):
+        with metrics.phase("explain"):
+            plan, plan_error = explain_gate.check(db_manager, sql)
+        if plan_error:
+            # La requête est invalide ou PLAN_TABLE absente : l'exécution renverra l'erreur Oracle
+            logger.debug("EXPLAIN PLAN impossible: %s", plan_error)
+        elif plan["verdict"] == "reject":
+            return jsonify({"error": plan["message"], "plan": plan}), 422
+
+    # Suivi de la requête : {"query_id": "..."} pour l'annuler (POST /api/queries/<id>/cancel),
+    # {"timeout": 30} en secondes (plafonné par ORACLE_MAX_CALL_TIMEOUT)
+    try:
+        tracker = query_registry.track(sql, current_user_id(), data.get("query_id"), data.get("timeout"), disconnect_probe())
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Paramètre invalide : {e}"}), 400
+
+    # Mode streaming : {"stream": true, "chunk_size": 1000, "max_rows": 50000}
+    if data.get("stream"):
+        return stream_execute(sql, chunk_size=sizes.get("chunk_size"), max_rows=sizes.get("max_rows"), with_stats=with_stats, plan=plan, tracker=tracker, fmt=fmt)
+
+    # Pagination côté serveur : {"page_size": 100, "page_token": "..."}
+    page_size = sizes.get("page_size")
+    page_token = data.get("page_token")
+    offset = 0
+    if page_token:
+        decoded = decode_page_token(sql, page_token)
+        if decoded is None:
+            tracker.detach()
+            return jsonify({"error": "Jeton de pagination invalide pour cette requête."}), 400
+        offset, token_page_size = decoded
+        page_size = page_size or token_page_size
+    if pushdown and not page_size:
+        page_size = STATS_PUSHDOWN_PAGE_SIZE
     
     import time
     start_time = time.perf_counter()
     
-    result, error = db_manager.execute_query(sql)
+    if page_size:
+        result, error = db_manager.fetch_page(sql, offset, page_size, tracker=tracker)
+    else:
+        result, error = db_manager.execute_query(sql, tracker=tracker)
     execution_time = (time.perf_counter() - start_time) * 1000 # en ms
     
     if error:
-        print(f"DEBUG: Erreur Oracle détectée: {error}")
-        return jsonify({"error": error, "execution_time": round(execution_time, 2)}), 200 # On renvoie 200 pour que le front gère l'erreur proprement sans erreur réseau 500
+        logger.debug("Erreur Oracle détectée: %s", error)
+        return jsonify({"error": error, "execution_time": round(execution_time, 2), "query_id": tracker.id}), 200 # On renvoie 200 pour que le front gère l'erreur proprement sans erreur réseau 500
     
-    print("DEBUG: Requête exécutée avec succès")
+    logger.debug("Requête exécutée avec succès")
+
+    if "has_more" in result:
+        next_offset = result["offset"] + len(result["data"])
+        result["next_page_token"] = encode_page_token(sql, next_offset, page_size) if result.pop("has_more") else None
     
     # On ajoute les stats si c'est un SELECT (dict avec colonnes et données)
-    if isinstance(result, dict) and "columns" in result and "data" in result:
+    if pushdown and "columns" in result:
+        # Les pages suivantes n'ont pas besoin de stats : le client les a reçues avec la première
+        if offset == 0:
+            with metrics.phase("stats"):
+                pushed, stats_error = compute_stats_pushdown(db_manager, sql, tracker=tracker)
+            if stats_error:
+                logger.warning("Error computing stats in Oracle: %s", stats_error)
+                result["stats"] = []
+            else:
+                result["stats"] = pushed["stats"]
+                result["row_count"] = pushed["row_count"]
+    elif with_stats and isinstance(result, dict) and "columns" in result and "data" in result:
         try:
-            result["stats"] = compute_stats(result["columns"], result["data"])
+            with metrics.phase("stats"):
+                result["stats"] = compute_stats(result["columns"], result["data"], sample_size=stats_sample)
         except Exception as e:
-            print(f"DEBUG: Error computing stats: {e}")
+            logger.warning("Error computing stats: %s", e)
             result["stats"] = []
             
+    if plan:
+        result["plan"] = plan
     result["execution_time"] = round(execution_time, 2)
+
+    if fmt == "arrow" and "columns" in result:
+        result["query_id"] = tracker.id
+        body, arrow_error = result_format.to_arrow(result)
+        if arrow_error:
+            return jsonify({"error": arrow_error}), 400
+        return Response(body, mimetype=result_format.ARROW_MIMETYPE, headers={"X-Query-Id": tracker.id})
+
+    if fmt == "columnar":
+        result = result_format.columnar(result)
+    if cache_key and "columns" in result:
+        if fmt == "columnar":
+            body = result_format.dumps(dict(result, cached=True))
+        else:
+            body = app.json.dumps(dict(result, cached=True)).encode("utf-8")
+        query_cache.set(cache_key, body, query_cache.dependencies(sql, schema_catalog))
+    result["query_id"] = tracker.id
+    if fmt == "columnar":
+        return Response(result_format.dumps(result), mimetype="application/json")
     return jsonify(result)
 
+@app.route("/api/export", methods=["POST"])
+def export_results():
+    """
+    Résultat complet en téléchargement, lu et écrit par paquets (db/result_export.py) :
+    {"sql": ..., "format": "csv" | "parquet", "compression": "none" | "gzip" | "zstd"}, plus "timeout", "query_id" et
+    "max_rows" comme /api/execute. Accepte aussi un formulaire (champs identiques).
+    """
+    import time
+    data = request.get_json(silent=True) or request.form
+    sql = (data.get("sql") or "").strip()
+    if sql.endswith(';'):
+        sql = sql[:-1].strip()
+    if not sql:
+        return jsonify({"error": "Le SQL est vide"}), 400
+
+    fmt = data.get("format") or "csv"
+    compression = data.get("compression") or "none"
+    format_error = result_exporter.check(fmt, compression)
+    if format_error:
+        return jsonify({"error": format_error}), 400
+
+    # Mêmes contrôles que /api/execute : lecture seule, délai et annulation
+    security_error = check_sql_security(sql)
+    if security_error:
+        return jsonify({"error": security_error}), 403
+    max_rows = data.get("max_rows")
+    if max_rows in (None, ""):
+        max_rows = None
+    else:
+        try:
+            if isinstance(max_rows, bool) or int(max_rows) < 1:
+                raise ValueError
+        except (TypeError, ValueError):
+            return jsonify({"error": f"Paramètre invalide : max_rows={max_rows!r} (entier positif attendu)"}), 400
+        max_rows = int(max_rows)
+    try:
+        tracker = query_registry.track(sql, current_user_id(), data.get("query_id"), data.get("timeout"), disconnect_probe())
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Paramètre invalide : {e}"}), 400
+
+    stream, error = db_manager.open_stream(sql, chunk_size=result_exporter.arraysize, max_rows=max_rows,
+                                           tracker=tracker, row_limit=result_exporter.max_rows)
+    if error:
+        logger.debug("Erreur Oracle détectée: %s", error)
+        return jsonify({"error": error, "query_id": tracker.id}), 400
+
+    filename = result_exporter.filename(fmt, compression, time.strftime("export_%Y%m%d_%H%M%S"))
+    return Response(
+        stream_with_context(result_exporter.iter_export(stream, fmt, compression, label=tracker.id)),
+        mimetype=result_exporter.mimetype(fmt, compression),
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "X-Accel-Buffering": "no",
+            "Cache-Control": "no-cache",
+            "X-Query-Id": tracker.id
+        }
+    )
+
+@app.route("/api/queries", methods=["GET"])
+def running_queries():
+    """Requêtes de l'utilisateur en cours d'exécution, avec le temps écoulé."""
+    return jsonify({"queries": query_registry.list_queries(current_user_id()), "stats": query_registry.get_stats()})
+
+@app.route("/api/queries/<query_id>/cancel", methods=["POST"])
+def cancel_query(query_id):
+    if not query_registry.cancel(query_id, current_user_id()):
+        return jsonify({"error": "Aucune requête en cours avec cet identifiant."}), 404
+    return jsonify({"status": "cancelling", "query_id": query_id})
+
+@app.route("/api/explain", methods=["POST"])
+def explain():
+    """Plan estimé et verdict du contrôle, sans exécuter la requête."""
+    data = request.json
+    sql = data.get("sql", "").strip().rstrip(";").strip()
+    if not sql:
+        return jsonify({"error": "Le SQL est vide"}), 400
+
+    security_error = check_sql_security(sql)
+    if security_error:
+        return jsonify({"error": security_error}), 403
+
+    report, error = explain_gate.check(db_manager, sql)
+    if error:
+        return jsonify({"error": error}), 400
+    return jsonify(report)
+
+@app.route("/api/explain/stats", methods=["GET"])
+def explain_stats():
+    return jsonify(explain_gate.get_stats())
+
 @app.route("/api/history", methods=["GET"])
 def get_history():
-    return jsonify(load_history())
+    # Pagination par curseur : ?limit=50&before=<id> ; recherche plein texte : ?q=...
+    try:
+        limit = int(request.args.get("limit", 50))
+        before = request.args.get("before", type=int)
+    except ValueError:
+        return jsonify({"error": "Paramètre de pagination invalide"}), 400
+    items, next_cursor = history_store.list_entries(
+        current_user_id(), limit=limit, before=before, search=request.args.get("q")
+    )
+    response = jsonify(items)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = str(next_cursor)
+    return response
 
 @app.route("/api/history", methods=["POST"])
 def add_to_history():
     data = request.json
-    query = data.get("query")
-    sql = data.get("sql")
-    
-    history = load_history()
-    history.insert(0, {
-        "id": len(history) + 1,
-        "query": query,
-        "sql": sql,
-        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    })
-    save_history(history[:50])
-    return jsonify({"status": "ok"})
+    entry = history_store.add(data.get("query"), data.get("sql"), current_user_id())
+    return jsonify({"status": "ok", "id": entry["id"]})
+
+def script_events(text, skip_existing=False, stop_on_error=False):
+    """Exécute un script SQL (db/script_runner.py) et met à jour caches et catalogue une fois terminé."""
+    for event in script_runner.run(db_manager, text, skip_existing=skip_existing, stop_on_error=stop_on_error):
+        if event["event"] == "done":
+            # Objets recréés ou modifiés (même partiellement) : résultats et plans en cache périmés
+            query_cache.invalidate_tables(event["objects"])
+            explain_gate.clear()
+            # Le schéma vient de changer : mise à jour incrémentale du catalogue (LAST_DDL_TIME)
+            if event["ddl"] and llm.schema_source != "markdown":
+                summary, error = refresh_catalog()
+                if error:
+                    logger.warning("Rafraîchissement du catalogue impossible: %s", error)
+        yield event
+
+def script_response(path, success_message):
+    """
+    Options du corps JSON : {"stream": true} pour suivre la progression (NDJSON, un évènement par ligne),
+    {"skip_existing": true} pour ne pas supprimer/recréer les objets déjà présents,
+    {"stop_on_error": true} pour tout annuler à la première erreur.
+    """
+    data = request.get_json(silent=True) or {}
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    events = script_events(text, bool(data.get("skip_existing")), bool(data.get("stop_on_error")))
+
+    if data.get("stream"):
+        return Response(
+            stream_with_context(app.json.dumps(event) + "\n" for event in events),
+            mimetype="application/x-ndjson",
+            headers={"X-Accel-Buffering": "no", "Cache-Control": "no-cache"}
+        )
+
+    errors = []
+    for event in events:
+        if event["event"] == "error":
+            if "line" in event:
+                errors.append(f"Erreur sur : {event['statement']} (ligne {event['line']}) -> {event['error']}")
+            else:
+                errors.append(event["error"])
+        elif event["event"] == "done":
+            summary = event
+    if errors:
+        return jsonify({
+            "status": "partial_success",
+            "message": f"{summary['ok']} commandes exécutées, {summary['errors']} erreurs.",
+            "errors": errors,
+            "skipped": summary["skipped"]
+        })
+    return jsonify({"status": "success", "message": success_message, "skipped": summary["skipped"]})
 
 @app.route("/api/init_db", methods=["POST"])
 def init_db():
     sql_path = os.path.join("db", "init_schema.sql")
     if not os.path.exists(sql_path):
         return jsonify({"error": "Fichier init_schema.sql introuvable"}), 404
-        
     try:
-        with open(sql_path, "r", encoding="utf-8") as f:
-            content = f.read()
-            
-        # Découpage par le séparateur explicite défini dans le fichier
-        commands = content.split('-- SEPARATOR --')
-        
-        success_count = 0
-        errors = []
-        
-        for cmd in commands:
-            cmd = cmd.strip()
-            
-            # On retire les commentaires vides ou les lignes de commentaires pour vérifier s'il reste du SQL
-            clean_cmd = re.sub(r'--.*$', '', cmd, flags=re.MULTILINE).strip()
-            if not clean_cmd:
-                continue
-                
-            # Nettoyage du point-virgule terminal pour Oracle (sauf blocs PL/SQL BEGIN/END)
-            if not clean_cmd.upper().startswith('BEGIN') and clean_cmd.endswith(';'):
-                cmd = cmd.rstrip().rstrip(';').strip()
-            
-            # Log plus propre
-            log_name = clean_cmd.split('\n')[0][:50]
-            
-            print(f"DEBUG: Initialisation - Exécution de : {log_name}...")
-            res, error = db_manager.execute_query(cmd)
-            if error:
-                print(f"DEBUG: Erreur rencontrée : {error}")
-                errors.append(f"Erreur sur : {log_name} -> {error}")
-            else:
-                success_count += 1
-               
-        if errors:
-            return jsonify({
-                "status": "partial_success",
-                "message": f"{success_count} commandes exécutées, {len(errors)} erreurs.",
-                "errors": errors
-            })
-            
-        return jsonify({"status": "success", "message": "Base de données initialisée avec succès !"})
-       
+        return script_response(sql_path, "Base de données initialisée avec succès !")
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/run_script", methods=["POST"])
+def run_script():
+    # {"script": "seed_data.sql"} : seuls les scripts .sql du dossier db/ sont exécutables
+    data = request.get_json(silent=True) or {}
+    name = os.path.basename(str(data.get("script", "")))
+    sql_path = os.path.join("db", name)
+    if not name.endswith(".sql") or not os.path.isfile(sql_path):
+        return jsonify({"error": f"Script introuvable : {name}"}), 404
+    try:
+        return script_response(sql_path, f"Script {name} exécuté avec succès !")
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route("/api/seed_db", methods=["POST"])
 def seed_db():
-    success, message = run_seeding(db_manager)
+    # Paramètres optionnels : {"scale": 10, "seed": 42, "clients": 5000, ...}
+    data = request.get_json(silent=True) or {}
+    # Paramètres validés avant tout accès à la base : 400 plutôt qu'une erreur 500 en cours de route
+    try:
+        scale = float(data.get("scale", 1))
+        if not math.isfinite(scale) or scale <= 0:
+            raise ValueError
+    except (TypeError, ValueError):
+        return jsonify({"status": "error", "error": f"Paramètre invalide : scale={data.get('scale')!r} (nombre positif attendu)"}), 400
+    volumes = {}
+    for table in ("clients", "produits", "commandes", "details"):
+        if data.get(table) is None:
+            continue
+        try:
+            if isinstance(data[table], bool) or int(data[table]) < 1:
+                raise ValueError
+        except (TypeError, ValueError):
+            return jsonify({"status": "error", "error": f"Paramètre invalide : {table}={data[table]!r} (entier positif attendu)"}), 400
+        volumes[table] = int(data[table])
+    # Graine entière (null : DEFAULT_SEED) ; un autre type ferait échouer random.Random hors du bloc try du seeding
+    seed = data.get("seed")
+    if seed is not None:
+        try:
+            if isinstance(seed, bool) or not isinstance(seed, (int, str)):
+                raise ValueError
+            seed = int(seed)
+        except ValueError:
+            return jsonify({"status": "error", "error": f"Paramètre invalide : seed={seed!r} (entier attendu)"}), 400
+    success, message = run_seeding(
+        db_manager,
+        scale=scale,
+        volumes=volumes,
+        seed=seed
+    )
+    # Des lots ont pu être validés avant une erreur : invalidation dans tous les cas
+    query_cache.invalidate_tables(SEED_TABLES)
     if success:
+        # Volumes modifiés : les plans (cardinalités estimées) en cache ne sont plus représentatifs
+        explain_gate.clear()
         return jsonify({"status": "success", "message": message})
     else:
         return jsonify({"status": "error", "error": message}), 500
 
+@app.route("/api/schema/catalog", methods=["GET"])
+def schema_catalog_info():
+    info = schema_catalog.get_stats()
+    info["source"] = "catalog" if llm.uses_catalog() else "markdown"
+    if request.args.get("details"):
+        info["catalog"] = schema_catalog.objects
+    return jsonify(info)
+
+def refresh_catalog(full=False):
+    summary, error = schema_catalog.refresh(db_manager, full=full)
+    if not error:
+        # Nouveau schéma -> prompts reconstruits, générations obsolètes purgées
+        llm.invalidate_schema()
+        generation_cache.invalidate_schema(llm.get_schema_version())
+        explain_gate.clear()
+    return summary, error
+
+@app.route("/api/schema/refresh", methods=["POST"])
+def refresh_schema_catalog():
+    data = request.get_json(silent=True) or {}
+    summary, error = refresh_catalog(full=bool(data.get("full")))
+    if error:
+        return jsonify({"error": error}), 500
+    return jsonify({"status": "success", **summary})
+
+@app.route("/api/cache/generation", methods=["GET"])
+def generation_cache_stats():
+    return jsonify(generation_cache.get_stats())
+
+@app.route("/api/cache/results", methods=["GET"])
+def result_cache_stats():
+    return jsonify(query_cache.get_stats())
+
+@app.route("/api/db/pool", methods=["GET"])
+def pool_stats():
+    return jsonify(db_manager.get_pool_stats())
+
+# Jauges lues à chaque export de /metrics
+metrics.gauge("llm_queue_queued", "Jobs en attente dans la file IA", lambda: llm_queue.get_stats()["queued"])
+metrics.gauge("llm_queue_running", "Jobs IA en cours", lambda: llm_queue.get_stats()["running"])
+metrics.gauge("db_pool_busy", "Sessions Oracle empruntées", lambda: db_manager.get_pool_stats().get("busy"))
+metrics.gauge("db_pool_opened", "Sessions Oracle ouvertes", lambda: db_manager.get_pool_stats().get("opened"))
+metrics.gauge("queries_running", "Requêtes utilisateur en cours d'exécution", lambda: query_registry.get_stats()["running"])
+metrics.gauge("query_cache_bytes", "Taille du cache des résultats (octets compressés)", lambda: query_cache.get_stats()["bytes"])
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Histogrammes des phases et des requêtes HTTP, au format d'exposition Prometheus."""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
 @app.route("/api/history/delete", methods=["POST"])
 def delete_history():
     data = request.json
@@ -266,11 +733,10 @@ def delete_history():
     if item_id is None:
         return jsonify({"error": "ID manquant"}), 400
     
-    history = load_history()
-    # On filtre pour garder tout sauf celui à supprimer
-    # item_id peut être string ou int selon JSON
-    new_history = [item for item in history if str(item.get("id")) != str(item_id)]
-    save_history(new_history)
+    try:
+        history_store.delete(item_id, current_user_id())
+    except (TypeError, ValueError):
+        return jsonify({"error": "ID invalide"}), 400
     return jsonify({"status": "ok"})
 
 @app.route("/api/fix_sql", methods=["POST"])
@@ -278,5 +744,10 @@ def fix_sql():
     from routes.fix_sql import fix_sql_route
     return fix_sql_route()
 
+@app.route("/api/fix_sql/rules", methods=["GET"])
+def fix_sql_rules():
+    from db.sql_fixer import sql_fixer
+    return jsonify(sql_fixer.get_stats())
+
 if __name__ == "__main__":
     app.run(debug=True, port=5000)
@@ -0,0 +1,194 @@
+"""
+Mode de service asynchrone : uvicorn asgi:app
+
+Les appels au modèle (/api/generate, /api/generate/stream, /api/fix_sql) passent par la file d'attente
+LLM (models/llm_queue.py) et sont attendus dans la boucle d'événements : une génération de 45 s
+n'immobilise plus de worker. Les autres routes Flask (exécution Oracle, historique, jobs, pages)
+tournent dans un pool de threads dédié (ASGI_WSGI_THREADS) via a2wsgi ; DisconnectWatcher leur signale
+le départ du client pour annuler la requête Oracle en cours.
+"""
+import asyncio
+import contextlib
+import json
+import functools
+import logging
+import os
+import time
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+import app as flask_module
+from app import app as flask_app, generation_response, format_generated_sql
+from models.async_llm_handler import async_llm
+from models.candidates import candidate_generator
+from models.llm_handler import llm
+from models.llm_queue import llm_queue, QueueFullError
+from db.query_registry import query_registry
+from metrics import metrics
+from routes.fix_sql import apply_local_rules, submit_fix
+
+logger = logging.getLogger(__name__)
+
+# Threads pour les routes Flask (appels oracledb bloquants) : au moins la taille du pool Oracle
+ASGI_WSGI_THREADS = int(os.getenv("ASGI_WSGI_THREADS", os.getenv("ORACLE_POOL_MAX", "8")))
+
+async def read_json(request):
+    try:
+        return await request.json()
+    except ValueError:
+        return {}
+
+def timed(endpoint):
+    """Mesures des routes asynchrones (les routes Flask sont instrumentées par metrics.instrument_flask)."""
+    @functools.wraps(endpoint)
+    async def wrapper(request):
+        started = time.perf_counter()
+        timings = metrics.start_request()
+        response = await endpoint(request)
+        elapsed = time.perf_counter() - started
+        response.headers["Server-Timing"] = metrics.server_timing(timings, elapsed)
+        metrics.observe_request(request.method, request.url.path, response.status_code, elapsed)
+        return response
+    return wrapper
+
+def queue_full_response(error):
+    return JSONResponse(error.to_dict(), status_code=429, headers={"Retry-After": str(error.retry_after)})
+
+def job_accepted_response(job):
+    return JSONResponse({"job_id": job.id, "status": job.status, "position": llm_queue.position(job)}, status_code=202)
+
+async def generate(request):
+    data = await read_json(request)
+    user_query = data.get("query")
+    mode = data.get("mode", "editor")
+    logger.debug("Requête reçue (Mode: %s, async): %s", mode, user_query)
+    if not user_query:
+        return JSONResponse({"error": "La requête est vide"}, status_code=400)
+
+    try:
+        candidates = candidate_generator.resolve_count(data.get("candidates"))
+        budget = candidate_generator.resolve_budget(data.get("budget"))
+    except (TypeError, ValueError) as e:
+        return JSONResponse({"error": f"Paramètre invalide : {e}"}, status_code=400)
+
+    try:
+        if candidates > 1:
+            # Multi-candidats : un job de la file (models/candidates.py), attendu sans bloquer la boucle
+            job, llm_res = await asyncio.to_thread(candidate_generator.submit, user_query, flask_module.db_manager, mode, candidates, budget)
+            if job is not None:
+                if data.get("async"):
+                    return job_accepted_response(job)
+                try:
+                    llm_res = await async_llm.wait(job)
+                except asyncio.TimeoutError:
+                    llm_res = "Error: Délai d'attente de la file IA dépassé"
+        elif data.get("async"):
+            job, llm_res = await asyncio.to_thread(llm.submit_generation, user_query, mode)
+            if job is not None:
+                return job_accepted_response(job)
+        else:
+            llm_res = await async_llm.generate_sql(user_query, mode=mode)
+    except QueueFullError as e:
+        return queue_full_response(e)
+
+    return JSONResponse(generation_response(llm_res))
+
+async def generate_stream(request):
+    data = await read_json(request)
+    user_query = data.get("query")
+    mode = data.get("mode", "editor")
+    logger.debug("Requête streaming reçue (Mode: %s, async): %s", mode, user_query)
+    if not user_query:
+        return JSONResponse({"error": "La requête est vide"}, status_code=400)
+
+    async def generate_events():
+        async for event in async_llm.generate_sql_stream(user_query, mode=mode):
+            if event["event"] == "done":
+                event["sql"] = format_generated_sql(event["sql"])
+            yield f"event: {event['event']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        generate_events(),
+        media_type="text/event-stream",
+        headers={"X-Accel-Buffering": "no", "Cache-Control": "no-cache"}
+    )
+
+async def fix_sql(request):
+    data = await read_json(request)
+    sql = data.get("sql", "").strip()
+    error = data.get("error", "").strip()
+    if not sql or not error:
+        return JSONResponse({"error": "SQL et erreur requis"}, status_code=400)
+
+    local_fix = apply_local_rules(sql, error)
+    if local_fix:
+        fixed_sql, explanation = local_fix
+        return JSONResponse({"fixed_sql": fixed_sql, "explanation": explanation})
+
+    try:
+        job = await asyncio.to_thread(submit_fix, sql, error)
+        if data.get("async"):
+            return job_accepted_response(job)
+        return JSONResponse(await async_llm.wait(job))
+    except QueueFullError as e:
+        return queue_full_response(e)
+    except Exception as e:
+        logger.error("Erreur IA: %s", e)
+        return JSONResponse({"error": f"Erreur technique: {str(e)}"}, status_code=500)
+
+async def llm_stats(request):
+    return JSONResponse(llm_queue.get_stats())
+
+class DisconnectWatcher:
+    """
+    a2wsgi ne lit plus `receive` une fois le corps de la requête consommé : ce middleware le lit à sa place
+    et lève l'évènement du registre (en-tête X-Request-Token, lu par app.disconnect_probe) sur http.disconnect.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        token, event = query_registry.watch_request()
+        # Un jeton envoyé par le client est ignoré
+        headers = [(name, value) for name, value in scope["headers"] if name != b"x-request-token"]
+        headers.append((b"x-request-token", token.encode("ascii")))
+        messages = asyncio.Queue()
+
+        async def pump():
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    event.set()
+                await messages.put(message)
+                if message["type"] == "http.disconnect":
+                    return
+
+        task = asyncio.create_task(pump())
+        try:
+            await self.app(dict(scope, headers=headers), messages.get, send)
+        finally:
+            task.cancel()
+            query_registry.forget_request(token)
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    yield
+    await async_llm.aclose()
+
+app = Starlette(
+    routes=[
+        Route("/api/generate", timed(generate), methods=["POST"]),
+        Route("/api/generate/stream", timed(generate_stream), methods=["POST"]),
+        Route("/api/fix_sql", timed(fix_sql), methods=["POST"]),
+        Route("/api/llm/stats", timed(llm_stats), methods=["GET"]),
+        Mount("/", app=DisconnectWatcher(WSGIMiddleware(flask_app, workers=ASGI_WSGI_THREADS)))
+    ],
+    lifespan=lifespan
+)
@@ -0,0 +1,244 @@
+"""
+Doublures locales pour les mesures de charge (benchmarks/load.py) : serveur Ollama simulé et pool Oracle synthétique.
+
+FakeOllama répond sur /api/generate (streaming ou non) avec des réponses préparées, à raison de
+`token_latency` secondes par jeton. FakeDBManager est un DBManager dont seul le pool est remplacé : execute_query,
+open_stream, fetch_page, le plafond de lignes et le suivi des requêtes restent ceux de db/connection.py.
+"""
+import datetime
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db.connection import DBManager
+
+GENERATED_SQL = """-- Explication: Les 10 clients au plus gros chiffre d'affaires
+SELECT C.NOM, C.PRENOM, SUM(O.MONTANT_TOTAL) AS TOTAL
+FROM CLIENTS C
+JOIN COMMANDES O ON O.CLIENT_ID = C.CLIENT_ID
+WHERE O.STATUT = 'LIVRÉ'
+GROUP BY C.NOM, C.PRENOM
+ORDER BY TOTAL DESC
+FETCH FIRST 10 ROWS ONLY"""
+
+FIXED_SQL = """SELECT C.NOM, COUNT(*) AS NB_COMMANDES
+FROM CLIENTS C
+JOIN COMMANDES O ON O.CLIENT_ID = C.CLIENT_ID
+GROUP BY C.NOM"""
+
+def split_tokens(text, size=4):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+class FakeOllama:
+    """Serveur HTTP local imitant /api/generate d'Ollama (un thread par connexion)."""
+
+    def __init__(self, token_latency=0.005, first_token_latency=0.05, responses=None):
+        self.token_latency = token_latency
+        self.first_token_latency = first_token_latency
+        # Réponse choisie selon le prompt : correction (/api/fix_sql) ou génération
+        self.responses = responses or {"fix": FIXED_SQL, "generate": GENERATED_SQL}
+        self.requests = 0
+        self._lock = threading.Lock()
+        self.server = None
+
+    def response_for(self, payload):
+        if "Fix the query" in payload.get("prompt", ""):
+            return self.responses["fix"]
+        return self.responses["generate"]
+
+    def start(self, port=0):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def send_body(self, body, content_type="application/json"):
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def send_chunk(self, data):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+
+            def do_GET(self):
+                # /api/tags : le modèle configuré est toujours "présent"
+                self.send_body(json.dumps({"models": [{"name": "sqlcoder:7b"}]}).encode())
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                with fake._lock:
+                    fake.requests += 1
+                tokens = split_tokens(fake.response_for(payload)) if payload.get("prompt") else []
+                time.sleep(fake.first_token_latency)
+                if not payload.get("stream", True):
+                    time.sleep(fake.token_latency * len(tokens))
+                    self.send_body(json.dumps({"response": "".join(tokens), "done": True, "context": [1, 2, 3]}).encode())
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    for token in tokens:
+                        time.sleep(fake.token_latency)
+                        self.send_chunk((json.dumps({"response": token, "done": False}) + "\n").encode())
+                    self.send_chunk((json.dumps({"response": "", "done": True, "context": [1, 2, 3]}) + "\n").encode())
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="fake-ollama", daemon=True).start()
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+def synthetic_rows(rows, columns, seed=42):
+    """Jeu de lignes typé comme un résultat Oracle : NUMBER entiers et décimaux, VARCHAR2 et DATE, avec des NULL."""
+    rng = random.Random(seed)
+    start = datetime.datetime(2024, 1, 1)
+    villes = [f"Ville {i}" for i in range(50)]
+    makers = [
+        lambda i: i,
+        lambda i: round(rng.uniform(1, 5000), 2),
+        lambda i: rng.choice(villes),
+        lambda i: start + datetime.timedelta(days=rng.randint(0, 700)),
+        lambda i: None if rng.random() < 0.1 else rng.randint(1, 1000),
+        lambda i: f"Libellé {rng.randint(1, 100000)}",
+    ]
+    description = []
+    for c in range(columns):
+        kind = c % len(makers)
+        description.append((f"COL_{c}_{['ID', 'MONTANT', 'VILLE', 'DATE', 'QTE', 'LIBELLE'][kind]}",))
+    data = [tuple(makers[c % len(makers)](i) for c in range(columns)) for i in range(1, rows + 1)]
+    return description, data
+
+class SyntheticCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.arraysize = 100
+        self.prefetchrows = 2
+        self.description = None
+        self.position = 0
+        self.data = []
+
+    def execute(self, sql, parameters=None, **kwargs):
+        self.conn.round_trip()
+        if sql.lstrip().upper().startswith(("SELECT", "WITH", "(")):
+            self.description, self.data = self.conn.pool.result
+        else:
+            self.description, self.data = None, []
+        self.position = 0
+
+    def parse(self, sql):
+        # Description seule, sans lignes ni aller-retour de lecture
+        self.execute(sql)
+        self.data = []
+
+    def fetchmany(self, size=None):
+        size = size or self.arraysize
+        rows = self.data[self.position:self.position + size]
+        self.position += len(rows)
+        # Un aller-retour réseau par paquet au-delà des lignes préchargées
+        if rows and self.position > self.prefetchrows:
+            self.conn.round_trip(fetch=True)
+        return rows
+
+    def fetchall(self):
+        rows = self.data[self.position:]
+        self.position = len(self.data)
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def close(self):
+        pass
+
+class SyntheticConnection:
+    def __init__(self, pool):
+        self.pool = pool
+        self.call_timeout = 0
+        self.closed = False
+
+    def round_trip(self, fetch=False):
+        delay = self.pool.fetch_latency if fetch else self.pool.latency
+        if delay:
+            time.sleep(delay)
+
+    def cursor(self):
+        return SyntheticCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def cancel(self):
+        pass
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.pool.release(self)
+
+class SyntheticPool:
+    """Pool borné comme oracledb (attente au-delà de `max` sessions occupées) servant un seul résultat synthétique."""
+
+    def __init__(self, rows=1000, columns=8, latency=0.002, fetch_latency=0.0005, max_sessions=8, wait_timeout=5000):
+        self.result = synthetic_rows(rows, columns)
+        self.latency = latency
+        self.fetch_latency = fetch_latency
+        self.min = 1
+        self.max = max_sessions
+        self.increment = 1
+        self.wait_timeout = wait_timeout
+        self.ping_interval = 60
+        self.timeout = 300
+        self.opened = max_sessions
+        self.busy = 0
+        self._slots = threading.BoundedSemaphore(max_sessions)
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self._slots.acquire(timeout=self.wait_timeout / 1000):
+            raise RuntimeError("ORA-24459: délai d'attente dépassé pour obtenir une session du pool")
+        with self._lock:
+            self.busy += 1
+        return SyntheticConnection(self)
+
+    def release(self, conn):
+        with self._lock:
+            self.busy -= 1
+        self._slots.release()
+
+    def drop(self, conn):
+        conn.close()
+
+    def close(self, force=False):
+        pass
+
+class FakeDBManager(DBManager):
+    """DBManager sur pool synthétique : `rows` lignes de `columns` colonnes pour tout SELECT."""
+
+    def __init__(self, rows=1000, columns=8, latency=0.002, fetch_latency=0.0005):
+        super().__init__()
+        self.pool = SyntheticPool(rows, columns, latency, fetch_latency, self.pool_max, self.pool_wait_timeout)
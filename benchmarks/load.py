@@ -0,0 +1,232 @@
+"""
+Mesures de charge hors ligne des routes principales : Ollama et Oracle remplacés par benchmarks/fakes.py.
+
+    python benchmarks/load.py [--scenarios generate,execute] [--requests 200] [--concurrency 8]
+                              [--rows 1000] [--columns 8] [--token-latency 0.005] [--db-latency 0.002]
+                              [--output resultats.json] [--compare precedent.json]
+
+L'application Flask tourne dans ce processus derrière un serveur HTTP multi-thread ; chaque scénario envoie
+`--requests` requêtes avec `--concurrency` clients. Résultat JSON par scénario : latences p50/p95/p99 (ms),
+débit (req/s), codes HTTP et pic de mémoire résidente (RSS) du processus. `--compare` affiche l'écart avec un
+résultat précédent (même paramètres) pour repérer une régression d'une version à l'autre.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import requests
+
+from benchmarks.fakes import FakeOllama, FakeDBManager
+
+def scenario_generate(i):
+    # Questions toutes différentes : pas de fusion dans la file ni de cache de génération
+    return "POST", "/api/generate", {"query": f"Top 10 des clients par chiffre d'affaires, variante {i}"}
+
+def scenario_execute(i):
+    return "POST", "/api/execute", {"sql": f"SELECT * FROM CLIENTS WHERE {i} = {i}"}
+
+def scenario_execute_stream(i):
+    return "POST", "/api/execute", {"sql": f"SELECT * FROM CLIENTS WHERE {i} = {i}", "stream": True}
+
+def scenario_fix_sql(i):
+    # Erreur hors des règles locales (db/sql_fixer.py) : passage par le modèle
+    return "POST", "/api/fix_sql", {"sql": f"SELECT NOM, COUNT(*) FROM CLIENTS WHERE {i} = {i}", "error": "ORA-00600: internal error code"}
+
+def scenario_history_add(i):
+    return "POST", "/api/history", {"query": f"question {i}", "sql": f"SELECT {i} FROM DUAL"}
+
+def scenario_history_list(i):
+    return "GET", "/api/history?limit=50", None
+
+def scenario_history_search(i):
+    return "GET", f"/api/history?limit=20&q=question {i % 100}", None
+
+SCENARIOS = {
+    "generate": scenario_generate,
+    "execute": scenario_execute,
+    "execute_stream": scenario_execute_stream,
+    "fix_sql": scenario_fix_sql,
+    "history_add": scenario_history_add,
+    "history_list": scenario_history_list,
+    "history_search": scenario_history_search,
+}
+
+def percentile(values, p):
+    """Percentile par rang le plus proche sur des valeurs triées."""
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, int(round(p / 100 * len(values) + 0.5)) - 1))
+    return values[index]
+
+def peak_rss_mb():
+    # ru_maxrss : kilo-octets sous Linux, octets sous macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
+    except OSError:
+        return None
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+def start_server(app):
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server("127.0.0.1", 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, name="bench-server", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+def run_scenario(base_url, build, total, concurrency, warmup):
+    local = threading.local()
+
+    def send(i):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        method, path, body = build(i)
+        started = time.perf_counter()
+        try:
+            response = session.request(method, base_url + path, json=body, timeout=300)
+            # Corps lu en entier (flux NDJSON compris) : la latence couvre toute la réponse
+            response.content
+            status = response.status_code
+        except requests.RequestException:
+            status = "exception"
+        return (time.perf_counter() - started) * 1000, status
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, range(-warmup, 0)))
+        rss_before = current_rss_mb()
+        started = time.perf_counter()
+        outcomes = list(pool.map(send, range(total)))
+        elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, _ in outcomes)
+    statuses = {}
+    for _, status in outcomes:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": sum(count for status, count in statuses.items() if not status.startswith("2")),
+        "status_codes": statuses,
+        "throughput_rps": round(total / elapsed, 1),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 2),
+            "p95": round(percentile(latencies, 95), 2),
+            "p99": round(percentile(latencies, 99), 2),
+            "max": round(latencies[-1], 2),
+            "mean": round(sum(latencies) / len(latencies), 2)
+        },
+        "rss_mb": {"before": rss_before, "after": current_rss_mb(), "peak": peak_rss_mb()}
+    }
+
+def compare(previous, current):
+    """Écart relatif (%) des latences et du débit, scénario par scénario."""
+    print(f"{'scénario':<16} {'p50':>10} {'p95':>10} {'p99':>10} {'débit':>10} {'RSS pic':>10}")
+    for name, result in current["scenarios"].items():
+        old = previous.get("scenarios", {}).get(name)
+        if old is None:
+            continue
+        def delta(new, before):
+            return f"{(new - before) / before * 100:+.1f}%" if before else "n/a"
+        print(f"{name:<16} "
+              f"{delta(result['latency_ms']['p50'], old['latency_ms']['p50']):>10} "
+              f"{delta(result['latency_ms']['p95'], old['latency_ms']['p95']):>10} "
+              f"{delta(result['latency_ms']['p99'], old['latency_ms']['p99']):>10} "
+              f"{delta(result['throughput_rps'], old['throughput_rps']):>10} "
+              f"{delta(result['rss_mb']['peak'], old['rss_mb']['peak']):>10}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Mesures de charge hors ligne (Ollama et Oracle simulés).")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="liste séparée par des virgules")
+    parser.add_argument("--requests", type=int, default=200, help="requêtes mesurées par scénario")
+    parser.add_argument("--concurrency", type=int, default=8, help="clients simultanés")
+    parser.add_argument("--warmup", type=int, default=10, help="requêtes non mesurées avant chaque scénario")
+    parser.add_argument("--rows", type=int, default=1000, help="lignes du résultat synthétique")
+    parser.add_argument("--columns", type=int, default=8, help="colonnes du résultat synthétique")
+    parser.add_argument("--db-latency", type=float, default=0.002, help="aller-retour Oracle simulé (s)")
+    parser.add_argument("--token-latency", type=float, default=0.005, help="délai par jeton du modèle simulé (s)")
+    parser.add_argument("--first-token-latency", type=float, default=0.05, help="délai avant le premier jeton (s)")
+    parser.add_argument("--output", help="fichier JSON de sortie (sinon sortie standard)")
+    parser.add_argument("--compare", help="résultat JSON précédent à comparer")
+    parser.add_argument("--verbose", action="store_true", help="garder les traces DEBUG de l'application")
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"scénarios inconnus : {', '.join(unknown)} (disponibles : {', '.join(SCENARIOS)})")
+
+    ollama = FakeOllama(args.token_latency, args.first_token_latency)
+    workdir = tempfile.mkdtemp(prefix="sqlia-bench-")
+    # Configuration fixée avant l'import de l'application (lue à l'import des singletons) ; .env ne la surcharge pas
+    os.environ.update({
+        "OLLAMA_BASE_URL": ollama.start(),
+        "OLLAMA_WARMUP": "0",
+        "SCHEMA_SOURCE": "markdown",
+        "HISTORY_DB": os.path.join(workdir, "history.sqlite"),
+        "GENERATION_CACHE_ENABLED": "0",
+        "QUERY_CACHE_ENABLED": "0",
+        "EXPLAIN_MODE": "off",
+        "LOG_LEVEL": "DEBUG" if args.verbose else "WARNING",
+    })
+    os.chdir(ROOT)
+
+    import app as app_module
+    app_module.db_manager = FakeDBManager(args.rows, args.columns, args.db_latency, args.db_latency / 4)
+    server, base_url = start_server(app_module.app)
+    results = {}
+    try:
+        for name in names:
+            results[name] = run_scenario(base_url, SCENARIOS[name], args.requests, args.concurrency, args.warmup)
+            print(f"{name}: p50={results[name]['latency_ms']['p50']} ms, "
+                  f"{results[name]['throughput_rps']} req/s", file=sys.stderr)
+    finally:
+        server.shutdown()
+        ollama.stop()
+
+    report = {
+        "version": git_revision(),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {key: value for key, value in vars(args).items() if key not in ("output", "compare", "verbose", "scenarios")},
+        "scenarios": results
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(json.load(f), report)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Contrôle de sécurité SQL : ancienne boucle de regex contre le classifieur en une passe (db/sql_safety.py).
+
+    python benchmarks/sql_safety.py [--repeat 20]
+
+Mesure le temps par requête sur des SELECT de taille croissante, avec et sans cache, puis vérifie les
+cas que l'ancienne vérification classait mal (mots interdits dans des littéraux, MERGE, PL/SQL...).
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db.sql_safety import SQLSafety
+
+LEGACY_KEYWORDS = ["DROP", "DELETE", "TRUNCATE", "UPDATE", "ALTER", "CREATE", "GRANT", "REVOKE", "INSERT"]
+
+def legacy_check(sql):
+    """Vérification remplacée (app.check_sql_security avant db/sql_safety.py)."""
+    sql_upper = sql.upper()
+    for kw in LEGACY_KEYWORDS:
+        if re.search(r'\b' + kw + r'\b', sql_upper):
+            return f"Sécurité : L'instruction '{kw}' n'est pas autorisée dans cet éditeur."
+    return None
+
+def build_select(columns):
+    """SELECT généré de grande taille : expressions CASE, littéraux et commentaires."""
+    items = [
+        f"CASE WHEN c.ville = 'Ville {i}' THEN SUM(d.prix_ligne) /* colonne {i} */ ELSE 0 END AS col_{i}"
+        for i in range(columns)
+    ]
+    return (
+        "SELECT " + ",\n       ".join(items) +
+        "\nFROM clients c JOIN commandes o ON o.client_id = c.client_id"
+        "\nJOIN details_commandes d ON d.commande_id = o.commande_id"
+        "\nWHERE o.statut IN ('LIVRÉ', 'EN COURS') GROUP BY c.ville"
+    )
+
+CASES = [
+    ("SELECT * FROM commandes WHERE statut = 'UPDATE'", True),
+    ("SELECT update_date, \"DELETE\" FROM t -- DROP TABLE t", True),
+    ("SELECT q'[l'état ; DELETE]' FROM dual", True),
+    ("WITH a AS (SELECT 1 x FROM dual) SELECT * FROM a", True),
+    ("MERGE INTO t USING s ON (1 = 1) WHEN MATCHED THEN UPDATE SET a = 1", False),
+    ("BEGIN EXECUTE IMMEDIATE 'DROP TABLE t'; END;", False),
+    ("DECLARE x NUMBER; BEGIN NULL; END;", False),
+    ("WITH FUNCTION f RETURN NUMBER IS BEGIN RETURN 1; END; SELECT f FROM dual", False),
+    ("SELECT * FROM commandes FOR UPDATE", False),
+    ("SELECT 1 FROM dual; DELETE FROM t", False),
+]
+
+def timed(fn, sql, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(sql)
+    return (time.perf_counter() - start) / repeat * 1000
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'taille':>10} {'regex (ms)':>12} {'une passe (ms)':>15} {'cache (ms)':>12}")
+    for columns in (10, 100, 1000, 5000):
+        sql = build_select(columns)
+        safety = SQLSafety()
+        legacy = timed(legacy_check, sql, args.repeat)
+        uncached = timed(safety.classify, sql, max(1, args.repeat // 4))
+        safety.check(sql)
+        cached = timed(safety.check, sql, args.repeat)
+        print(f"{len(sql):>10} {legacy:>12.3f} {uncached:>15.3f} {cached:>12.3f}")
+
+    safety = SQLSafety()
+    print()
+    print(f"{'requête':<60} {'attendu':>8} {'regex':>8} {'une passe':>10}")
+    for sql, allowed in CASES:
+        label = lambda error: "accepté" if error is None else "refusé"
+        print(f"{sql[:60]:<60} {label(None if allowed else ''):>8} {label(legacy_check(sql)):>8} {label(safety.check(sql)):>10}")
+
+if __name__ == "__main__":
+    main()
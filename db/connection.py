@@ -1,5 +1,15 @@
 import oracledb
 import os
+import threading
+import base64
+import hashlib
+import json
+import logging
+import time
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
 
 class DBManager:
     def __init__(self):
@@ -7,43 +17,259 @@ class DBManager:
         self.user = os.getenv("ORACLE_USER", "appuser")
         self.password = os.getenv("ORACLE_PASSWORD", "ChangeMeApp1!")
         self.dsn = os.getenv("ORACLE_DSN", "192.168.1.14:1521/FREEPDB1")
+
+        # Paramètres du pool de sessions
+        self.pool_min = int(os.getenv("ORACLE_POOL_MIN", "1"))
+        self.pool_max = int(os.getenv("ORACLE_POOL_MAX", "8"))
+        self.pool_increment = int(os.getenv("ORACLE_POOL_INCREMENT", "1"))
+        # Délai max (ms) pour obtenir une session quand le pool est plein
+        self.pool_wait_timeout = int(os.getenv("ORACLE_POOL_WAIT_TIMEOUT", "5000"))
+        # Une session inactive depuis plus de N secondes est "pingée" avant d'être rendue
+        self.pool_ping_interval = int(os.getenv("ORACLE_POOL_PING_INTERVAL", "60"))
+        # Fermeture des sessions inactives au-delà du minimum (secondes)
+        self.pool_idle_timeout = int(os.getenv("ORACLE_POOL_IDLE_TIMEOUT", "300"))
+
+        # Lecture des résultats : taille des paquets réseau et plafond de lignes renvoyées
+        self.fetch_arraysize = int(os.getenv("ORACLE_FETCH_ARRAYSIZE", "1000"))
+        self.max_rows = int(os.getenv("ORACLE_MAX_ROWS", "100000"))
+
         self.pool = None
+        self._pool_lock = threading.Lock()
+
+    def get_pool(self):
+        """Crée le pool de sessions à la première utilisation (la base peut être absente au démarrage)."""
+        if self.pool is not None:
+            return self.pool
+        with self._pool_lock:
+            if self.pool is None:
+                self.pool = oracledb.create_pool(
+                    user=self.user,
+                    password=self.password,
+                    dsn=self.dsn,
+                    min=self.pool_min,
+                    max=self.pool_max,
+                    increment=self.pool_increment,
+                    getmode=oracledb.POOL_GETMODE_TIMEDWAIT,
+                    wait_timeout=self.pool_wait_timeout,
+                    ping_interval=self.pool_ping_interval,
+                    timeout=self.pool_idle_timeout
+                )
+        return self.pool
 
     def get_connection(self):
         try:
-            # On utilise le driver thin par défaut
-            conn = oracledb.connect(
-                user=self.user,
-                password=self.password,
-                dsn=self.dsn
-            )
+            # Session empruntée au pool : conn.close() la rend au pool au lieu de la fermer
+            with metrics.phase("db_connect"):
+                conn = self.get_pool().acquire()
+            # Pas de délai hérité d'une requête utilisateur précédente sur cette session
+            conn.call_timeout = 0
             return conn
         except Exception as e:
-            print(f"Erreur de connexion Oracle (DSN={self.dsn}, User={self.user}) : {e}")
+            logger.error("Erreur de connexion Oracle (DSN=%s, User=%s) : %s", self.dsn, self.user, e)
             return None
 
-    def execute_query(self, sql):
+    def get_pool_stats(self):
+        if self.pool is None:
+            return {"status": "not_initialized", "min": self.pool_min, "max": self.pool_max,
+                    "increment": self.pool_increment}
+        return {
+            "status": "open",
+            "min": self.pool.min,
+            "max": self.pool.max,
+            "increment": self.pool.increment,
+            "opened": self.pool.opened,
+            "busy": self.pool.busy,
+            "available": self.pool.opened - self.pool.busy,
+            "wait_timeout_ms": self.pool.wait_timeout,
+            "ping_interval_s": self.pool.ping_interval,
+            "idle_timeout_s": self.pool.timeout
+        }
+
+    def close_pool(self):
+        with self._pool_lock:
+            if self.pool is not None:
+                self.pool.close(force=True)
+                self.pool = None
+
+    def _release(self, conn, tracker=None, error=None):
+        """Rend la session au pool ; une session interrompue par un délai dépassé est abandonnée."""
+        if tracker is not None:
+            tracker.detach()
+        if error is not None and ("DPI-1067" in str(error) or "ORA-03156" in str(error)):
+            try:
+                self.get_pool().drop(conn)
+                return
+            except Exception:
+                pass
+        conn.close()
+
+    def _prepare_cursor(self, conn, arraysize=None):
+        cursor = conn.cursor()
+        cursor.arraysize = arraysize or self.fetch_arraysize
+        # Les premières lignes reviennent dans le même aller-retour que l'exécution
+        cursor.prefetchrows = cursor.arraysize + 1
+        return cursor
+
+    def execute_query(self, sql, tracker=None):
+        """`tracker` (RunningQuery, db/query_registry.py) : délai d'appel et annulation de la requête."""
         conn = self.get_connection()
         if not conn:
+            if tracker is not None:
+                tracker.detach()
             return None, "Erreur de connexion à la base de données."
         
+        error = None
         try:
-            cursor = conn.cursor()
-            cursor.execute(sql)
+            if tracker is not None:
+                tracker.attach(conn)
+            cursor = self._prepare_cursor(conn)
+            with metrics.phase("db_execute"):
+                cursor.execute(sql)
             
-            # Si c'est un SELECT, on récupère les colonnes et les données
-            if sql.strip().upper().startswith("SELECT"):
+            # Si la requête renvoie des lignes (SELECT, WITH...), on récupère les colonnes et les données
+            if cursor.description:
                 columns = [col[0] for col in cursor.description]
-                data = cursor.fetchall()
-                return {"columns": columns, "data": data}, None
+                # Plafond dur : on lit une ligne de plus pour savoir si le résultat est tronqué
+                with metrics.phase("db_fetch"):
+                    data = cursor.fetchmany(self.max_rows + 1)
+                truncated = len(data) > self.max_rows
+                if truncated:
+                    data = data[:self.max_rows]
+                return {"columns": columns, "data": data, "truncated": truncated}, None
             else:
                 conn.commit()
                 return {"message": "Requête exécutée avec succès (DML/DDL)."}, None
                 
         except Exception as e:
-            return None, str(e)
+            error = e
+            return None, tracker.error_message(e) if tracker is not None else str(e)
         finally:
             if conn:
-                conn.close()
+                self._release(conn, tracker, error)
+
+    def open_stream(self, sql, chunk_size=None, max_rows=None, tracker=None, row_limit=None):
+        """
+        Exécute un SELECT et renvoie un QueryStream qui lit les lignes par paquets.
+        `row_limit` remplace le plafond ORACLE_MAX_ROWS (exports).
+        """
+        conn = self.get_connection()
+        if not conn:
+            if tracker is not None:
+                tracker.detach()
+            return None, "Erreur de connexion à la base de données."
+        try:
+            if tracker is not None:
+                tracker.attach(conn)
+            cursor = self._prepare_cursor(conn, chunk_size)
+            with metrics.phase("db_execute"):
+                cursor.execute(sql)
+            if not cursor.description:
+                conn.rollback()
+                self._release(conn, tracker)
+                return None, "Le mode streaming est réservé aux requêtes SELECT."
+            limit = row_limit or self.max_rows
+            return QueryStream(conn, cursor, min(max_rows or limit, limit), self, tracker), None
+        except Exception as e:
+            self._release(conn, tracker, e)
+            return None, tracker.error_message(e) if tracker is not None else str(e)
+
+    def fetch_page(self, sql, offset, page_size, tracker=None):
+        """Pagination côté serveur : renvoie une page de résultats et indique s'il en reste."""
+        page_size = max(1, min(int(page_size), self.max_rows))
+        offset = max(0, int(offset))
+
+        conn = self.get_connection()
+        if not conn:
+            if tracker is not None:
+                tracker.detach()
+            return None, "Erreur de connexion à la base de données."
+        error = None
+        try:
+            if tracker is not None:
+                tracker.attach(conn)
+            cursor = self._prepare_cursor(conn, page_size + 1)
+            with metrics.phase("db_execute"):
+                # Noms réels lus sans exécuter ; colonnes renommées C1..Cn dans la requête paginée, sinon les noms
+                # en double d'une jointure (SELECT * sur deux tables) lèvent ORA-00918
+                cursor.parse(sql)
+                if not cursor.description:
+                    return None, "La pagination est réservée aux requêtes SELECT."
+                columns = [col[0] for col in cursor.description]
+                aliases = ", ".join(f"C{i + 1}" for i in range(len(columns)))
+                paged_sql = (f"WITH src ({aliases}) AS ({sql}) "
+                             f"SELECT * FROM src OFFSET :page_offset ROWS FETCH NEXT :page_rows ROWS ONLY")
+                cursor.execute(paged_sql, page_offset=offset, page_rows=page_size + 1)
+            with metrics.phase("db_fetch"):
+                data = cursor.fetchall()
+            has_more = len(data) > page_size
+            return {"columns": columns, "data": data[:page_size], "offset": offset, "has_more": has_more}, None
+        except Exception as e:
+            error = e
+            return None, tracker.error_message(e) if tracker is not None else str(e)
+        finally:
+            self._release(conn, tracker, error)
+
+class QueryStream:
+    """Curseur ouvert dont les lignes sont consommées par paquets (mémoire constante)."""
+
+    def __init__(self, conn, cursor, max_rows, db_manager=None, tracker=None):
+        self.conn = conn
+        self.cursor = cursor
+        self.max_rows = max_rows
+        self.db_manager = db_manager
+        self.tracker = tracker
+        self.columns = [col[0] for col in cursor.description]
+        self.row_count = 0
+        self.truncated = False
+        self.error = None
+
+    def chunks(self):
+        # Temps de lecture cumulé sur les paquets (hors temps passé chez l'appelant entre deux paquets)
+        fetch_time = 0.0
+        try:
+            while self.row_count < self.max_rows:
+                started = time.perf_counter()
+                rows = self.cursor.fetchmany(min(self.cursor.arraysize, self.max_rows - self.row_count))
+                fetch_time += time.perf_counter() - started
+                if not rows:
+                    return
+                self.row_count += len(rows)
+                yield rows
+            # Plafond atteint : on regarde s'il restait des lignes
+            self.truncated = bool(self.cursor.fetchmany(1))
+        except Exception as e:
+            self.error = e
+            raise
+        finally:
+            metrics.record("db_fetch", fetch_time)
+            self.close()
+
+    def error_message(self, error):
+        return self.tracker.error_message(error) if self.tracker is not None else str(error)
+
+    def close(self):
+        if self.conn is not None:
+            if self.db_manager is not None:
+                self.db_manager._release(self.conn, self.tracker, self.error)
+            else:
+                self.conn.close()
+            self.conn = None
+
+def encode_page_token(sql, offset, page_size):
+    """Jeton opaque de pagination, lié au texte SQL pour refuser un jeton rejoué sur une autre requête."""
+    payload = {"o": offset, "n": page_size, "h": hashlib.sha1(sql.encode("utf-8")).hexdigest()[:12]}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).decode("ascii")
+
+def decode_page_token(sql, token):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+        if payload["h"] != hashlib.sha1(sql.encode("utf-8")).hexdigest()[:12]:
+            return None
+        offset, page_size = int(payload["o"]), int(payload["n"])
+        if offset < 0 or page_size < 1:
+            return None
+        return offset, page_size
+    except Exception:
+        return None
 
 db_manager = DBManager()
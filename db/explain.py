@@ -0,0 +1,197 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from db.sql_utils import normalize_sql
+
+PLAN_SQL = """
+    SELECT id, parent_id, depth, operation, options, object_owner, object_name, cost, cardinality, bytes
+    FROM plan_table
+    WHERE statement_id = :statement_id
+    ORDER BY id
+"""
+
+# Opérations qui lisent un segment entier
+FULL_SCAN_OPERATIONS = {
+    ("TABLE ACCESS", "FULL"), ("MAT_VIEW ACCESS", "FULL"), ("INDEX", "FULL SCAN"), ("INDEX", "FAST FULL SCAN")
+}
+
+class ExplainGate:
+    """
+    Contrôle avant exécution : EXPLAIN PLAN, lecture de PLAN_TABLE (coût, cardinalité estimée, full scans,
+    produits cartésiens) et comparaison aux seuils. EXPLAIN_MODE : off (défaut), warn (plan renvoyé avec
+    les avertissements) ou reject (requête refusée au-delà des seuils). Les plans sont mis en cache
+    par texte SQL normalisé.
+    """
+
+    def __init__(self, mode=None, max_cost=None, max_rows=None, full_scan_rows=None, cache_size=None, ttl=None):
+        self.mode = mode or os.getenv("EXPLAIN_MODE", "off")
+        # 0 = pas de seuil
+        self.max_cost = max_cost if max_cost is not None else int(os.getenv("EXPLAIN_MAX_COST", "100000"))
+        self.max_rows = max_rows if max_rows is not None else int(os.getenv("EXPLAIN_MAX_ROWS", "10000000"))
+        # Un full scan n'est signalé qu'au-delà de ce nombre de lignes estimées
+        self.full_scan_rows = full_scan_rows if full_scan_rows is not None else int(os.getenv("EXPLAIN_FULL_SCAN_ROWS", "100000"))
+        self.cache_size = cache_size or int(os.getenv("EXPLAIN_CACHE_SIZE", "512"))
+        self.ttl = ttl or int(os.getenv("EXPLAIN_CACHE_TTL", "600"))
+
+        self._cache = OrderedDict()  # SQL normalisé -> (expiration, analyse)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.warned = 0
+        self.rejected = 0
+
+    def enabled(self):
+        return self.mode in ("warn", "reject")
+
+    def _cache_get(self, key):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                if entry[0] > time.time():
+                    self._cache.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._cache[key]
+            self.misses += 1
+        return None
+
+    def _cache_set(self, key, analysis):
+        with self._lock:
+            self._cache[key] = (time.time() + self.ttl, analysis)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def explain(self, db_manager, sql):
+        """Lignes de PLAN_TABLE pour la requête. Renvoie (lignes, erreur)."""
+        conn = db_manager.get_connection()
+        if not conn:
+            return None, "Erreur de connexion à la base de données."
+        # STATEMENT_ID n'accepte pas de variable de liaison : identifiant généré, jamais issu de la requête
+        statement_id = uuid.uuid4().hex[:30]
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"EXPLAIN PLAN SET STATEMENT_ID = '{statement_id}' FOR {sql}")
+            cursor.execute(PLAN_SQL, statement_id=statement_id)
+            columns = [col[0].lower() for col in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()], None
+        except Exception as e:
+            return None, str(e)
+        finally:
+            # Les lignes insérées dans PLAN_TABLE ne sont pas conservées
+            try:
+                conn.rollback()
+            finally:
+                conn.close()
+
+    def analyze(self, plan_rows):
+        """Coût, cardinalité et points d'attention à partir des lignes du plan."""
+        root = plan_rows[0] if plan_rows else {}
+        issues = []
+        full_scans = []
+        cartesian = False
+        plan = []
+        for row in plan_rows:
+            operation = " ".join(part for part in (row.get("operation"), row.get("options")) if part)
+            plan.append({
+                "id": row.get("id"),
+                "parent_id": row.get("parent_id"),
+                "depth": row.get("depth"),
+                "operation": operation,
+                "object": row.get("object_name"),
+                "cost": row.get("cost"),
+                "rows": row.get("cardinality"),
+                "bytes": row.get("bytes")
+            })
+            if (row.get("operation"), row.get("options")) in FULL_SCAN_OPERATIONS:
+                full_scans.append({"object": row.get("object_name"), "rows": row.get("cardinality")})
+            if row.get("options") == "CARTESIAN":
+                cartesian = True
+
+        cost = root.get("cost")
+        cardinality = root.get("cardinality")
+        if self.max_cost and cost is not None and cost > self.max_cost:
+            issues.append({"code": "cost", "blocking": True,
+                           "message": f"Coût estimé {cost} supérieur au seuil ({self.max_cost})."})
+        if self.max_rows and cardinality is not None and cardinality > self.max_rows:
+            issues.append({"code": "rows", "blocking": True,
+                           "message": f"{cardinality} lignes estimées, au-delà du seuil ({self.max_rows})."})
+        if cartesian:
+            issues.append({"code": "cartesian", "blocking": True,
+                           "message": "Produit cartésien : une condition de jointure manque probablement."})
+        for scan in full_scans:
+            if scan["rows"] is not None and scan["rows"] >= self.full_scan_rows:
+                issues.append({"code": "full_scan", "blocking": False,
+                               "message": f"Lecture complète de {scan['object']} (~{scan['rows']} lignes)."})
+
+        return {
+            "cost": cost,
+            "cardinality": cardinality,
+            "bytes": root.get("bytes"),
+            "full_scans": full_scans,
+            "cartesian": cartesian,
+            "issues": issues,
+            "plan": plan
+        }
+
+    def plan(self, db_manager, sql):
+        """Analyse du plan, en cache par texte SQL normalisé (sans verdict). Renvoie (analyse, erreur)."""
+        key = normalize_sql(sql)
+        analysis = self._cache_get(key)
+        if analysis is not None:
+            return dict(analysis, cached=True), None
+        plan_rows, error = self.explain(db_manager, sql)
+        if error:
+            return None, error
+        analysis = self.analyze(plan_rows)
+        self._cache_set(key, analysis)
+        return dict(analysis, cached=False), None
+
+    def check(self, db_manager, sql):
+        """Analyse (en cache si possible) et verdict ok / warn / reject. Renvoie (rapport, erreur)."""
+        analysis, error = self.plan(db_manager, sql)
+        if error:
+            return None, error
+
+        blocking = [issue["message"] for issue in analysis["issues"] if issue["blocking"]]
+        if blocking and self.mode == "reject":
+            verdict = "reject"
+        elif analysis["issues"]:
+            verdict = "warn"
+        else:
+            verdict = "ok"
+
+        with self._lock:
+            if verdict == "reject":
+                self.rejected += 1
+            elif verdict == "warn":
+                self.warned += 1
+
+        report = dict(analysis, verdict=verdict)
+        if verdict == "reject":
+            report["message"] = "Requête refusée avant exécution : " + " ".join(blocking)
+        return report, None
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "max_cost": self.max_cost,
+                "max_rows": self.max_rows,
+                "full_scan_rows": self.full_scan_rows,
+                "cache_entries": len(self._cache),
+                "cache_size": self.cache_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "warned": self.warned,
+                "rejected": self.rejected
+            }
+
+explain_gate = ExplainGate()
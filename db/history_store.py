@@ -0,0 +1,166 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+class HistoryStore:
+    """
+    Historique des requêtes en SQLite (WAL) : insertions sans réécriture du fichier, identifiants
+    auto-incrémentés, pagination par curseur sur l'index (user_id, id) et recherche plein texte (FTS5).
+    """
+
+    def __init__(self, db_path=None, legacy_path="db/history.json"):
+        self.db_path = db_path or os.getenv("HISTORY_DB", "db/history.sqlite")
+        self.legacy_path = legacy_path
+        # 0 = pas de limite ; sinon nombre d'entrées conservées par utilisateur
+        self.max_entries = int(os.getenv("HISTORY_MAX_ENTRIES", "0"))
+        self.fts = False
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _ensure_db(self):
+        if self._initialized:
+            return
+        with self._init_lock:
+            if self._initialized:
+                return
+            with self._connect() as conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS history (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        user_id TEXT NOT NULL DEFAULT '',
+                        query TEXT NOT NULL DEFAULT '',
+                        sql TEXT NOT NULL DEFAULT '',
+                        created_at TEXT NOT NULL
+                    )
+                """)
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_history_user_id ON history (user_id, id)")
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_history_user_created ON history (user_id, created_at)")
+                conn.execute("CREATE TABLE IF NOT EXISTS history_meta (key TEXT PRIMARY KEY, value TEXT)")
+                self.fts = self._init_fts(conn)
+                self._migrate_legacy(conn)
+            self._initialized = True
+
+    def _init_fts(self, conn):
+        """Index plein texte synchronisé par triggers ; repli sur LIKE si SQLite est compilé sans FTS5."""
+        try:
+            conn.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS history_fts
+                USING fts5(query, sql, content='history', content_rowid='id', tokenize='unicode61 remove_diacritics 2')
+            """)
+            conn.execute("""
+                CREATE TRIGGER IF NOT EXISTS history_fts_insert AFTER INSERT ON history BEGIN
+                    INSERT INTO history_fts (rowid, query, sql) VALUES (new.id, new.query, new.sql);
+                END
+            """)
+            conn.execute("""
+                CREATE TRIGGER IF NOT EXISTS history_fts_delete AFTER DELETE ON history BEGIN
+                    INSERT INTO history_fts (history_fts, rowid, query, sql) VALUES ('delete', old.id, old.query, old.sql);
+                END
+            """)
+            return True
+        except sqlite3.OperationalError as e:
+            logger.info("FTS5 indisponible, recherche par LIKE (%s)", e)
+            return False
+
+    def _migrate_legacy(self, conn):
+        """Import unique de l'ancien db/history.json (du plus ancien au plus récent)."""
+        # Le marqueur est posé en premier : le verrou d'écriture empêche un autre worker d'importer en parallèle
+        claimed = conn.execute("INSERT OR IGNORE INTO history_meta (key, value) VALUES ('legacy_imported', '0')")
+        if not claimed.rowcount:
+            return
+        items = []
+        if self.legacy_path and os.path.exists(self.legacy_path):
+            try:
+                with open(self.legacy_path, "r", encoding="utf-8") as f:
+                    content = f.read().strip()
+                items = json.loads(content) if content else []
+            except (json.JSONDecodeError, OSError) as e:
+                logger.error("Erreur lecture historique: %s", e)
+        rows = [
+            ("", item.get("query") or "", item.get("sql") or "",
+             item.get("timestamp") or datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            for item in reversed(items) if isinstance(item, dict)
+        ]
+        if rows:
+            conn.executemany("INSERT INTO history (user_id, query, sql, created_at) VALUES (?, ?, ?, ?)", rows)
+            conn.execute("UPDATE history_meta SET value = ? WHERE key = 'legacy_imported'", (str(len(rows)),))
+            logger.info("%d entrées d'historique importées depuis %s", len(rows), self.legacy_path)
+
+    @staticmethod
+    def _to_dict(row):
+        return {"id": row["id"], "query": row["query"], "sql": row["sql"], "timestamp": row["created_at"]}
+
+    @staticmethod
+    def _fts_query(text):
+        # Chaque mot devient un préfixe entre guillemets : pas d'injection de syntaxe FTS5
+        words = re.findall(r'\w+', text, flags=re.UNICODE)
+        return " ".join(f'"{word}"*' for word in words)
+
+    def add(self, query, sql, user_id=""):
+        self._ensure_db()
+        created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO history (user_id, query, sql, created_at) VALUES (?, ?, ?, ?)",
+                (user_id, query or "", sql or "", created_at)
+            )
+            entry_id = cursor.lastrowid
+            if self.max_entries:
+                # Rétention : seuil lu sur l'index (user_id, id), suppression bornée aux plus anciennes
+                conn.execute("""
+                    DELETE FROM history WHERE user_id = ? AND id <= (
+                        SELECT id FROM history WHERE user_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?
+                    )
+                """, (user_id, user_id, self.max_entries))
+        return {"id": entry_id, "query": query, "sql": sql, "timestamp": created_at}
+
+    def list_entries(self, user_id="", limit=50, before=None, search=None):
+        """Entrées les plus récentes d'abord ; `before` = id de la dernière entrée de la page précédente."""
+        self._ensure_db()
+        limit = max(1, min(int(limit), 500))
+        params = [user_id]
+        where = "h.user_id = ?"
+        if before is not None:
+            where += " AND h.id < ?"
+            params.append(int(before))
+
+        join = ""
+        if search and search.strip():
+            match = self._fts_query(search)
+            if self.fts and match:
+                join = "JOIN history_fts ON history_fts.rowid = h.id"
+                where += " AND history_fts MATCH ?"
+                params.append(match)
+            else:
+                where += " AND (h.query LIKE ? OR h.sql LIKE ?)"
+                pattern = f"%{search.strip()}%"
+                params.extend([pattern, pattern])
+
+        sql = f"SELECT h.id, h.query, h.sql, h.created_at FROM history h {join} WHERE {where} ORDER BY h.id DESC LIMIT ?"
+        params.append(limit + 1)
+        with self._connect() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        items = [self._to_dict(row) for row in rows[:limit]]
+        next_cursor = items[-1]["id"] if len(rows) > limit else None
+        return items, next_cursor
+
+    def delete(self, entry_id, user_id=""):
+        self._ensure_db()
+        with self._connect() as conn:
+            cursor = conn.execute("DELETE FROM history WHERE id = ? AND user_id = ?", (int(entry_id), user_id))
+        return cursor.rowcount > 0
+
+history_store = HistoryStore()
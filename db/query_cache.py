@@ -0,0 +1,148 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from db.sql_utils import normalize_sql, referenced_names
+
+# Résultat différent à chaque exécution : jamais mis en cache
+VOLATILE_NAMES = {
+    "SYSDATE", "SYSTIMESTAMP", "CURRENT_DATE", "CURRENT_TIMESTAMP", "LOCALTIMESTAMP",
+    "DBMS_RANDOM", "SYS_GUID", "SAMPLE", "NEXTVAL", "CURRVAL"
+}
+
+class QueryCache:
+    """
+    Cache des résultats de /api/execute (avec leurs stats), indexé par SQL normalisé et options.
+    La réponse JSON est conservée compressée (zlib) : un succès ne refait ni la requête ni la sérialisation.
+    Budget mémoire (QUERY_CACHE_MAX_MB), éviction LRU, expiration (QUERY_CACHE_TTL) et invalidation
+    par table lue (seed, init, DDL).
+    """
+
+    def __init__(self, max_bytes=None, ttl=None, max_entry_bytes=None, enabled=None):
+        self.enabled = enabled if enabled is not None else os.getenv("QUERY_CACHE_ENABLED", "0") == "1"
+        self.max_bytes = max_bytes or int(float(os.getenv("QUERY_CACHE_MAX_MB", "64")) * 1024 * 1024)
+        self.ttl = ttl or int(os.getenv("QUERY_CACHE_TTL", "300"))
+        # Un résultat plus gros (compressé) occuperait le cache à lui seul : il n'est pas conservé
+        self.max_entry_bytes = max_entry_bytes or int(float(os.getenv("QUERY_CACHE_MAX_ENTRY_MB", "8")) * 1024 * 1024)
+
+        self._entries = OrderedDict()  # clé -> (expiration, tables, valeur compressée)
+        self._tables = {}              # table -> clés qui la lisent
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.skipped = 0
+
+    @staticmethod
+    def make_key(sql, options):
+        raw = json.dumps([normalize_sql(sql), options], sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def dependencies(sql, catalog=None):
+        """Objets lus par la requête ; les vues connues du catalogue ajoutent leurs tables sous-jacentes."""
+        names = referenced_names(sql)
+        pending = list(names)
+        objects = catalog.objects if catalog is not None else {}
+        while pending:
+            view_text = (objects.get(pending.pop()) or {}).get("view_text")
+            if view_text:
+                for name in referenced_names(view_text) - names:
+                    names.add(name)
+                    pending.append(name)
+        return names
+
+    def cacheable(self, sql):
+        return self.enabled and not (referenced_names(sql) & VOLATILE_NAMES)
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.time():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    blob = entry[2]
+                else:
+                    self._drop(key)
+                    entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+        # Décompression hors verrou
+        return zlib.decompress(blob)
+
+    def set(self, key, body, tables):
+        """`body` : réponse JSON sérialisée (bytes)."""
+        if not self.enabled:
+            return False
+        blob = zlib.compress(body, 1)
+        with self._lock:
+            if len(blob) > self.max_entry_bytes:
+                self.skipped += 1
+                return False
+            if key in self._entries:
+                self._drop(key)
+            tables = frozenset(tables)
+            self._entries[key] = (time.time() + self.ttl, tables, blob)
+            self.bytes += len(blob)
+            for table in tables:
+                self._tables.setdefault(table, set()).add(key)
+            while self.bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+        return True
+
+    def _drop(self, key):
+        _, tables, blob = self._entries.pop(key)
+        self.bytes -= len(blob)
+        for table in tables:
+            keys = self._tables.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tables[table]
+
+    def invalidate_tables(self, tables):
+        """Supprime les résultats qui lisent l'une des tables. Renvoie le nombre d'entrées retirées."""
+        with self._lock:
+            keys = set()
+            for table in tables:
+                keys |= self._tables.get(table, set())
+            for key in keys:
+                self._drop(key)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tables.clear()
+            self.bytes = 0
+
+    def get_stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_s": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "skipped_too_large": self.skipped
+            }
+
+query_cache = QueryCache()
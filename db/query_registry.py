@@ -0,0 +1,200 @@
+import logging
+import os
+import re
+import secrets
+import select
+import socket
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+QUERY_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+def socket_closed(sock):
+    """Vrai si le client a fermé la connexion (lecture possible mais 0 octet en attente)."""
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+        if not readable:
+            return False
+        return sock.recv(1, socket.MSG_PEEK) == b""
+    except ValueError:
+        # Socket TLS (MSG_PEEK refusé) : déconnexion non détectable
+        return False
+    except OSError:
+        return True
+
+class RunningQuery:
+    """Requête utilisateur suivie : connexion en cours d'utilisation, délai et sonde de déconnexion."""
+
+    def __init__(self, registry, sql, user_id="", query_id=None, timeout_ms=None, is_disconnected=None):
+        self.registry = registry
+        self.id = query_id or uuid.uuid4().hex
+        self.sql = sql
+        self.user_id = user_id
+        self.timeout_ms = timeout_ms
+        self.is_disconnected = is_disconnected
+        self.started_at = time.time()
+        self.conn = None
+        self.cancel_reason = None
+
+    def attach(self, conn):
+        """Applique le délai d'appel à la connexion et rend la requête annulable."""
+        conn.call_timeout = self.timeout_ms or 0
+        self.conn = conn
+        self.registry._add(self)
+
+    def detach(self):
+        """Fin de suivi (libère aussi l'identifiant réservé par track) ; sans effet si déjà détachée."""
+        self.registry._remove(self)
+        self.conn = None
+
+    def cancel(self, reason):
+        conn = self.conn
+        if conn is None:
+            return False
+        self.cancel_reason = reason
+        try:
+            # Interrompt l'appel en cours (ORA-01013 côté exécution)
+            conn.cancel()
+        except Exception as e:
+            logger.warning("Annulation impossible de la requête %s: %s", self.id, e)
+            return False
+        return True
+
+    def error_message(self, error):
+        """Message d'erreur lisible pour un appel interrompu (délai, annulation), sinon l'erreur Oracle."""
+        message = str(error)
+        if "DPI-1067" in message or "ORA-03156" in message:
+            return f"Délai d'exécution dépassé ({self.timeout_ms / 1000:g} s) : la requête a été interrompue."
+        if "ORA-01013" in message or self.cancel_reason:
+            if self.cancel_reason == "disconnect":
+                return "Requête annulée : le client s'est déconnecté."
+            return "Requête annulée."
+        return message
+
+    def to_dict(self):
+        return {
+            "query_id": self.id,
+            "sql": self.sql[:500],
+            "elapsed_ms": round((time.time() - self.started_at) * 1000, 1),
+            "timeout_ms": self.timeout_ms,
+            "cancelling": self.cancel_reason is not None
+        }
+
+class QueryRegistry:
+    """
+    Requêtes utilisateur en cours d'exécution : liste avec temps écoulé, annulation par identifiant et
+    annulation automatique quand le client se déconnecte (un seul thread de surveillance pour le processus).
+    """
+
+    def __init__(self, default_timeout=None, max_timeout=None, watch_interval=None):
+        # Délais en secondes (0 = pas de limite), appliqués par aller-retour via connection.call_timeout
+        self.default_timeout = default_timeout if default_timeout is not None else float(os.getenv("ORACLE_CALL_TIMEOUT", "60"))
+        self.max_timeout = max_timeout if max_timeout is not None else float(os.getenv("ORACLE_MAX_CALL_TIMEOUT", "300"))
+        self.watch_interval = watch_interval or float(os.getenv("QUERY_WATCH_INTERVAL", "0.5"))
+        self._running = {}
+        self._reserved = {}  # query_id fourni par le client -> RunningQuery, jusqu'à detach()
+        self._lock = threading.Lock()
+        self._watcher = None
+        self._requests = {}  # jeton de requête HTTP -> Event posé à la déconnexion (mode ASGI)
+        self.cancelled = 0
+        self.disconnects = 0
+
+    def timeout_ms(self, requested=None):
+        """Délai demandé (s), borné par ORACLE_MAX_CALL_TIMEOUT ; ORACLE_CALL_TIMEOUT par défaut."""
+        timeout = self.default_timeout
+        if requested is not None:
+            timeout = float(requested)
+            if timeout <= 0:
+                raise ValueError("timeout doit être positif")
+        if self.max_timeout:
+            timeout = min(timeout, self.max_timeout) if timeout else self.max_timeout
+        return int(timeout * 1000)
+
+    def track(self, sql, user_id="", query_id=None, timeout=None, is_disconnected=None):
+        if query_id is not None and not QUERY_ID_PATTERN.match(str(query_id)):
+            raise ValueError("query_id invalide")
+        query = RunningQuery(self, sql, user_id, query_id, self.timeout_ms(timeout), is_disconnected)
+        if query_id is not None:
+            # Identifiant réservé dès maintenant (et non à attach) : deux requêtes simultanées avec le même
+            # query_id ne peuvent pas passer toutes deux le contrôle
+            with self._lock:
+                if query_id in self._running or query_id in self._reserved:
+                    raise ValueError("query_id déjà utilisé par une requête en cours")
+                self._reserved[query_id] = query
+        return query
+
+    def _add(self, query):
+        with self._lock:
+            self._running[query.id] = query
+            if query.is_disconnected is not None and self._watcher is None:
+                self._watcher = threading.Thread(target=self._watch, name="query-watcher", daemon=True)
+                self._watcher.start()
+
+    def _remove(self, query):
+        with self._lock:
+            if self._running.get(query.id) is query:
+                del self._running[query.id]
+            if self._reserved.get(query.id) is query:
+                del self._reserved[query.id]
+
+    def _watch(self):
+        while True:
+            time.sleep(self.watch_interval)
+            with self._lock:
+                watched = [q for q in self._running.values() if q.is_disconnected is not None and q.cancel_reason is None]
+            for query in watched:
+                try:
+                    gone = query.is_disconnected()
+                except Exception:
+                    gone = False
+                if gone and query.cancel("disconnect"):
+                    logger.info("Client déconnecté, requête %s annulée", query.id)
+                    with self._lock:
+                        self.disconnects += 1
+
+    def cancel(self, query_id, user_id=""):
+        with self._lock:
+            query = self._running.get(query_id)
+        if query is None or query.user_id != user_id:
+            return False
+        cancelled = query.cancel("user")
+        if cancelled:
+            with self._lock:
+                self.cancelled += 1
+        return cancelled
+
+    def list_queries(self, user_id=""):
+        with self._lock:
+            queries = [q for q in self._running.values() if q.user_id == user_id]
+        return sorted((q.to_dict() for q in queries), key=lambda q: -q["elapsed_ms"])
+
+    # Déconnexions signalées par le serveur ASGI (asgi.py), la socket n'étant pas accessible au code WSGI
+    def watch_request(self):
+        token = secrets.token_hex(16)
+        event = threading.Event()
+        with self._lock:
+            self._requests[token] = event
+        return token, event
+
+    def forget_request(self, token):
+        with self._lock:
+            self._requests.pop(token, None)
+
+    def request_event(self, token):
+        with self._lock:
+            return self._requests.get(token)
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "running": len(self._running),
+                "default_timeout_s": self.default_timeout,
+                "max_timeout_s": self.max_timeout,
+                "cancelled": self.cancelled,
+                "cancelled_on_disconnect": self.disconnects
+            }
+
+query_registry = QueryRegistry()
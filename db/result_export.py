@@ -0,0 +1,243 @@
+import csv
+import io
+import logging
+import os
+import time
+import zlib
+
+import oracledb
+
+from db.result_format import arrow_array
+
+logger = logging.getLogger(__name__)
+
+# format -> (type MIME, extension)
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+COMPRESSIONS = ("none", "gzip", "zstd")
+
+class _ChunkBuffer(io.RawIOBase):
+    """Fichier en écriture seule dont le contenu est récupéré (puis vidé) après chaque groupe de lignes Parquet."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._size += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._size
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+class ResultExporter:
+    """
+    Export d'un résultat en flux (POST /api/export) : les paquets du curseur (EXPORT_ARRAYSIZE lignes) sont
+    écrits en CSV, compressé à la volée (gzip, zstd), ou en Parquet par groupes de lignes (EXPORT_ROW_GROUP_SIZE).
+    La mémoire reste bornée par un paquet (CSV) ou un groupe de lignes (Parquet), quelle que soit la taille du résultat.
+    """
+
+    def __init__(self):
+        # Gros paquets réseau : moins d'allers-retours qu'en consultation (ORACLE_FETCH_ARRAYSIZE)
+        self.arraysize = int(os.getenv("EXPORT_ARRAYSIZE", "10000"))
+        # Plafond propre aux exports (ORACLE_MAX_ROWS reste celui de l'affichage)
+        self.max_rows = int(os.getenv("EXPORT_MAX_ROWS", "5000000"))
+        self.row_group_size = int(os.getenv("EXPORT_ROW_GROUP_SIZE", "100000"))
+        self.gzip_level = int(os.getenv("EXPORT_GZIP_LEVEL", "6"))
+        self.zstd_level = int(os.getenv("EXPORT_ZSTD_LEVEL", "3"))
+
+    def check(self, fmt, compression):
+        """Message d'erreur si le format ou la compression est inconnu ou indisponible, sinon None."""
+        if fmt not in EXPORT_FORMATS:
+            return f"Format d'export inconnu : {fmt} (disponibles : {', '.join(EXPORT_FORMATS)})"
+        if compression not in COMPRESSIONS:
+            return f"Compression inconnue : {compression} (disponibles : {', '.join(COMPRESSIONS)})"
+        if fmt == "parquet":
+            try:
+                import pyarrow.parquet  # noqa: F401
+            except ImportError:
+                return "Export Parquet indisponible : installez pyarrow (pip install pyarrow)."
+        elif compression == "zstd":
+            try:
+                import zstandard  # noqa: F401
+            except ImportError:
+                return "Compression zstd indisponible : installez zstandard (pip install zstandard)."
+        return None
+
+    def filename(self, fmt, compression, stem="export"):
+        name = f"{stem}.{EXPORT_FORMATS[fmt][1]}"
+        # Parquet : compression interne aux colonnes, le fichier garde son extension
+        if fmt == "csv" and compression == "gzip":
+            name += ".gz"
+        elif fmt == "csv" and compression == "zstd":
+            name += ".zst"
+        return name
+
+    def mimetype(self, fmt, compression):
+        if fmt == "csv" and compression == "gzip":
+            return "application/gzip"
+        if fmt == "csv" and compression == "zstd":
+            return "application/zstd"
+        return EXPORT_FORMATS[fmt][0]
+
+    def iter_export(self, stream, fmt, compression="none", label="export"):
+        """Octets du fichier exporté, paquet par paquet ; débit (lignes/s) tracé en fin d'export."""
+        started = time.perf_counter()
+        size = 0
+        writer = self._iter_parquet if fmt == "parquet" else self._iter_csv
+        try:
+            for data in writer(stream, compression):
+                if data:
+                    size += len(data)
+                    yield data
+        except Exception as e:
+            logger.error("Export %s interrompu après %d lignes : %s", label, stream.row_count, stream.error_message(e))
+            raise
+        finally:
+            stream.close()
+        elapsed = time.perf_counter() - started
+        logger.info("Export %s (%s, compression %s) : %d lignes, %d octets en %.2f s (%.0f lignes/s)",
+                    label, fmt, compression, stream.row_count, size, elapsed, stream.row_count / elapsed if elapsed else 0)
+        if stream.truncated:
+            logger.warning("Export %s tronqué à %d lignes (max_rows ou EXPORT_MAX_ROWS)", label, stream.row_count)
+
+    def _compressor(self, compression):
+        if compression == "gzip":
+            # wbits=31 : en-tête et pied gzip
+            return zlib.compressobj(self.gzip_level, zlib.DEFLATED, 31)
+        if compression == "zstd":
+            import zstandard
+            return zstandard.ZstdCompressor(level=self.zstd_level).compressobj()
+        return None
+
+    def _iter_csv(self, stream, compression):
+        compressor = self._compressor(compression)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerow(stream.columns)
+        lob_columns = _lob_columns(stream.cursor.description)
+        for rows in stream.chunks():
+            if lob_columns:
+                rows = _read_lobs(rows, lob_columns)
+            writer.writerows(rows)
+            data = buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+            yield compressor.compress(data) if compressor else data
+        data = buffer.getvalue().encode("utf-8")
+        if compressor:
+            yield compressor.compress(data) + compressor.flush()
+        else:
+            yield data
+
+    def _iter_parquet(self, stream, compression):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        sink = _ChunkBuffer()
+        writer = schema = None
+        declared = [_arrow_type(pa, column) for column in stream.cursor.description]
+        group, group_rows = [], 0
+        lob_columns = _lob_columns(stream.cursor.description)
+
+        def write_group():
+            nonlocal writer, schema
+            rows = [row for rows in group for row in rows]
+            columns = list(zip(*rows)) if rows else [()] * len(stream.columns)
+            if writer is None:
+                # Schéma fixé par le premier groupe : types du curseur, sinon déduits des valeurs
+                arrays = []
+                for values, declared_type in zip(columns, declared):
+                    array = arrow_array(pa, values, declared_type)
+                    if pa.types.is_null(array.type):
+                        # Colonne entièrement NULL : texte
+                        array = array.cast(pa.string())
+                    elif declared_type is None and pa.types.is_integer(array.type):
+                        # Entiers sans type déclaré (NUMBER sans précision) : un groupe suivant peut contenir des
+                        # décimaux, le type du fichier ne peut plus changer une fois l'en-tête envoyé
+                        array = array.cast(pa.float64())
+                    arrays.append(array)
+                schema = pa.schema([pa.field(name, array.type) for name, array in zip(stream.columns, arrays)])
+                writer = pq.ParquetWriter(sink, schema, compression=compression if compression != "none" else "NONE")
+            else:
+                arrays = []
+                for field, values in zip(schema, columns):
+                    array = arrow_array(pa, values, field.type)
+                    if array.type != field.type and array.type == pa.string():
+                        # Repli texte d'arrow_array : conversion vers le type du fichier si elle est possible
+                        try:
+                            array = array.cast(field.type)
+                        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                            pass
+                    if array.type != field.type:
+                        raise ValueError(f"Colonne {field.name} : valeurs incompatibles avec le type {field.type} du premier groupe de lignes")
+                    arrays.append(array)
+            table = pa.Table.from_arrays(arrays, schema=schema)
+            # Un groupe de lignes Parquet par appel
+            writer.write_table(table, row_group_size=max(1, table.num_rows))
+
+        for rows in stream.chunks():
+            if lob_columns:
+                rows = _read_lobs(rows, lob_columns)
+            group.append(rows)
+            group_rows += len(rows)
+            if group_rows >= self.row_group_size:
+                write_group()
+                group, group_rows = [], 0
+                yield sink.drain()
+        if group or writer is None:
+            write_group()
+        writer.close()
+        yield sink.drain()
+
+def _arrow_type(pa, column):
+    """Type Arrow déduit de la description du curseur ; None quand seules les valeurs permettent de le choisir."""
+    if len(column) < 6:
+        return None
+    type_code, precision, scale = column[1], column[4], column[5]
+    if type_code is oracledb.DB_TYPE_NUMBER:
+        # NUMBER(p) / NUMBER(p, 0) jusqu'à 18 chiffres : entier ; sinon (décimal, expression calculée,
+        # NUMBER sans précision) : double, des décimaux pouvant suivre des entiers
+        if precision and scale == 0 and precision <= 18:
+            return pa.int64()
+        return pa.float64()
+    if type_code in (oracledb.DB_TYPE_BINARY_FLOAT, oracledb.DB_TYPE_BINARY_DOUBLE):
+        return pa.float64()
+    if type_code in (oracledb.DB_TYPE_VARCHAR, oracledb.DB_TYPE_NVARCHAR, oracledb.DB_TYPE_CHAR, oracledb.DB_TYPE_NCHAR,
+                     oracledb.DB_TYPE_LONG, oracledb.DB_TYPE_CLOB, oracledb.DB_TYPE_NCLOB, oracledb.DB_TYPE_ROWID):
+        return pa.string()
+    if type_code in (oracledb.DB_TYPE_DATE, oracledb.DB_TYPE_TIMESTAMP):
+        return pa.timestamp("us")
+    if type_code in (oracledb.DB_TYPE_RAW, oracledb.DB_TYPE_LONG_RAW, oracledb.DB_TYPE_BLOB):
+        return pa.binary()
+    return None
+
+def _lob_columns(description):
+    """
+    Indices des colonnes LOB (valeurs à lire), d'après les types du curseur : une colonne entièrement NULL
+    dans le premier paquet peut contenir des LOB plus loin.
+    """
+    lob_types = (oracledb.DB_TYPE_CLOB, oracledb.DB_TYPE_NCLOB, oracledb.DB_TYPE_BLOB)
+    return [i for i, column in enumerate(description) if len(column) > 1 and column[1] in lob_types]
+
+def _read_lobs(rows, lob_columns):
+    rows = [list(row) for row in rows]
+    for row in rows:
+        for i in lob_columns:
+            if row[i] is not None:
+                row[i] = row[i].read()
+    return rows
+
+result_exporter = ResultExporter()
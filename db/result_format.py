@@ -0,0 +1,96 @@
+import datetime
+import decimal
+import json
+
+try:
+    import orjson
+except ImportError:  # encodeur standard, plus lent
+    orjson = None
+
+from metrics import metrics
+
+# {"format": ...} de /api/execute : lignes (historique), colonnes (JSON compact) ou Arrow IPC (binaire)
+FORMATS = ("rows", "columnar", "arrow")
+ARROW_MIMETYPE = "application/vnd.apache.arrow.stream"
+
+def _default(value):
+    """Types Oracle non gérés nativement par l'encodeur (les dates et scalaires numpy le sont avec orjson)."""
+    if isinstance(value, decimal.Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, datetime.timedelta):
+        return str(value)
+    if isinstance(value, (bytes, bytearray)):
+        return value.hex()
+    if hasattr(value, "read"):
+        # LOB : contenu lu
+        return value.read()
+    if hasattr(value, "item"):
+        # Scalaire numpy (encodeur standard)
+        return value.item()
+    raise TypeError(f"Type non sérialisable : {type(value).__name__}")
+
+def _encode(obj):
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+        except orjson.JSONEncodeError:
+            # Entiers au-delà de 64 bits (NUMBER entier très grand, ex. POWER(10, 25)) : encodeur standard
+            pass
+    return json.dumps(obj, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def dumps(obj):
+    """Sérialisation JSON rapide (bytes) : orjson si disponible, sinon json avec le même convertisseur."""
+    with metrics.phase("serialize"):
+        return _encode(obj)
+
+def to_columns(rows, width):
+    """Lignes -> une liste de valeurs par colonne (transposition en C via zip)."""
+    if not rows:
+        return [[] for _ in range(width)]
+    return [list(column) for column in zip(*rows)]
+
+def columnar(result):
+    """Résultat de /api/execute au format colonnes : "data" devient une liste par colonne, "row_count" le nombre de lignes."""
+    if "columns" not in result or "data" not in result:
+        return result
+    rows = result["data"]
+    return dict(result, format="columnar", data=to_columns(rows, len(result["columns"])), row_count=result.get("row_count", len(rows)))
+
+def arrow_available():
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def arrow_array(pa, values, type=None):
+    """Colonne Arrow (type déduit des valeurs, ou imposé) ; texte pour une colonne de types mélangés."""
+    try:
+        return pa.array(values, type=type)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.array([None if v is None else str(v) for v in values], type=pa.string())
+
+def to_arrow(result):
+    """
+    Résultat en flux Arrow IPC (pyarrow) : une colonne Arrow par colonne du résultat ; le reste de la réponse
+    (stats, plan, execution_time...) est placé en JSON dans les métadonnées du schéma (clé "sqlia").
+    Renvoie (bytes, None) ou (None, message d'erreur).
+    """
+    try:
+        import pyarrow as pa
+    except ImportError:
+        return None, "Format arrow indisponible : installez pyarrow (pip install pyarrow)."
+
+    with metrics.phase("serialize"):
+        arrays = [arrow_array(pa, values) for values in to_columns(result["data"], len(result["columns"]))]
+        meta = {key: value for key, value in result.items() if key != "data"}
+        schema = pa.schema(
+            [pa.field(name, array.type) for name, array in zip(result["columns"], arrays)],
+            metadata={"sqlia": _encode(meta)}
+        )
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, schema) as writer:
+            writer.write_batch(pa.record_batch(arrays, schema=schema))
+        return sink.getvalue().to_pybytes(), None
@@ -0,0 +1,302 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Au-delà de ce nombre d'objets modifiés, on relit tout le schéma plutôt que de filtrer par nom
+INCREMENTAL_LIMIT = 500
+
+OBJECTS_SQL = """
+    SELECT OBJECT_NAME, OBJECT_TYPE, LAST_DDL_TIME
+    FROM ALL_OBJECTS
+    WHERE OWNER = :owner AND OBJECT_TYPE IN ('TABLE', 'VIEW') AND OBJECT_NAME NOT LIKE 'BIN$%'
+"""
+
+COLUMNS_SQL = """
+    SELECT C.TABLE_NAME, C.COLUMN_NAME, C.DATA_TYPE, C.DATA_PRECISION, C.DATA_SCALE, C.CHAR_LENGTH,
+           C.NULLABLE, CC.COMMENTS
+    FROM ALL_TAB_COLUMNS C
+    LEFT JOIN ALL_COL_COMMENTS CC
+        ON CC.OWNER = C.OWNER AND CC.TABLE_NAME = C.TABLE_NAME AND CC.COLUMN_NAME = C.COLUMN_NAME
+    WHERE C.OWNER = :owner {filter}
+    ORDER BY C.TABLE_NAME, C.COLUMN_ID
+"""
+
+CONSTRAINTS_SQL = """
+    SELECT C.TABLE_NAME, C.CONSTRAINT_NAME, C.CONSTRAINT_TYPE, CC.COLUMN_NAME, R.TABLE_NAME, RCC.COLUMN_NAME
+    FROM ALL_CONSTRAINTS C
+    JOIN ALL_CONS_COLUMNS CC
+        ON CC.OWNER = C.OWNER AND CC.CONSTRAINT_NAME = C.CONSTRAINT_NAME
+    LEFT JOIN ALL_CONSTRAINTS R
+        ON R.OWNER = C.R_OWNER AND R.CONSTRAINT_NAME = C.R_CONSTRAINT_NAME
+    LEFT JOIN ALL_CONS_COLUMNS RCC
+        ON RCC.OWNER = R.OWNER AND RCC.CONSTRAINT_NAME = R.CONSTRAINT_NAME AND RCC.POSITION = CC.POSITION
+    WHERE C.OWNER = :owner AND C.CONSTRAINT_TYPE IN ('P', 'R') {filter}
+    ORDER BY C.TABLE_NAME, C.CONSTRAINT_NAME, CC.POSITION
+"""
+
+TABLES_SQL = """
+    SELECT T.TABLE_NAME, T.NUM_ROWS, TC.COMMENTS
+    FROM ALL_TABLES T
+    LEFT JOIN ALL_TAB_COMMENTS TC ON TC.OWNER = T.OWNER AND TC.TABLE_NAME = T.TABLE_NAME
+    WHERE T.OWNER = :owner {filter}
+"""
+
+VIEWS_SQL = """
+    SELECT V.VIEW_NAME, V.TEXT, TC.COMMENTS
+    FROM ALL_VIEWS V
+    LEFT JOIN ALL_TAB_COMMENTS TC ON TC.OWNER = V.OWNER AND TC.TABLE_NAME = V.VIEW_NAME
+    WHERE V.OWNER = :owner {filter}
+"""
+
+def _format_type(data_type, precision, scale, char_length):
+    if data_type == "NUMBER" and precision is not None:
+        return f"NUMBER({precision},{scale or 0})" if scale else f"NUMBER({precision})"
+    if data_type in ("VARCHAR2", "NVARCHAR2", "CHAR", "NCHAR") and char_length:
+        return f"{data_type}({char_length})"
+    return data_type
+
+class SchemaCatalog:
+    """
+    Catalogue du schéma Oracle (tables, vues, colonnes, types, PK/FK, volumétrie estimée)
+    construit par introspection du dictionnaire en quelques requêtes groupées, sauvegardé
+    en JSON pour un démarrage rapide et rafraîchi incrémentalement via LAST_DDL_TIME.
+    """
+
+    def __init__(self, snapshot_path=None, owner=None):
+        self.snapshot_path = snapshot_path or os.getenv(
+            "SCHEMA_CATALOG_PATH", os.path.join(os.path.dirname(__file__), "schema_catalog.json")
+        )
+        self.owner = owner or os.getenv("ORACLE_SCHEMA_OWNER")
+        self.objects = {}
+        self.refreshed_at = None
+        self.version = None
+        self._markdown = None
+        self._lock = threading.Lock()
+        self.load_snapshot()
+
+    def is_loaded(self):
+        return bool(self.objects)
+
+    # ------------------------------------------------------------------
+    # Persistance
+    # ------------------------------------------------------------------
+
+    def load_snapshot(self):
+        if not os.path.exists(self.snapshot_path):
+            return False
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            self.owner = self.owner or snapshot.get("owner")
+            self._set_objects(snapshot.get("objects", {}), snapshot.get("refreshed_at"))
+            logger.debug("Catalogue du schéma chargé (%d objets)", len(self.objects))
+            return True
+        except (json.JSONDecodeError, OSError) as e:
+            logger.error("Erreur lecture catalogue du schéma: %s", e)
+            return False
+
+    def save_snapshot(self):
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"owner": self.owner, "refreshed_at": self.refreshed_at, "objects": self.objects},
+                      f, ensure_ascii=False)
+        os.replace(tmp_path, self.snapshot_path)
+
+    def _set_objects(self, objects, refreshed_at):
+        self.objects = objects
+        self.refreshed_at = refreshed_at
+        raw = json.dumps(objects, sort_keys=True, ensure_ascii=False)
+        self.version = hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+        self._markdown = None
+
+    # ------------------------------------------------------------------
+    # Introspection
+    # ------------------------------------------------------------------
+
+    def refresh(self, db_manager, full=False):
+        """Relit les objets créés ou modifiés depuis le dernier instantané. Renvoie (résumé, erreur)."""
+        conn = db_manager.get_connection()
+        if not conn:
+            return None, "Erreur de connexion à la base de données."
+        with self._lock:
+            try:
+                cursor = conn.cursor()
+                cursor.arraysize = 1000
+                owner = (self.owner or db_manager.user).upper()
+
+                cursor.execute(OBJECTS_SQL, owner=owner)
+                current = {name: (obj_type, ddl_time.isoformat()) for name, obj_type, ddl_time in cursor}
+
+                objects = {} if full or owner != (self.owner or "").upper() else dict(self.objects)
+                dropped = [name for name in objects if name not in current]
+                for name in dropped:
+                    del objects[name]
+                changed = [name for name, (_, ddl_time) in current.items()
+                           if name not in objects or objects[name].get("last_ddl_time") != ddl_time]
+
+                if changed:
+                    names = None if len(changed) > INCREMENTAL_LIMIT or len(changed) == len(current) else changed
+                    fresh = self._introspect(cursor, owner, names)
+                    for name in changed:
+                        obj_type, ddl_time = current[name]
+                        entry = fresh.get(name, {"columns": []})
+                        entry["type"] = obj_type
+                        entry["last_ddl_time"] = ddl_time
+                        objects[name] = entry
+
+                self.owner = owner
+                if changed or dropped or not self.refreshed_at:
+                    self._set_objects(objects, datetime.now().isoformat(timespec="seconds"))
+                    self.save_snapshot()
+                summary = {"objects": len(objects), "changed": len(changed), "dropped": len(dropped),
+                           "version": self.version}
+                logger.info("Catalogue du schéma rafraîchi %s", summary)
+                return summary, None
+            except Exception as e:
+                return None, str(e)
+            finally:
+                conn.close()
+
+    def _introspect(self, cursor, owner, names):
+        """Quatre requêtes groupées pour tous les objets demandés (ou tout le schéma si names est None)."""
+        binds = {"owner": owner}
+        filters = {}
+        if names:
+            placeholders = []
+            for i, name in enumerate(names):
+                binds[f"n{i}"] = name
+                placeholders.append(f":n{i}")
+            in_list = ", ".join(placeholders)
+            filters = {
+                "columns": f"AND C.TABLE_NAME IN ({in_list})",
+                "constraints": f"AND C.TABLE_NAME IN ({in_list})",
+                "tables": f"AND T.TABLE_NAME IN ({in_list})",
+                "views": f"AND V.VIEW_NAME IN ({in_list})"
+            }
+
+        objects = {}
+
+        def entry(name):
+            return objects.setdefault(name, {"columns": [], "primary_key": [], "foreign_keys": []})
+
+        cursor.execute(COLUMNS_SQL.format(filter=filters.get("columns", "")), binds)
+        for table, column, data_type, precision, scale, char_length, nullable, comment in cursor:
+            col = {"name": column, "type": _format_type(data_type, precision, scale, char_length),
+                   "nullable": nullable == "Y"}
+            if comment:
+                col["comment"] = comment
+            entry(table)["columns"].append(col)
+
+        foreign_keys = {}
+        cursor.execute(CONSTRAINTS_SQL.format(filter=filters.get("constraints", "")), binds)
+        for table, constraint, constraint_type, column, ref_table, ref_column in cursor:
+            if constraint_type == "P":
+                entry(table)["primary_key"].append(column)
+            else:
+                fk = foreign_keys.get(constraint)
+                if fk is None:
+                    fk = {"columns": [], "ref_table": ref_table, "ref_columns": []}
+                    foreign_keys[constraint] = fk
+                    entry(table)["foreign_keys"].append(fk)
+                fk["columns"].append(column)
+                fk["ref_columns"].append(ref_column)
+
+        cursor.execute(TABLES_SQL.format(filter=filters.get("tables", "")), binds)
+        for table, num_rows, comment in cursor:
+            obj = entry(table)
+            obj["num_rows"] = num_rows
+            if comment:
+                obj["comment"] = comment
+
+        cursor.execute(VIEWS_SQL.format(filter=filters.get("views", "")), binds)
+        for view, text, comment in cursor:
+            obj = entry(view)
+            # Le texte complet d'une vue peut être long : on garde le début pour le prompt
+            obj["view_text"] = (text or "")[:2000]
+            if comment:
+                obj["comment"] = comment
+
+        return objects
+
+    # ------------------------------------------------------------------
+    # Rendus pour le LLM
+    # ------------------------------------------------------------------
+
+    def _render_object(self, name, obj):
+        kind = "Vue" if obj.get("type") == "VIEW" else "Table"
+        lines = [f"### {name}"]
+        description = obj.get("comment") or f"{kind} {name}."
+        if obj.get("num_rows") is not None:
+            description += f" (~{obj['num_rows']} lignes)"
+        lines.append(description)
+        fk_by_column = {}
+        for fk in obj.get("foreign_keys", []):
+            for column in fk["columns"]:
+                fk_by_column[column] = fk["ref_table"]
+        for col in obj.get("columns", []):
+            tags = [col["type"]]
+            if col["name"] in obj.get("primary_key", []):
+                tags.append("PK")
+            if col["name"] in fk_by_column:
+                tags.append(f"FK -> {fk_by_column[col['name']]}")
+            if not col.get("nullable", True) and col["name"] not in obj.get("primary_key", []):
+                tags.append("NOT NULL")
+            line = f"- `{col['name']}` ({', '.join(tags)})"
+            if col.get("comment"):
+                line += f" : {col['comment']}"
+            lines.append(line)
+        if obj.get("view_text"):
+            lines.append(f"Définition : {' '.join(obj['view_text'].split())[:400]}")
+        return "\n".join(lines)
+
+    def to_markdown(self):
+        """Documentation markdown au format de docs/database_schema.md (découpable par SchemaIndex)."""
+        if self._markdown is not None:
+            return self._markdown
+        tables = sorted(name for name, obj in self.objects.items() if obj.get("type") != "VIEW")
+        views = sorted(name for name, obj in self.objects.items() if obj.get("type") == "VIEW")
+        parts = [f"# Schéma Oracle {self.owner or ''} (introspection du dictionnaire)", "", "## Tables", ""]
+        parts.extend(self._render_object(name, self.objects[name]) + "\n" for name in tables)
+        if views:
+            parts.extend(["## Vues (Views)", ""])
+            parts.extend(self._render_object(name, self.objects[name]) + "\n" for name in views)
+        self._markdown = "\n".join(parts)
+        return self._markdown
+
+    def compact_schema(self, names):
+        """Une ligne par objet, ex: CLIENTS(CLIENT_ID NUMBER PK, NOM VARCHAR2(100), ...)."""
+        lines = []
+        for name in names:
+            obj = self.objects.get(name.upper())
+            if not obj:
+                continue
+            fk_by_column = {c: fk["ref_table"] for fk in obj.get("foreign_keys", []) for c in fk["columns"]}
+            cols = []
+            for col in obj.get("columns", []):
+                desc = f"{col['name']} {col['type']}"
+                if col["name"] in obj.get("primary_key", []):
+                    desc += " PK"
+                if col["name"] in fk_by_column:
+                    desc += f" FK->{fk_by_column[col['name']]}"
+                cols.append(desc)
+            lines.append(f"{name.upper()}({', '.join(cols)})")
+        return "\n".join(lines)
+
+    def get_stats(self):
+        return {
+            "loaded": self.is_loaded(),
+            "owner": self.owner,
+            "objects": len(self.objects),
+            "tables": sum(1 for obj in self.objects.values() if obj.get("type") != "VIEW"),
+            "views": sum(1 for obj in self.objects.values() if obj.get("type") == "VIEW"),
+            "refreshed_at": self.refreshed_at,
+            "version": self.version,
+            "snapshot_path": self.snapshot_path
+        }
+
+schema_catalog = SchemaCatalog()
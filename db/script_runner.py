@@ -0,0 +1,312 @@
+"""
+Exécution de scripts SQL (db/init_schema.sql, db/seed_data.sql) sur une seule connexion.
+
+    python -m db.script_runner db/seed_data.sql [--skip-existing] [--stop-on-error]
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+# Jetons qui délimitent les instructions ; littéraux et commentaires sont consommés en entier
+# pour que leurs ";" ou "/" ne coupent pas le script
+SCRIPT_TOKEN_RE = re.compile(r"""
+    (?P<separator>^[ \t]*--[ \t]*SEPARATOR[ \t]*--[ \t]*$)
+  | (?P<slash>^[ \t]*/[ \t]*$)
+  | --[^\n]*
+  | /\*.*?(?:\*/|\Z)
+  | (?<![\w$\#])[nN]?[qQ]'(?:\[.*?\]|\{.*?\}|\(.*?\)|<.*?>|([^\s\[{(<]).*?\1)'
+  | '(?:[^']|'')*(?:'|\Z)
+  | "[^"]*(?:"|\Z)
+  | (?P<semicolon>;)
+""", re.S | re.M | re.X)
+
+# Blancs et commentaires en tête d'instruction, puis les premiers mots
+HEAD_RE = re.compile(r"(?:\s+|--[^\n]*|/\*.*?(?:\*/|\Z))*(?P<head>(?:[A-Za-z]+\s+){0,5}[A-Za-z]*)", re.S)
+PLSQL_HEAD_RE = re.compile(
+    r"(?:BEGIN|DECLARE)\b"
+    r"|CREATE\s+(?:OR\s+REPLACE\s+)?(?:(?:NON)?EDITIONABLE\s+)?(?:PROCEDURE|FUNCTION|PACKAGE|TRIGGER|TYPE)\b",
+    re.I
+)
+# Commandes SQL*Plus (une ligne, sans point-virgule) : ignorées
+SQLPLUS_COMMANDS = {"SET", "PROMPT", "SPOOL", "EXIT", "QUIT", "WHENEVER", "REM", "REMARK", "SHOW", "DEFINE", "UNDEFINE"}
+
+_NAME = r"""(?:"[^"]+"|[\w$\#]+)(?:\.(?:"[^"]+"|[\w$\#]+))?"""
+_TYPES = (r"TABLE|VIEW|MATERIALIZED\s+VIEW|INDEX|SEQUENCE|SYNONYM|PROCEDURE|FUNCTION"
+          r"|PACKAGE\s+BODY|PACKAGE|TRIGGER|TYPE\s+BODY|TYPE")
+CREATE_RE = re.compile(
+    r"CREATE\s+(?P<replace>OR\s+REPLACE\s+)?"
+    r"(?:(?:NO)?FORCE\s+|(?:NON)?EDITIONABLE\s+|GLOBAL\s+TEMPORARY\s+|UNIQUE\s+|BITMAP\s+|PUBLIC\s+)*"
+    rf"(?P<type>{_TYPES})\s+(?P<name>{_NAME})", re.I | re.X
+)
+DROP_RE = re.compile(rf"(?:EXECUTE\s+IMMEDIATE\s+')?DROP\s+(?:PUBLIC\s+)?(?P<type>{_TYPES})\s+(?P<name>{_NAME})", re.I)
+DML_RE = re.compile(rf"(?:INSERT\s+(?:ALL\s+)?INTO|UPDATE|DELETE\s+(?:FROM\s+)?|MERGE\s+INTO)\s+(?P<name>{_NAME})", re.I)
+
+DDL_WORDS = {"CREATE", "DROP", "ALTER", "TRUNCATE", "COMMENT", "GRANT", "REVOKE", "RENAME", "PURGE", "ANALYZE"}
+DML_WORDS = {"INSERT", "UPDATE", "DELETE", "MERGE"}
+
+def _object_name(name):
+    """Nom d'objet tel que dans le dictionnaire : sans schéma, majuscules sauf entre guillemets."""
+    name = name.split(".")[-1]
+    return name[1:-1] if name.startswith('"') else name.upper()
+
+class ScriptStatement:
+    """Instruction du script : texte, ligne de départ, nature et objet créé, supprimé ou modifié."""
+
+    def __init__(self, sql, line, plsql):
+        self.sql = sql
+        self.line = line
+        self.action = None       # create, replace, drop, write
+        self.object_type = None
+        self.object_name = None
+
+        words = HEAD_RE.match(sql).group("head").upper().split()
+        first = words[0] if words else ""
+        if plsql:
+            self.kind = "plsql"
+        elif first in DDL_WORDS:
+            self.kind = "ddl"
+        elif first in DML_WORDS:
+            self.kind = "dml"
+        elif first in ("COMMIT", "ROLLBACK"):
+            self.kind = first.lower()
+        else:
+            self.kind = "other"
+
+        match = CREATE_RE.search(sql) if first == "CREATE" else None
+        if match:
+            self.action = "replace" if match.group("replace") else "create"
+        elif first in ("DROP", "BEGIN"):
+            match = DROP_RE.search(sql)
+            if match:
+                self.action = "drop"
+        elif self.kind == "dml":
+            match = DML_RE.match(sql, HEAD_RE.match(sql).start("head"))
+            if match:
+                self.action = "write"
+        if match:
+            if "type" in match.groupdict():
+                self.object_type = " ".join(match.group("type").upper().split())
+            self.object_name = _object_name(match.group("name"))
+
+    def label(self):
+        return self.sql.split("\n", 1)[0].strip()[:80]
+
+def split_script(text):
+    """
+    Découpe un script en instructions : ";" pour le SQL, "/" seul sur sa ligne (ou fin de script) pour
+    les blocs PL/SQL, et l'ancien séparateur "-- SEPARATOR --" pour les deux. Les commandes SQL*Plus
+    (SET, PROMPT...) et les morceaux sans SQL sont ignorés.
+    """
+    statements = []
+    start = 0
+    plsql = None  # nature de l'instruction en cours, déterminée à son premier mot
+    counted = [0, 1]  # (position, numéro de ligne) : comptage incrémental des lignes
+
+    def begin(position):
+        # Saute les commandes SQL*Plus en tête et renvoie (début, est un bloc PL/SQL)
+        while True:
+            head = HEAD_RE.match(text, position)
+            words = head.group("head").split()
+            if words and words[0].upper() in SQLPLUS_COMMANDS:
+                line_end = text.find("\n", head.start("head"))
+                position = len(text) if line_end == -1 else line_end + 1
+                continue
+            return position, bool(PLSQL_HEAD_RE.match(head.group("head")))
+
+    def emit(end):
+        # Commentaires de tête retirés : ils documentent le script, pas l'instruction
+        offset = HEAD_RE.match(text, start).start("head")
+        chunk = text[offset:end].strip()
+        if not chunk:
+            return
+        counted[1] += text.count("\n", counted[0], offset)
+        counted[0] = offset
+        statements.append(ScriptStatement(chunk, counted[1], plsql))
+
+    start, plsql = begin(0)
+    for match in SCRIPT_TOKEN_RE.finditer(text):
+        if match.start() < start:
+            continue
+        if match.group("separator") or match.group("slash") or (match.group("semicolon") and not plsql):
+            emit(match.start())
+            start, plsql = begin(match.end())
+    emit(len(text))
+    return statements
+
+class ScriptRunner:
+    """
+    Exécute un script sur une seule connexion. Les DML consécutifs sont envoyés par lots dans un bloc
+    anonyme BEGIN ... END (un aller-retour par lot) ; si un lot échoue, Oracle annule le bloc et ses
+    instructions sont rejouées une à une pour isoler l'erreur. Le DDL et les blocs PL/SQL sont exécutés
+    un par un (le DDL valide la transaction en cours, comme sous SQL*Plus). Les DML sont validés à chaque
+    COMMIT du script et en fin d'exécution.
+
+    skip_existing : relance idempotente, les objets déjà présents (une requête sur USER_OBJECTS) ne
+    sont ni supprimés ni recréés ; CREATE OR REPLACE est toujours exécuté.
+    """
+
+    def __init__(self, batch_size=None, batch_bytes=None):
+        self.batch_size = batch_size or int(os.getenv("SCRIPT_BATCH_SIZE", "200"))
+        # Taille max du texte d'un lot (un bloc PL/SQL trop gros est refusé par le compilateur)
+        self.batch_bytes = batch_bytes or int(os.getenv("SCRIPT_BATCH_BYTES", "65536"))
+
+    def _existing_objects(self, conn):
+        cursor = conn.cursor()
+        cursor.arraysize = 1000
+        cursor.execute("SELECT OBJECT_TYPE, OBJECT_NAME FROM USER_OBJECTS")
+        return {(object_type, name) for object_type, name in cursor}
+
+    def _groups(self, statements):
+        """Lots de DML consécutifs (bornés en nombre et en taille), les autres instructions seules."""
+        batch = []
+        size = 0
+        for statement in statements:
+            if statement.kind == "dml":
+                if batch and (len(batch) >= self.batch_size or size + len(statement.sql) > self.batch_bytes):
+                    yield batch
+                    batch, size = [], 0
+                batch.append(statement)
+                size += len(statement.sql)
+                continue
+            if batch:
+                yield batch
+                batch, size = [], 0
+            yield [statement]
+        if batch:
+            yield batch
+
+    def _execute(self, cursor, statement):
+        if statement.kind == "other":
+            cursor.execute(statement.sql)
+            # Requête de lecture dans un script : lignes ignorées
+            if cursor.description:
+                cursor.fetchall()
+        else:
+            cursor.execute(statement.sql)
+
+    def run(self, db_manager, text, skip_existing=False, stop_on_error=False):
+        """
+        Générateur d'évènements de progression : start, skip, error, progress puis done
+        (ok, errors, skipped, objects touchés, présence de DDL, durée).
+        """
+        started = time.perf_counter()
+        statements = split_script(text)
+        summary = {"event": "done", "total": len(statements), "ok": 0, "errors": 0, "skipped": 0,
+                   "objects": [], "ddl": False, "stopped": False}
+
+        conn = db_manager.get_connection()
+        if not conn:
+            yield {"event": "error", "error": "Erreur de connexion à la base de données."}
+            summary["errors"] = summary["total"]
+            summary["stopped"] = True
+            yield summary
+            return
+
+        objects = set()
+        try:
+            cursor = conn.cursor()
+            runnable = statements
+            if skip_existing:
+                existing = self._existing_objects(conn)
+                runnable = []
+                for statement in statements:
+                    present = (statement.object_type, statement.object_name) in existing
+                    if statement.action in ("create", "drop") and present:
+                        summary["skipped"] += 1
+                        yield {"event": "skip", "line": statement.line, "object": statement.object_name,
+                               "statement": statement.label()}
+                    else:
+                        runnable.append(statement)
+            yield {"event": "start", "total": len(statements), "to_run": len(runnable), "skipped": summary["skipped"]}
+
+            done = summary["skipped"]
+            for group in self._groups(runnable):
+                failed = []
+                executed = len(group)
+                if group[0].kind == "commit":
+                    conn.commit()
+                elif group[0].kind == "rollback":
+                    conn.rollback()
+                elif len(group) > 1:
+                    try:
+                        cursor.execute("BEGIN\n" + ";\n".join(statement.sql for statement in group) + ";\nEND;")
+                    except Exception:
+                        # Lot annulé par Oracle : rejeu instruction par instruction
+                        for statement in group:
+                            try:
+                                cursor.execute(statement.sql)
+                            except Exception as e:
+                                failed.append((statement, e))
+                                if stop_on_error:
+                                    executed = group.index(statement) + 1
+                                    break
+                else:
+                    try:
+                        self._execute(cursor, group[0])
+                    except Exception as e:
+                        failed.append((group[0], e))
+
+                for statement in group:
+                    if statement.object_name:
+                        objects.add(statement.object_name)
+                    if statement.kind in ("ddl", "plsql"):
+                        summary["ddl"] = True
+                summary["errors"] += len(failed)
+                summary["ok"] += executed - len(failed)
+                done += executed
+                for statement, error in failed:
+                    logger.debug("Script - erreur ligne %s : %s", statement.line, error)
+                    yield {"event": "error", "line": statement.line, "statement": statement.label(), "error": str(error)}
+                if failed and stop_on_error:
+                    conn.rollback()
+                    summary["stopped"] = True
+                    break
+                yield {"event": "progress", "done": done, "total": len(statements),
+                       "ok": summary["ok"], "errors": summary["errors"]}
+            else:
+                conn.commit()
+        except Exception as e:
+            conn.rollback()
+            summary["stopped"] = True
+            yield {"event": "error", "error": str(e)}
+        finally:
+            conn.close()
+
+        summary["objects"] = sorted(objects)
+        summary["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        yield summary
+
+script_runner = ScriptRunner()
+
+def main():
+    parser = argparse.ArgumentParser(description="Exécute un script SQL sur la base configurée (.env).")
+    parser.add_argument("path")
+    parser.add_argument("--skip-existing", action="store_true", help="ne pas supprimer/recréer les objets présents")
+    parser.add_argument("--stop-on-error", action="store_true", help="annuler et arrêter à la première erreur")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    load_dotenv()
+    from db.connection import db_manager
+
+    with open(args.path, "r", encoding="utf-8") as f:
+        text = f.read()
+    summary = None
+    for event in script_runner.run(db_manager, text, args.skip_existing, args.stop_on_error):
+        if event["event"] == "done":
+            summary = event
+        elif event["event"] != "progress" or event["done"] == event["total"]:
+            print(json.dumps(event, ensure_ascii=False))
+        else:
+            print(f"\r{event['done']}/{event['total']} instructions", end="", flush=True)
+    print(json.dumps(summary, ensure_ascii=False))
+    db_manager.close_pool()
+    return 1 if summary["errors"] else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
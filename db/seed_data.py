@@ -1,74 +1,176 @@
 import random
-from faker import Faker
+import os
+import time
 import datetime
+import logging
+from faker import Faker
+
+logger = logging.getLogger(__name__)
+
+# Volumes par défaut (démo). Multipliés par `scale`, ou surchargés table par table.
+DEFAULT_VOLUMES = {"clients": 100, "produits": 20, "commandes": 50, "details": 150}
+# Tables alimentées par run_seeding
+SEED_TABLES = ("CLIENTS", "PRODUITS", "COMMANDES", "DETAILS_COMMANDES")
+DEFAULT_SEED = int(os.getenv("SEED_RANDOM_SEED", "42"))
+BATCH_SIZE = int(os.getenv("SEED_BATCH_SIZE", "5000"))
+# Date de référence des dates générées (YYYY-MM-DD). A fixer pour un jeu identique d'un jour à l'autre.
+REFERENCE_DATE = os.getenv("SEED_REFERENCE_DATE")
+
+CATEGORIES = ['Électronique', 'Vêtements', 'Maison', 'Sport', 'Livres', 'Jouets']
+STATUTS = ['LIVRÉ', 'EN COURS', 'ANNULÉ']
+
+def resolve_volumes(scale=1, overrides=None):
+    """Calcule le nombre de lignes par table à partir du facteur d'échelle et des surcharges."""
+    volumes = {name: max(1, int(count * scale)) for name, count in DEFAULT_VOLUMES.items()}
+    for name, count in (overrides or {}).items():
+        if name in volumes and count is not None:
+            volumes[name] = max(1, int(count))
+    return volumes
+
+def _detail_rng(seed):
+    # Générateur dédié aux lignes de commande : rejoué à l'identique pour calculer
+    # les totaux puis pour insérer les lignes, sans garder les détails en mémoire.
+    return random.Random(f"{seed}-details")
+
+def _iter_details(seed, volumes, prix_produits):
+    rng = _detail_rng(seed)
+    for i in range(1, volumes["details"] + 1):
+        cmd_id = rng.randint(1, volumes["commandes"])
+        prod_id = rng.randint(1, volumes["produits"])
+        qte = rng.randint(1, 3)
+        prix_ligne = round(prix_produits[prod_id - 1] * qte, 2)
+        yield (i, cmd_id, prod_id, qte, prix_ligne)
+
+def _insert_batched(conn, sql, rows, batch_size):
+    """Insère un flux de lignes par paquets avec executemany et variables de liaison."""
+    cursor = conn.cursor()
+    batch = []
+    count = 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            cursor.executemany(sql, batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        cursor.executemany(sql, batch)
+        count += len(batch)
+    conn.commit()
+    return count
 
-fake = Faker(['fr_FR'])
+def run_seeding(db_manager, scale=1, volumes=None, seed=None, batch_size=None):
+    """Exécute le seeding via une seule connexion, par lots de variables liées (executemany)"""
+    volumes = resolve_volumes(scale, volumes)
+    seed = DEFAULT_SEED if seed is None else seed
+    batch_size = batch_size or BATCH_SIZE
+    if REFERENCE_DATE:
+        today = datetime.date.fromisoformat(REFERENCE_DATE)
+    else:
+        today = datetime.date.today()
 
-def run_seeding(db_manager):
-    """Exécute le seeding directement via le db_manager"""
+    # Jeu de données reproductible : même graine -> mêmes lignes
+    rng = random.Random(seed)
+    fake = Faker('fr_FR')
+    fake.seed_instance(seed)
+
+    conn = db_manager.get_connection()
+    if not conn:
+        return False, "Erreur de connexion à la base de données."
+
+    start = time.perf_counter()
+    total_rows = 0
     try:
-        # 1. Nettoyage rapide (facultatif si init_db a été fait)
-        # Mais on va juste ajouter des données
-        
-        # Clients (~100 pour la démo, pour que ce soit rapide)
-        print("Génération des clients...")
-        for i in range(1, 101):
-            nom = fake.last_name().replace("'", "''")
-            prenom = fake.first_name().replace("'", "''")
-            email = fake.unique.email()
-            ville = fake.city().replace("'", "''")
-            date_ins = fake.date_between(start_date='-2y', end_date='today')
-            sql = f"INSERT INTO CLIENTS (CLIENT_ID, NOM, PRENOM, EMAIL, VILLE, DATE_INSCRIPTION) VALUES ({i}, '{nom}', '{prenom}', '{email}', '{ville}', TO_DATE('{date_ins}', 'YYYY-MM-DD'))"
-            db_manager.execute_query(sql)
-        
-        # Produits (~20)
-        print("Génération des produits...")
-        categories = ['Électronique', 'Vêtements', 'Maison', 'Sport', 'Livres', 'Jouets']
-        produits_data = []
-        for i in range(1, 21):
-            libelle = (fake.word().capitalize() + " " + fake.word()).replace("'", "''")
-            cat = random.choice(categories)
-            prix = round(random.uniform(5.0, 500.0), 2)
-            stock = random.randint(10, 100)
-            produits_data.append({'id': i, 'prix': prix})
-            sql = f"INSERT INTO PRODUITS (PRODUIT_ID, LIBELLE, CATEGORIE, PRIX_UNITAIRE, STOCK) VALUES ({i}, '{libelle}', '{cat}', {prix}, {stock})"
-            db_manager.execute_query(sql)
-            
-        # Commandes (~50)
-        print("Génération des commandes...")
-        commandes_ids = []
-        for i in range(1, 51):
-            client_id = random.randint(1, 100)
-            date_cmd = fake.date_between(start_date='-1y', end_date='today')
-            statut = random.choice(['LIVRÉ', 'EN COURS', 'ANNULÉ'])
-            commandes_ids.append(i)
-            sql = f"INSERT INTO COMMANDES (COMMANDE_ID, CLIENT_ID, DATE_COMMANDE, STATUT, MONTANT_TOTAL) VALUES ({i}, {client_id}, TO_DATE('{date_cmd}', 'YYYY-MM-DD'), '{statut}', 0)"
-            db_manager.execute_query(sql)
-            
-        # Détails Commandes (~150)
-        print("Génération des détails...")
-        totals_commande = {i: 0 for i in commandes_ids}
-        for i in range(1, 151):
-            cmd_id = random.choice(commandes_ids)
-            prod = random.choice(produits_data)
-            qte = random.randint(1, 3)
-            prix_ligne = round(prod['prix'] * qte, 2)
+        # Clients
+        logger.info("Génération des clients (%d)...", volumes['clients'])
+        def clients():
+            for i in range(1, volumes["clients"] + 1):
+                nom = fake.last_name()
+                prenom = fake.first_name()
+                # Suffixe numérique : unicité garantie sans le registre de fake.unique
+                email = f"{fake.user_name()}{i}@{fake.free_email_domain()}"
+                yield (i, nom, prenom, email, fake.city(), fake.date_between(start_date=today - datetime.timedelta(days=730), end_date=today))
+        total_rows += _insert_batched(
+            conn,
+            "INSERT INTO CLIENTS (CLIENT_ID, NOM, PRENOM, EMAIL, VILLE, DATE_INSCRIPTION) VALUES (:1, :2, :3, :4, :5, :6)",
+            clients(), batch_size
+        )
+
+        # Produits
+        logger.info("Génération des produits (%d)...", volumes['produits'])
+        prix_produits = []
+        def produits():
+            for i in range(1, volumes["produits"] + 1):
+                libelle = fake.word().capitalize() + " " + fake.word()
+                prix = round(rng.uniform(5.0, 500.0), 2)
+                prix_produits.append(prix)
+                yield (i, libelle, rng.choice(CATEGORIES), prix, rng.randint(10, 100))
+        total_rows += _insert_batched(
+            conn,
+            "INSERT INTO PRODUITS (PRODUIT_ID, LIBELLE, CATEGORIE, PRIX_UNITAIRE, STOCK) VALUES (:1, :2, :3, :4, :5)",
+            produits(), batch_size
+        )
+
+        # Totaux par commande calculés avant l'insertion des commandes : plus d'UPDATE a posteriori
+        totals_commande = [0.0] * (volumes["commandes"] + 1)
+        for _, cmd_id, _, _, prix_ligne in _iter_details(seed, volumes, prix_produits):
             totals_commande[cmd_id] += prix_ligne
-            sql = f"INSERT INTO DETAILS_COMMANDES (DETAIL_ID, COMMANDE_ID, PRODUIT_ID, QUANTITE, PRIX_LIGNE) VALUES ({i}, {cmd_id}, {prod['id']}, {qte}, {prix_ligne})"
-            db_manager.execute_query(sql)
-            
-        # Mise à jour des montants totaux
-        print("Mise à jour des totaux...")
-        for cmd_id, total in totals_commande.items():
-            if total > 0:
-                sql = f"UPDATE COMMANDES SET MONTANT_TOTAL = {round(total, 2)} WHERE COMMANDE_ID = {cmd_id}"
-                db_manager.execute_query(sql)
-        
-        return True, "Base de données alimentée avec succès (100 clients, 20 produits, 50 commandes)!"
+
+        # Commandes
+        logger.info("Génération des commandes (%d)...", volumes['commandes'])
+        def commandes():
+            for i in range(1, volumes["commandes"] + 1):
+                client_id = rng.randint(1, volumes["clients"])
+                date_cmd = fake.date_between(start_date=today - datetime.timedelta(days=365), end_date=today)
+                yield (i, client_id, date_cmd, rng.choice(STATUTS), round(totals_commande[i], 2))
+        total_rows += _insert_batched(
+            conn,
+            "INSERT INTO COMMANDES (COMMANDE_ID, CLIENT_ID, DATE_COMMANDE, STATUT, MONTANT_TOTAL) VALUES (:1, :2, :3, :4, :5)",
+            commandes(), batch_size
+        )
+
+        # Détails Commandes
+        logger.info("Génération des détails (%d)...", volumes['details'])
+        total_rows += _insert_batched(
+            conn,
+            "INSERT INTO DETAILS_COMMANDES (DETAIL_ID, COMMANDE_ID, PRODUIT_ID, QUANTITE, PRIX_LIGNE) VALUES (:1, :2, :3, :4, :5)",
+            _iter_details(seed, volumes, prix_produits), batch_size
+        )
+
+        elapsed = time.perf_counter() - start
+        rows_per_sec = total_rows / elapsed if elapsed > 0 else total_rows
+        logger.info("Seeding terminé : %d lignes en %.2fs (%.0f lignes/s)", total_rows, elapsed, rows_per_sec)
+        return True, (
+            f"Base de données alimentée avec succès ({volumes['clients']} clients, {volumes['produits']} produits, "
+            f"{volumes['commandes']} commandes, {volumes['details']} lignes de commande) "
+            f"en {elapsed:.2f}s ({rows_per_sec:.0f} lignes/s, graine {seed})!"
+        )
     except Exception as e:
+        conn.rollback()
         return False, str(e)
+    finally:
+        conn.close()
 
 if __name__ == "__main__":
-    from connection import db_manager
-    success, msg = run_seeding(db_manager)
+    import argparse
+    import sys
+    # Lancé en script (python db/seed_data.py) : racine du projet dans le chemin pour les imports db.*
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from db.connection import db_manager
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    parser = argparse.ArgumentParser(description="Alimente la base avec des données fictives reproductibles.")
+    parser.add_argument("--scale", type=float, default=1, help="Facteur multiplicateur des volumes par défaut")
+    parser.add_argument("--seed", type=int, default=None, help="Graine aléatoire (jeu de données reproductible)")
+    parser.add_argument("--batch-size", type=int, default=None)
+    for table in DEFAULT_VOLUMES:
+        parser.add_argument(f"--{table}", type=int, default=None, help=f"Nombre de lignes pour {table}")
+    args = parser.parse_args()
+
+    success, msg = run_seeding(
+        db_manager,
+        scale=args.scale,
+        volumes={table: getattr(args, table) for table in DEFAULT_VOLUMES},
+        seed=args.seed,
+        batch_size=args.batch_size
+    )
     print(msg)
@@ -0,0 +1,508 @@
+import logging
+import re
+import threading
+import time
+
+from sqlparse import tokens as T
+from sqlparse.lexer import Lexer
+
+from db.schema_catalog import schema_catalog
+
+logger = logging.getLogger(__name__)
+
+# Fonctions d'agrégat : une expression qui en contient une n'a pas à figurer dans le GROUP BY
+AGGREGATES = {
+    "COUNT", "SUM", "AVG", "MIN", "MAX", "LISTAGG", "STDDEV", "VARIANCE", "MEDIAN",
+    "APPROX_COUNT_DISTINCT", "COLLECT", "CORR", "COVAR_POP", "COVAR_SAMP", "STDDEV_POP",
+    "STDDEV_SAMP", "VAR_POP", "VAR_SAMP", "PERCENTILE_CONT", "PERCENTILE_DISC"
+}
+
+# Équivalents non Oracle de la date courante, toujours écrits avec des parenthèses
+DATE_FUNCTIONS = {"NOW", "GETDATE", "CURDATE", "CURRENT_TIMESTAMP", "CURRENT_DATE", "LOCALTIMESTAMP", "SYSDATE"}
+
+# Mots-clés de niveau 0 qui terminent la liste du GROUP BY
+GROUP_BY_END = {"HAVING", "ORDER BY", "FETCH", "OFFSET", "UNION", "UNION ALL", "INTERSECT", "MINUS", "EXCEPT"}
+
+SIMPLE_IDENTIFIER = re.compile(r'^[A-Za-z][A-Za-z0-9_$#]*$')
+
+def tokenize(sql):
+    """Jetons (type, valeur) du lexer sqlparse, sans regroupement : une passe, quelques dixièmes de ms."""
+    return list(Lexer.get_default_instance().get_tokens(sql))
+
+def join(tokens):
+    return "".join(value for _, value in tokens)
+
+def _is_ws(token):
+    return token[0] in T.Whitespace or token[0] in T.Comment
+
+def _next(tokens, i):
+    i += 1
+    while i < len(tokens) and _is_ws(tokens[i]):
+        i += 1
+    return i if i < len(tokens) else None
+
+def _prev(tokens, i):
+    i -= 1
+    while i >= 0 and _is_ws(tokens[i]):
+        i -= 1
+    return i if i >= 0 else None
+
+def _is_punct(token, value):
+    return token[0] in T.Punctuation and token[1] == value
+
+def _is_keyword(token, *values):
+    return token[0] in T.Keyword and token[1].upper() in values
+
+def _is_name(token):
+    return token[0] in T.Name or token[0] in T.String.Symbol
+
+def _close_paren(tokens, i):
+    depth = 0
+    for j in range(i, len(tokens)):
+        if _is_punct(tokens[j], "("):
+            depth += 1
+        elif _is_punct(tokens[j], ")"):
+            depth -= 1
+            if depth == 0:
+                return j
+    return None
+
+def _open_paren(tokens, i):
+    depth = 0
+    for j in range(i, -1, -1):
+        if _is_punct(tokens[j], ")"):
+            depth += 1
+        elif _is_punct(tokens[j], "("):
+            depth -= 1
+            if depth == 0:
+                return j
+    return None
+
+def _operand_start(tokens, end):
+    """Début de l'opérande qui se termine en `end` : nom qualifié (a.b.c), appel de fonction ou parenthèses."""
+    start = end
+    if _is_punct(tokens[start], ")"):
+        start = _open_paren(tokens, start)
+        if start is None:
+            return None
+        if start > 0 and (_is_name(tokens[start - 1]) or tokens[start - 1][0] in T.Keyword):
+            start -= 1
+    while start >= 2 and _is_punct(tokens[start - 1], ".") and _is_name(tokens[start - 2]):
+        start -= 2
+    return start
+
+def _operand_end(tokens, start):
+    end = start
+    if _is_punct(tokens[end], "("):
+        return _close_paren(tokens, end)
+    while end + 2 < len(tokens) and _is_punct(tokens[end + 1], ".") and _is_name(tokens[end + 2]):
+        end += 2
+    if end + 1 < len(tokens) and _is_punct(tokens[end + 1], "("):
+        return _close_paren(tokens, end + 1)
+    return end
+
+def _split_args(tokens, open_index, close_index):
+    """Arguments (listes de jetons) d'un appel, découpés sur les virgules de premier niveau."""
+    args, current, depth = [], [], 0
+    for token in tokens[open_index + 1:close_index]:
+        if _is_punct(token, "("):
+            depth += 1
+        elif _is_punct(token, ")"):
+            depth -= 1
+        if depth == 0 and _is_punct(token, ","):
+            args.append(current)
+            current = []
+        else:
+            current.append(token)
+    args.append(current)
+    return args
+
+class FixRule:
+    def __init__(self, name, fn, codes, chain, explanation):
+        self.name = name
+        self.fn = fn
+        # None = applicable quelle que soit l'erreur ; sinon codes ORA (5 chiffres) qui la déclenchent
+        self.codes = frozenset(codes) if codes is not None else None
+        # Construction jamais valide en Oracle : réécrite aussi en chaîne, après une autre correction
+        self.chain = chain
+        self.explanation = explanation
+        self.attempts = 0
+        self.hits = 0
+
+    def applies(self, codes, chaining):
+        return self.codes is None or bool(self.codes & codes) or (chaining and self.chain)
+
+class SQLFixer:
+    """
+    Corrections déterministes avant l'appel au modèle. Chaque règle travaille sur les jetons sqlparse
+    (chaînes et commentaires ne sont jamais touchés) et renvoie le SQL réécrit ou None ; les règles
+    sont sélectionnées par code ORA puis enchaînées jusqu'à ce que plus aucune ne modifie la requête.
+    """
+
+    def __init__(self, catalog=None, max_passes=5):
+        self.catalog = catalog if catalog is not None else schema_catalog
+        self.max_passes = max_passes
+        self.rules = []
+        self.calls = 0
+        self.fixed = 0
+        self.total_ms = 0.0
+        self._lock = threading.Lock()
+
+    def rule(self, name, codes=None, chain=False, explanation=""):
+        """Décorateur d'enregistrement : fn(jetons, contexte) -> SQL réécrit ou None."""
+        def register(fn):
+            self.rules.append(FixRule(name, fn, codes, chain, explanation))
+            return fn
+        return register
+
+    def fix(self, sql, error):
+        """Renvoie (sql corrigé, [règles appliquées]) ou None si aucune règle ne s'applique."""
+        start = time.perf_counter()
+        codes = set(re.findall(r'ORA-(\d{5})', error or ""))
+        context = {"error": error or "", "codes": codes, "catalog": self.catalog}
+        current = sql
+        applied = []
+        attempted = set()
+
+        for _ in range(self.max_passes):
+            changed = False
+            for rule in self.rules:
+                if not rule.applies(codes, chaining=bool(applied)):
+                    continue
+                attempted.add(rule)
+                try:
+                    result = rule.fn(tokenize(current), context)
+                except Exception as e:
+                    logger.warning("Règle de correction %s en échec (%s)", rule.name, e)
+                    continue
+                if result and result != current:
+                    current = result
+                    changed = True
+                    if rule not in applied:
+                        applied.append(rule)
+            if not changed:
+                break
+
+        with self._lock:
+            self.calls += 1
+            self.total_ms += (time.perf_counter() - start) * 1000
+            for rule in attempted:
+                rule.attempts += 1
+            for rule in applied:
+                rule.hits += 1
+            if applied:
+                self.fixed += 1
+        if not applied:
+            return None
+        return current, applied
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "fixed_locally": self.fixed,
+                "llm_fallbacks": self.calls - self.fixed,
+                "avg_ms": round(self.total_ms / self.calls, 3) if self.calls else 0.0,
+                "rules": {
+                    rule.name: {
+                        "codes": sorted(rule.codes) if rule.codes is not None else "*",
+                        "attempts": rule.attempts,
+                        "hits": rule.hits,
+                        "hit_rate": round(rule.hits / rule.attempts, 3) if rule.attempts else 0.0
+                    }
+                    for rule in self.rules
+                }
+            }
+
+sql_fixer = SQLFixer()
+
+# ----------------------------------------------------------------------
+# Règles
+# ----------------------------------------------------------------------
+
+@sql_fixer.rule("quoted_identifiers", chain=True,
+                explanation="identifiants `...` / [...] convertis pour Oracle")
+def fix_quoted_identifiers(tokens, context):
+    changed = False
+    for i, (ttype, value) in enumerate(tokens):
+        if ttype in T.Name and len(value) > 2 and (value[0], value[-1]) in (("`", "`"), ("[", "]")):
+            inner = value[1:-1]
+            # Identifiant simple : Oracle le met en majuscules s'il n'est pas entre guillemets
+            tokens[i] = (T.Name, inner.upper() if SIMPLE_IDENTIFIER.match(inner) else f'"{inner}"')
+            changed = True
+    return join(tokens) if changed else None
+
+@sql_fixer.rule("trailing_semicolon", codes=("00911", "00933"), chain=True,
+                explanation="point-virgule final supprimé")
+def fix_trailing_semicolon(tokens, context):
+    end = _prev(tokens, len(tokens))
+    if end is None or not _is_punct(tokens[end], ";"):
+        return None
+    # Un bloc PL/SQL (END;) garde son point-virgule
+    before = _prev(tokens, end)
+    if before is not None and _is_keyword(tokens[before], "END"):
+        return None
+    return join(tokens[:end] + tokens[end + 1:]).rstrip()
+
+@sql_fixer.rule("limit", codes=("00933", "00900", "03049"), chain=True,
+                explanation="LIMIT remplacé par FETCH FIRST (Oracle)")
+def fix_limit(tokens, context):
+    for i, token in enumerate(tokens):
+        if not _is_keyword(token, "LIMIT"):
+            continue
+        count = _next(tokens, i)
+        if count is None or not (tokens[count][0] in T.Number.Integer or tokens[count][0] in T.Name.Placeholder):
+            continue
+        end, offset = count, None
+        after = _next(tokens, count)
+        if after is not None and _is_punct(tokens[after], ","):
+            # Syntaxe MySQL : LIMIT décalage, nombre
+            second = _next(tokens, after)
+            if second is not None and tokens[second][0] in T.Number.Integer:
+                offset, count, end = tokens[count][1], second, second
+        elif after is not None and _is_keyword(tokens[after], "OFFSET"):
+            second = _next(tokens, after)
+            if second is not None and (tokens[second][0] in T.Number.Integer or tokens[second][0] in T.Name.Placeholder):
+                offset, end = tokens[second][1], second
+        n = tokens[count][1]
+        clause = f"OFFSET {offset} ROWS FETCH NEXT {n} ROWS ONLY" if offset else f"FETCH FIRST {n} ROWS ONLY"
+        return join(tokens[:i] + [(T.Keyword, clause)] + tokens[end + 1:])
+    return None
+
+@sql_fixer.rule("date_functions", explanation="NOW() et équivalents remplacés par SYSDATE (Oracle)")
+def fix_date_functions(tokens, context):
+    changed = False
+    i = 0
+    while i < len(tokens):
+        ttype, value = tokens[i]
+        if (ttype in T.Name or ttype in T.Keyword) and value.upper() in DATE_FUNCTIONS:
+            open_index = _next(tokens, i)
+            if open_index is not None and _is_punct(tokens[open_index], "("):
+                close_index = _next(tokens, open_index)
+                if close_index is not None and _is_punct(tokens[close_index], ")"):
+                    tokens[i:close_index + 1] = [(T.Keyword, "SYSDATE")]
+                    changed = True
+        i += 1
+    return join(tokens) if changed else None
+
+@sql_fixer.rule("current_timestamp", codes=("00932",),
+                explanation="CURRENT_TIMESTAMP remplacé par SYSDATE (types DATE)")
+def fix_current_timestamp(tokens, context):
+    # Valide en Oracle mais de type TIMESTAMP WITH TIME ZONE : réécrit seulement sur ORA-00932 (types incompatibles)
+    changed = False
+    for i, (ttype, value) in enumerate(tokens):
+        if (ttype in T.Name or ttype in T.Keyword) and value.upper() in ("CURRENT_TIMESTAMP", "LOCALTIMESTAMP"):
+            tokens[i] = (T.Keyword, "SYSDATE")
+            changed = True
+    return join(tokens) if changed else None
+
+@sql_fixer.rule("concat", codes=("00909",), chain=True,
+                explanation="CONCAT à plus de deux arguments remplacé par ||")
+def fix_concat(tokens, context):
+    for i, (ttype, value) in enumerate(tokens):
+        if not ((ttype in T.Name or ttype in T.Keyword) and value.upper() == "CONCAT"):
+            continue
+        open_index = _next(tokens, i)
+        if open_index is None or not _is_punct(tokens[open_index], "("):
+            continue
+        close_index = _close_paren(tokens, open_index)
+        if close_index is None:
+            return None
+        args = [join(arg).strip() for arg in _split_args(tokens, open_index, close_index)]
+        # CONCAT(a, b) est valide en Oracle
+        if len(args) == 2 or not all(args):
+            continue
+        return join(tokens[:i] + [(T.Text, "(" + " || ".join(args) + ")")] + tokens[close_index + 1:])
+    return None
+
+@sql_fixer.rule("plus_concat", codes=("01722",),
+                explanation="+ entre chaînes remplacé par ||")
+def fix_plus_concat(tokens, context):
+    changed = False
+    for i, token in enumerate(tokens):
+        if not (token[0] in T.Operator and token[1] == "+"):
+            continue
+        before, after = _prev(tokens, i), _next(tokens, i)
+        if before is None or after is None:
+            continue
+        if tokens[before][0] in T.String.Single or tokens[after][0] in T.String.Single:
+            tokens[i] = (T.Operator, "||")
+            changed = True
+    return join(tokens) if changed else None
+
+@sql_fixer.rule("ilike", codes=("00920", "00933", "00907"), chain=True,
+                explanation="ILIKE remplacé par UPPER(...) LIKE UPPER(...)")
+def fix_ilike(tokens, context):
+    for i, (ttype, value) in enumerate(tokens):
+        normalized = " ".join(value.upper().split())
+        if normalized not in ("ILIKE", "NOT ILIKE"):
+            continue
+        left_end, right_start = _prev(tokens, i), _next(tokens, i)
+        if left_end is None or right_start is None:
+            return None
+        left_start = _operand_start(tokens, left_end)
+        right_end = _operand_end(tokens, right_start)
+        if left_start is None or right_end is None:
+            return None
+        operator = "NOT LIKE" if normalized == "NOT ILIKE" else "LIKE"
+        rewritten = f"UPPER({join(tokens[left_start:left_end + 1])}) {operator} UPPER({join(tokens[right_start:right_end + 1])})"
+        return join(tokens[:left_start] + [(T.Text, rewritten)] + tokens[right_end + 1:])
+    return None
+
+@sql_fixer.rule("boolean_literals", codes=("00904", "00920", "00933"),
+                explanation="TRUE/FALSE remplacés par 1/0")
+def fix_boolean_literals(tokens, context):
+    changed = False
+    i = 0
+    while i < len(tokens):
+        if _is_keyword(tokens[i], "TRUE", "FALSE"):
+            number = "1" if tokens[i][1].upper() == "TRUE" else "0"
+            before = _prev(tokens, i)
+            negated = before is not None and _is_keyword(tokens[before], "NOT")
+            is_index = _prev(tokens, before) if negated else before
+            if is_index is not None and _is_keyword(tokens[is_index], "IS"):
+                # x IS [NOT] TRUE -> x = 1 / x <> 1
+                tokens[is_index:i + 1] = [(T.Text, f"{'<>' if negated else '='} {number}")]
+                i = is_index
+            else:
+                tokens[i] = (T.Number.Integer, number)
+            changed = True
+        i += 1
+    return join(tokens) if changed else None
+
+def _select_items(tokens):
+    """Liste SELECT de premier niveau : (début, fin, [éléments]) ou None si la requête ne s'y prête pas."""
+    depth = 0
+    select_index = from_index = None
+    for i, token in enumerate(tokens):
+        if _is_punct(token, "("):
+            depth += 1
+        elif _is_punct(token, ")"):
+            depth -= 1
+        elif depth == 0 and token[0] in T.Keyword.DML and token[1].upper() == "SELECT" and select_index is None:
+            select_index = i
+        elif depth == 0 and select_index is not None and _is_keyword(token, "FROM"):
+            from_index = i
+            break
+    if select_index is None or from_index is None:
+        return None
+
+    start = _next(tokens, select_index)
+    if start is not None and _is_keyword(tokens[start], "DISTINCT", "UNIQUE"):
+        start += 1
+    items = _split_args(tokens, start - 1, from_index)
+    return from_index, items
+
+def _item_expression(item):
+    """Expression d'un élément du SELECT sans son alias."""
+    significant = [k for k, token in enumerate(item) if not _is_ws(token)]
+    if not significant:
+        return []
+    for k in significant:
+        if _is_keyword(item[k], "AS"):
+            return item[:k]
+    last = significant[-1]
+    if len(significant) > 1 and _is_name(item[last]) and _is_ws(item[last - 1]):
+        before = item[significant[-2]]
+        if _is_name(before) or _is_punct(before, ")") or before[0] in T.Literal or _is_keyword(before, "END"):
+            return item[:last]
+    return item
+
+def _normalize(tokens):
+    return "".join(token[1].upper() for token in tokens if not _is_ws(token))
+
+@sql_fixer.rule("group_by", codes=("00979", "00937"),
+                explanation="colonnes non agrégées ajoutées au GROUP BY")
+def fix_group_by(tokens, context):
+    parsed = _select_items(tokens)
+    if parsed is None:
+        return None
+    from_index, items = parsed
+
+    # Cas non traités : fonctions analytiques, opérateurs ensemblistes, SELECT *
+    keywords = {" ".join(value.upper().split()) for ttype, value in tokens if ttype in T.Keyword}
+    if keywords & {"OVER", "UNION", "UNION ALL", "INTERSECT", "MINUS"}:
+        return None
+
+    expressions, has_aggregate = [], False
+    for item in items:
+        expression = _item_expression(item)
+        significant = [token for token in expression if not _is_ws(token)]
+        if not significant:
+            continue
+        if significant[-1][0] in T.Wildcard:
+            return None
+        if any(token[1].upper() in AGGREGATES for token in significant):
+            has_aggregate = True
+            continue
+        if all(token[0] in T.Literal or token[0] in T.Punctuation or token[0] in T.Operator for token in significant):
+            continue
+        expressions.append(join(expression).strip())
+    if not expressions:
+        return None
+
+    # Position du GROUP BY existant (niveau 0) et fin de sa liste (ou de la clause WHERE)
+    depth, group_index, end_index = 0, None, len(tokens)
+    for i in range(from_index, len(tokens)):
+        token = tokens[i]
+        if _is_punct(token, "("):
+            depth += 1
+        elif _is_punct(token, ")"):
+            depth -= 1
+        elif depth == 0 and token[0] in T.Keyword:
+            keyword = " ".join(token[1].upper().split())
+            if keyword == "GROUP BY" and group_index is None:
+                group_index = i
+            elif keyword in GROUP_BY_END:
+                end_index = i
+                break
+        elif depth == 0 and _is_punct(token, ";"):
+            end_index = i
+            break
+
+    if group_index is None:
+        if not has_aggregate:
+            return None
+        head = join(tokens[:end_index]).rstrip()
+        return f"{head}\nGROUP BY {', '.join(expressions)}" + (f"\n{join(tokens[end_index:]).lstrip()}" if end_index < len(tokens) else "")
+
+    existing = {_normalize(arg) for arg in _split_args(tokens, group_index, end_index)}
+    missing = [expr for expr in expressions if _normalize(tokenize(expr)) not in existing]
+    if not missing:
+        return None
+    head = join(tokens[:end_index]).rstrip()
+    tail = join(tokens[end_index:])
+    return f"{head}, {', '.join(missing)}" + (f"\n{tail.lstrip()}" if tail.strip() else "")
+
+def _catalog_names(catalog):
+    """Noms connus (tables, vues, colonnes) : MAJUSCULES -> nom exact."""
+    names = {}
+    for table, obj in catalog.objects.items():
+        names.setdefault(table.upper(), table)
+        for column in obj.get("columns", []):
+            names.setdefault(column["name"].upper(), column["name"])
+    return names
+
+@sql_fixer.rule("identifier_case", codes=("00904", "00942"),
+                explanation="casse et guillemets des identifiants alignés sur le schéma")
+def fix_identifier_case(tokens, context):
+    catalog = context["catalog"]
+    if not catalog.is_loaded():
+        return None
+    names = _catalog_names(catalog)
+    changed = False
+    for i, (ttype, value) in enumerate(tokens):
+        if ttype in T.String.Symbol and value.startswith('"') and value.endswith('"'):
+            inner = value[1:-1]
+            actual = names.get(inner.upper())
+            if actual and actual != inner:
+                # "clients" -> CLIENTS ; un nom créé entre guillemets garde les siens
+                tokens[i] = (T.Name, actual if actual == actual.upper() and SIMPLE_IDENTIFIER.match(actual) else f'"{actual}"')
+                changed = True
+        elif ttype in T.Name and SIMPLE_IDENTIFIER.match(value):
+            actual = names.get(value.upper())
+            # Nom créé en casse mixte ("Nom") : il doit être cité tel quel
+            if actual and actual != actual.upper():
+                tokens[i] = (T.String.Symbol, f'"{actual}"')
+                changed = True
+    return join(tokens) if changed else None
@@ -0,0 +1,94 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+
+# Blancs et commentaires entre deux mots
+_SKIP = r"(?:\s+|--[^\n]*|/\*.*?(?:\*/|\Z))"
+
+# Premier mot de l'instruction, après blancs, commentaires et parenthèses ouvrantes ("(SELECT ...) UNION ...")
+HEAD_RE = re.compile(r"(?:\s+|--[^\n]*|/\*.*?(?:\*/|\Z)|\()*(\w*)", re.S)
+# WITH FUNCTION / WITH PROCEDURE : PL/SQL déclaré dans la requête
+WITH_PLSQL_RE = re.compile(_SKIP + r"*(?:FUNCTION|PROCEDURE)\b", re.S | re.I)
+# Seuls les jetons utiles au contrôle sont reconnus ; le reste du texte est sauté par le moteur de regex.
+# Commentaires, littéraux (y compris q'[...]') et identifiants entre guillemets sont consommés en entier,
+# leur contenu n'est donc jamais pris pour un mot-clé.
+SCAN_RE = re.compile(r"""
+    --[^\n]*
+  | /\*.*?(?:\*/|\Z)
+  | (?<![\w$\#])[nN]?[qQ]'(?:\[.*?\]|\{.*?\}|\(.*?\)|<.*?>|([^\s\[{(<]).*?\1)'
+  | '(?:[^']|'')*(?:'|\Z)
+  | "[^"]*(?:"|\Z)
+  | (?P<end>;)
+  | (?P<lock>\bFOR""" + _SKIP + r"""+UPDATE\b)
+""", re.S | re.I | re.X)
+# Après un point-virgule : seulement d'autres points-virgules, blancs ou commentaires
+TAIL_RE = re.compile(r"(?:\s+|--[^\n]*|/\*.*?(?:\*/|\Z)|;)*", re.S)
+
+class SQLSafety:
+    """
+    Contrôle des requêtes de l'éditeur en une passe sur le texte : une seule instruction, de lecture
+    (SELECT, WITH, requête entre parenthèses), sans FOR UPDATE ni fonction PL/SQL dans WITH. Les mots
+    présents dans les littéraux, identifiants entre guillemets et commentaires sont ignorés.
+    Verdicts mis en cache par empreinte du texte SQL (SQL_SAFETY_CACHE_SIZE).
+    """
+
+    def __init__(self, cache_size=None):
+        self.cache_size = cache_size or int(os.getenv("SQL_SAFETY_CACHE_SIZE", "1024"))
+        self._cache = OrderedDict()  # empreinte SHA-1 -> message d'erreur ou None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+
+    def classify(self, sql):
+        """Renvoie None si la requête est une lecture autorisée, sinon le motif du refus."""
+        head = HEAD_RE.match(sql)
+        statement = head.group(1).upper()
+        if not statement:
+            return "Sécurité : Seules les requêtes de lecture (SELECT, WITH) sont autorisées dans cet éditeur."
+        if statement not in ("SELECT", "WITH"):
+            return f"Sécurité : L'instruction '{statement}' n'est pas autorisée dans cet éditeur."
+        if statement == "WITH" and WITH_PLSQL_RE.match(sql, head.end()):
+            return "Sécurité : Les fonctions PL/SQL dans WITH ne sont pas autorisées dans cet éditeur."
+        for match in SCAN_RE.finditer(sql, head.end()):
+            if match.group("end"):
+                if not TAIL_RE.fullmatch(sql, match.end()):
+                    return "Sécurité : Une seule instruction est autorisée par exécution."
+                return None
+            if match.group("lock"):
+                return "Sécurité : SELECT ... FOR UPDATE (verrouillage de lignes) n'est pas autorisé dans cet éditeur."
+        return None
+
+    def check(self, sql):
+        key = hashlib.sha1(sql.encode("utf-8")).digest()
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                error = self._cache[key]
+                if error:
+                    self.rejected += 1
+                return error
+            self.misses += 1
+        error = self.classify(sql)
+        with self._lock:
+            self._cache[key] = error
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            if error:
+                self.rejected += 1
+        return error
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "cache_entries": len(self._cache),
+                "cache_size": self.cache_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "rejected": self.rejected
+            }
+
+sql_safety = SQLSafety()
@@ -0,0 +1,41 @@
+from sqlparse import tokens as T
+from sqlparse.lexer import Lexer
+
+def normalize_sql(sql):
+    """
+    Forme canonique d'une requête pour les clés de cache : commentaires retirés, blancs réduits à un espace,
+    mots-clés et noms non cités en majuscules (Oracle ne les distingue pas), point-virgule final retiré.
+    Les littéraux et identifiants entre guillemets sont conservés tels quels.
+    """
+    parts = []
+    pending_space = False
+    for ttype, value in Lexer.get_default_instance().get_tokens(sql):
+        if ttype in T.Comment or ttype in T.Whitespace:
+            pending_space = True
+            continue
+        # Ponctuation : "f( a ,b )" et "f(a, b)" donnent la même forme
+        if parts and value not in (",", ")", ".") and parts[-1] not in ("(", ".") and (pending_space or parts[-1] == ","):
+            parts.append(" ")
+        pending_space = False
+        if ttype in T.Keyword:
+            # Mots-clés composés ("ORDER  BY") : un seul espace
+            value = " ".join(value.upper().split())
+        elif ttype in T.Name and ttype not in T.Name.Placeholder and value[:1] not in ('"', '`', '['):
+            value = value.upper()
+        parts.append(value)
+    while parts and parts[-1] in (";", " "):
+        parts.pop()
+    return "".join(parts)
+
+def referenced_names(sql):
+    """
+    Noms cités par la requête (tables, vues, colonnes, alias, mots-clés), en majuscules sauf entre guillemets.
+    Sur-ensemble des objets lus : suffisant pour invalider un cache par table sans analyser la clause FROM.
+    """
+    names = set()
+    for ttype, value in Lexer.get_default_instance().get_tokens(sql):
+        if ttype in T.Literal.String.Symbol or (ttype in T.Name and value[:1] in ('`', '[')):
+            names.add(value[1:-1])
+        elif ttype in T.Keyword or (ttype in T.Name and ttype not in T.Name.Placeholder):
+            names.add(value.upper())
+    return names
@@ -0,0 +1,367 @@
+import os
+import random
+
+import numpy as np
+import oracledb
+import pandas as pd
+
+TOP_K = 5
+
+# Types Oracle pour le calcul des stats côté base (les LOB, LONG et objets sont ignorés)
+ORACLE_NUMERIC_TYPES = {
+    oracledb.DB_TYPE_NUMBER, oracledb.DB_TYPE_BINARY_FLOAT, oracledb.DB_TYPE_BINARY_DOUBLE,
+    oracledb.DB_TYPE_BINARY_INTEGER
+}
+ORACLE_DATE_TYPES = {
+    oracledb.DB_TYPE_DATE, oracledb.DB_TYPE_TIMESTAMP, oracledb.DB_TYPE_TIMESTAMP_TZ,
+    oracledb.DB_TYPE_TIMESTAMP_LTZ
+}
+ORACLE_SKIPPED_TYPES = {
+    oracledb.DB_TYPE_CLOB, oracledb.DB_TYPE_NCLOB, oracledb.DB_TYPE_BLOB, oracledb.DB_TYPE_BFILE,
+    oracledb.DB_TYPE_LONG, oracledb.DB_TYPE_LONG_NVARCHAR, oracledb.DB_TYPE_LONG_RAW, oracledb.DB_TYPE_OBJECT,
+    oracledb.DB_TYPE_JSON, oracledb.DB_TYPE_XMLTYPE, oracledb.DB_TYPE_VECTOR, oracledb.DB_TYPE_CURSOR
+}
+
+_UINT64_MASK = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+def _bit_length(values):
+    """Longueur en bits de chaque entier d'un tableau uint64 (recherche dichotomique vectorisée)."""
+    length = np.zeros(values.shape, dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        high = values >= (np.uint64(1) << np.uint64(shift))
+        values = np.where(high, values >> np.uint64(shift), values)
+        length += high * shift
+    return length + (values > 0)
+
+def _hash_index(index, kind):
+    """Hash 64 bits vectorisé des valeurs distinctes d'un paquet."""
+    values = index.to_numpy()
+    if kind == "numeric":
+        # 5 et 5.0 doivent tomber sur le même hash d'un paquet à l'autre
+        return pd.util.hash_array(values.astype(np.float64))
+    if kind == "date":
+        return pd.util.hash_array(values.astype("datetime64[ns]").view(np.int64))
+    return pd.util.hash_array(values.astype(object), categorize=False)
+
+def _column_kind(series):
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return "numeric"
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return "date"
+    return "string"
+
+class HyperLogLog:
+    """Estimation du nombre de valeurs distinctes en mémoire constante (2^p registres)."""
+
+    def __init__(self, precision=14):
+        self.p = precision
+        self.m = 1 << precision
+        self.registers = np.zeros(self.m, dtype=np.uint8)
+
+    def add_hashes(self, hashes):
+        if not len(hashes):
+            return
+        index = (hashes >> np.uint64(64 - self.p)).astype(np.int64)
+        rest = (hashes << np.uint64(self.p)) & _UINT64_MASK
+        rank = np.minimum(64 - _bit_length(rest) + 1, 64 - self.p + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def count(self):
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m * self.m / np.sum(np.power(2.0, -self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * self.m and zeros:
+            # Correction petites cardinalités (linear counting)
+            estimate = self.m * np.log(self.m / zeros)
+        return int(round(estimate))
+
+class FrequentItems:
+    """
+    Résumé fusionnable des valeurs fréquentes (Misra-Gries) : au plus `capacity` compteurs,
+    chaque comptage est sous-estimé d'au plus N / (capacity + 1).
+    """
+
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self.counts = pd.Series(dtype=np.int64)
+
+    def add(self, value_counts):
+        candidates = value_counts.nlargest(self.capacity + 1)
+        merged = candidates if self.counts.empty else self.counts.add(candidates, fill_value=0)
+        if len(merged) > self.capacity:
+            # Décrément Misra-Gries : on retire le (capacity + 1)-ième comptage à tous
+            threshold = merged.nlargest(self.capacity + 1).iloc[-1]
+            merged = merged[merged > threshold] - threshold
+        self.counts = merged.astype(np.int64)
+
+    def top(self, k=TOP_K):
+        return list(self.counts.nlargest(k).items())
+
+class ColumnAccumulator:
+    """
+    Statistiques d'une colonne alimentées par paquets de valeurs, un seul value_counts par passe.
+    Les valeurs sont conservées (calcul exact) jusqu'au seuil, puis résumées paquet par paquet
+    (HyperLogLog pour les distincts, Misra-Gries pour le top) pour garder une mémoire bornée.
+    """
+
+    def __init__(self, name, sketch_threshold, batch_size=50000):
+        self.name = name
+        self.sketch_threshold = sketch_threshold
+        self.batch_size = batch_size
+        self.rows = 0
+        self.buffer = []
+        self.hll = None
+        self.frequent = None
+        self.nulls = 0
+        self.kinds = set()
+        self.min = None
+        self.max = None
+        self.total = 0.0
+
+    @property
+    def approximate(self):
+        return self.hll is not None
+
+    def update(self, values):
+        self.rows += len(values)
+        self.buffer.extend(values)
+        if self.hll is None:
+            if self.rows <= self.sketch_threshold:
+                return
+            self.hll = HyperLogLog()
+            self.frequent = FrequentItems()
+        # Résumé par lots : le coût fixe de pandas est amorti sur des paquets de curseur plus petits
+        if len(self.buffer) >= self.batch_size or len(self.buffer) == self.rows:
+            self._flush()
+
+    def _flush(self):
+        if self.buffer:
+            self._summarize(*self._value_counts(self.buffer))
+            self.buffer = []
+
+    def _value_counts(self, values):
+        series = pd.Series(values)
+        counts = series.value_counts(dropna=False)
+        null_mask = counts.index.isna()
+        nulls = int(counts[null_mask].sum()) if null_mask.any() else 0
+        return counts[~null_mask], nulls, _column_kind(series)
+
+    def _summarize(self, counts, nulls, kind):
+        self.nulls += nulls
+        if counts.empty:
+            return
+        self.kinds.add(kind)
+        self.hll.add_hashes(_hash_index(counts.index, kind))
+        self.frequent.add(counts)
+        if kind == "numeric":
+            low, high = counts.index.min(), counts.index.max()
+            self.min = low if self.min is None or low < self.min else self.min
+            self.max = high if self.max is None or high > self.max else self.max
+            self.total += float(np.dot(counts.index.to_numpy(dtype=np.float64), counts.to_numpy(dtype=np.float64)))
+
+    def result(self, scale=1.0):
+        """Dictionnaire au format de l'API ; `scale` extrapole les comptages d'un échantillon."""
+        if self.hll is None:
+            counts, nulls, dtype = self._value_counts(self.buffer)
+            unique_count = len(counts)
+            top = list(counts.head(TOP_K).items())
+            low = high = mean = None
+            if dtype == "numeric" and unique_count:
+                low, high = counts.index.min(), counts.index.max()
+                weights = counts.to_numpy(dtype=np.float64)
+                mean = float(np.dot(counts.index.to_numpy(dtype=np.float64), weights) / weights.sum())
+        else:
+            self._flush()
+            nulls = self.nulls
+            unique_count = self.hll.count()
+            top = self.frequent.top()
+            dtype = next(iter(self.kinds)) if len(self.kinds) == 1 else "string"
+            low, high = self.min, self.max
+            non_null = self.rows - self.nulls
+            mean = self.total / non_null if dtype == "numeric" and non_null else None
+
+        stats = {
+            "column": self.name,
+            "type": dtype,
+            "null_count": int(round(nulls * scale)),
+            "null_percentage": round((nulls / self.rows) * 100, 1) if self.rows else 0.0,
+            "unique_count": int(unique_count),
+            "top_values": [{
+                "value": str(value),
+                "count": int(round(count * scale)),
+                "percentage": round((count / self.rows) * 100, 1)
+            } for value, count in top],
+            "min": str(low) if dtype == "numeric" else None,
+            "max": str(high) if dtype == "numeric" else None,
+            "mean": mean
+        }
+        if self.approximate or scale != 1.0:
+            stats["approximate"] = True
+        return stats
+
+class StatsAccumulator:
+    """Statistiques de toutes les colonnes d'un résultat, alimentées par paquets de lignes du curseur."""
+
+    def __init__(self, columns, sketch_threshold=None):
+        self.columns = columns
+        self.sketch_threshold = sketch_threshold or int(os.getenv("STATS_SKETCH_THRESHOLD", "100000"))
+        # Lots de résumé pas plus grands que le seuil : au plus ~2 x seuil valeurs en mémoire par colonne
+        batch_size = min(50000, self.sketch_threshold)
+        self.accumulators = [ColumnAccumulator(col, self.sketch_threshold, batch_size) for col in columns]
+        self.rows = 0
+
+    def update(self, rows):
+        if not rows:
+            return
+        self.rows += len(rows)
+        # Transposition lignes -> colonnes sans DataFrame intermédiaire
+        for accumulator, values in zip(self.accumulators, zip(*rows)):
+            accumulator.update(values)
+
+    def result(self, total_rows=None):
+        if not self.rows:
+            return []
+        scale = (total_rows / self.rows) if total_rows else 1.0
+        return [accumulator.result(scale=scale) for accumulator in self.accumulators]
+
+def sample_rows(data, sample_size, seed=0):
+    """Échantillon aléatoire reproductible, dans l'ordre d'origine."""
+    indexes = sorted(random.Random(seed).sample(range(len(data)), sample_size))
+    return [data[i] for i in indexes]
+
+def compute_stats(columns, data, sample_size=None, chunk_size=50000):
+    """
+    Statistiques par colonne (nulls, distincts, top 5, min/max/moyenne) d'un résultat complet.
+    `sample_size` limite le calcul à un échantillon aléatoire ; les comptages sont alors extrapolés.
+    """
+    if not data:
+        return []
+    sample_size = int(sample_size if sample_size is not None else os.getenv("STATS_SAMPLE_SIZE", "0"))
+
+    total_rows = None
+    if sample_size and len(data) > sample_size:
+        total_rows = len(data)
+        data = sample_rows(data, sample_size)
+
+    accumulator = StatsAccumulator(columns)
+    for start in range(0, len(data), chunk_size):
+        accumulator.update(data[start:start + chunk_size])
+    return accumulator.result(total_rows=total_rows)
+
+def _pushdown_kind(type_code):
+    if type_code in ORACLE_SKIPPED_TYPES:
+        return None
+    if type_code in ORACLE_NUMERIC_TYPES:
+        return "numeric"
+    if type_code in ORACLE_DATE_TYPES:
+        return "date"
+    return "string"
+
+def build_pushdown_sql(sql, kinds, approximate=True, top_k=TOP_K):
+    """
+    Une seule requête UNION ALL : par colonne, une ligne de synthèse ('S') et jusqu'à top_k lignes ('T').
+    Les colonnes du SELECT utilisateur sont renommées C1..Cn (noms en double ou expressions sans alias).
+    """
+    aliases = [f"C{i + 1}" for i in range(len(kinds))]
+    branches = []
+    for i, (alias, kind) in enumerate(zip(aliases, kinds)):
+        if kind is None:
+            continue
+        distinct = f"APPROX_COUNT_DISTINCT({alias})" if approximate else f"COUNT(DISTINCT {alias})"
+        if kind == "numeric":
+            low, high, mean = f"MIN({alias})", f"MAX({alias})", f"AVG({alias})"
+            top_number, top_text = alias, "CAST(NULL AS VARCHAR2(4000))"
+        else:
+            low = high = mean = "CAST(NULL AS NUMBER)"
+            label = f"TO_CHAR({alias}, 'YYYY-MM-DD HH24:MI:SS')" if kind == "date" else f"TO_CHAR({alias})"
+            top_number, top_text = "CAST(NULL AS NUMBER)", label
+        branches.append(
+            f"SELECT {i} AS col_idx, 'S' AS row_kind, COUNT(*) AS total_rows, COUNT({alias}) AS non_null, "
+            f"{distinct} AS distinct_count, {low} AS min_value, {high} AS max_value, {mean} AS avg_value, "
+            f"CAST(NULL AS NUMBER) AS top_number, CAST(NULL AS VARCHAR2(4000)) AS top_text, "
+            f"CAST(NULL AS NUMBER) AS top_count FROM q"
+        )
+        branches.append(
+            f"SELECT {i}, 'T', NULL, NULL, NULL, NULL, NULL, NULL, top_number, top_text, top_count FROM ("
+            f"SELECT {top_number} AS top_number, {top_text} AS top_text, COUNT(*) AS top_count FROM q "
+            f"WHERE {alias} IS NOT NULL GROUP BY {alias} ORDER BY top_count DESC FETCH FIRST {int(top_k)} ROWS ONLY)"
+        )
+    if not branches:
+        return None
+    # MATERIALIZE : la requête utilisateur n'est évaluée qu'une fois pour toutes les branches
+    return (
+        f"WITH src ({', '.join(aliases)}) AS ({sql}), "
+        f"q AS (SELECT /*+ MATERIALIZE */ * FROM src) "
+        + " UNION ALL ".join(branches)
+    )
+
+def compute_stats_pushdown(db_manager, sql, approximate=None, tracker=None):
+    """
+    Statistiques calculées par Oracle sur tout le résultat, en un aller-retour.
+    Renvoie ({"stats": [...], "row_count": n}, erreur). `tracker` : même délai et annulation que la requête.
+    """
+    if approximate is None:
+        approximate = os.getenv("STATS_PUSHDOWN_APPROX", "1") == "1"
+    conn = db_manager.get_connection()
+    if not conn:
+        return None, "Erreur de connexion à la base de données."
+    error = None
+    try:
+        if tracker is not None:
+            tracker.attach(conn)
+        cursor = conn.cursor()
+        # Description des colonnes sans exécuter la requête
+        cursor.parse(sql)
+        if not cursor.description:
+            return None, "Les statistiques côté base sont réservées aux requêtes SELECT."
+        columns = [col[0] for col in cursor.description]
+        kinds = [_pushdown_kind(col[1]) for col in cursor.description]
+
+        stats_sql = build_pushdown_sql(sql, kinds, approximate)
+        if stats_sql is None:
+            return {"stats": [], "row_count": None}, None
+        cursor.arraysize = 1000
+        cursor.execute(stats_sql)
+        rows = cursor.fetchall()
+    except Exception as e:
+        error = e
+        return None, tracker.error_message(e) if tracker is not None else str(e)
+    finally:
+        db_manager._release(conn, tracker, error)
+
+    summaries = {}
+    tops = {}
+    for col_idx, row_kind, total, non_null, distinct, low, high, mean, top_number, top_text, top_count in rows:
+        if row_kind == "S":
+            summaries[col_idx] = (total, non_null, distinct, low, high, mean)
+        else:
+            value = top_number if kinds[col_idx] == "numeric" else top_text
+            tops.setdefault(col_idx, []).append((value, top_count))
+
+    stats = []
+    row_count = None
+    for i, (column, kind) in enumerate(zip(columns, kinds)):
+        if i not in summaries:
+            continue
+        total, non_null, distinct, low, high, mean = summaries[i]
+        row_count = total
+        nulls = total - non_null
+        top = sorted(tops.get(i, []), key=lambda item: -item[1])
+        stats.append({
+            "column": column,
+            "type": kind,
+            "null_count": int(nulls),
+            "null_percentage": round((nulls / total) * 100, 1) if total else 0.0,
+            "unique_count": int(distinct or 0),
+            "top_values": [{
+                "value": str(value),
+                "count": int(count),
+                "percentage": round((count / total) * 100, 1) if total else 0.0
+            } for value, count in top],
+            "min": str(low) if kind == "numeric" and low is not None else None,
+            "max": str(high) if kind == "numeric" and high is not None else None,
+            "mean": float(mean) if mean is not None else None
+        })
+        if approximate:
+            stats[-1]["approximate"] = True
+    return {"stats": stats, "row_count": row_count}, None
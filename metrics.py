@@ -0,0 +1,182 @@
+"""
+Mesures par requête : durée de chaque phase (prompt, file IA, génération, connexion, exécution, lecture,
+stats, sérialisation...), histogrammes au format Prometheus (GET /metrics) et en-tête Server-Timing.
+
+Phases : prompt, queue_wait (file IA), ttft (premier jeton), generation, sql_parse (contrôle, analyse et
+formatage du SQL), db_connect, explain, db_execute, db_fetch, stats, serialize (JSON).
+
+Les durées de la requête en cours sont rangées dans une variable de contexte : les phases exécutées par un
+worker de la file IA (contexte copié à la soumission) ou via asyncio.to_thread sont rattachées à la requête.
+"""
+import contextlib
+import contextvars
+import threading
+import time
+
+# Bornes des histogrammes (secondes) : de 0,5 ms (cache, sérialisation) à 1 min (génération)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_timings = contextvars.ContextVar("request_timings", default=None)
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # valeurs des labels -> [comptes par borne..., somme, total]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted(self._series.items())
+            series = [(labels, list(values)) for labels, values in series]
+        for labels, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {values[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(values[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {values[-1]}")
+        return lines
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+class Metrics:
+    """Registre du processus : histogrammes de phases et de requêtes HTTP, compteurs et jauges calculées à la lecture."""
+
+    def __init__(self, prefix="sqlia"):
+        self.prefix = prefix
+        self.phase_seconds = Histogram(f"{prefix}_phase_seconds", "Durée des phases de traitement (secondes)", ("phase",))
+        self.request_seconds = Histogram(f"{prefix}_http_request_duration_seconds", "Durée des requêtes HTTP (secondes)", ("method", "route"))
+        self.requests_total = Counter(f"{prefix}_http_requests_total", "Requêtes HTTP traitées", ("method", "route", "status"))
+        self._gauges = []  # (nom, description, fonction) : valeur lue au moment de l'export
+
+    # --- Requête en cours ---
+    def start_request(self):
+        """Nouvelles mesures pour la requête du contexte courant ; renvoie le dictionnaire phase -> secondes."""
+        timings = {}
+        _timings.set(timings)
+        return timings
+
+    def current(self):
+        return _timings.get()
+
+    def record(self, phase, seconds):
+        self.phase_seconds.observe(seconds, phase)
+        timings = _timings.get()
+        if timings is not None:
+            # Plusieurs occurrences dans une requête (paquets lus en streaming...) : durées cumulées
+            timings[phase] = timings.get(phase, 0.0) + seconds
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def server_timing(self, timings, total=None):
+        """Valeur de l'en-tête Server-Timing (durées en millisecondes)."""
+        entries = [f"{phase};dur={seconds * 1000:.2f}" for phase, seconds in timings.items()]
+        if total is not None:
+            entries.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(entries)
+
+    def observe_request(self, method, route, status, seconds):
+        self.request_seconds.observe(seconds, method, route)
+        self.requests_total.inc(method, route, str(status))
+
+    # --- Export ---
+    def gauge(self, name, documentation, fn):
+        self._gauges.append((f"{self.prefix}_{name}", documentation, fn))
+
+    def render(self):
+        """Texte au format d'exposition Prometheus (version 0.0.4)."""
+        lines = self.phase_seconds.collect() + self.request_seconds.collect() + self.requests_total.collect()
+        for name, documentation, fn in self._gauges:
+            try:
+                value = fn()
+            except Exception:
+                continue
+            if value is None:
+                continue
+            lines += [f"# HELP {name} {documentation}", f"# TYPE {name} gauge", f"{name} {_format_value(value)}"]
+        return "\n".join(lines) + "\n"
+
+    def instrument_flask(self, app):
+        """Mesures de chaque requête Flask : durée par route, en-tête Server-Timing et sérialisation JSON."""
+        from flask import g, request
+        from flask.json.provider import DefaultJSONProvider
+
+        registry = self
+
+        class TimedJSONProvider(DefaultJSONProvider):
+            def dumps(self, obj, **kwargs):
+                with registry.phase("serialize"):
+                    return super().dumps(obj, **kwargs)
+
+        app.json = TimedJSONProvider(app)
+
+        @app.before_request
+        def start_timing():
+            g.request_started = time.perf_counter()
+            g.request_timings = registry.start_request()
+
+        @app.after_request
+        def add_server_timing(response):
+            started = g.get("request_started")
+            if started is None:
+                return response
+            elapsed = time.perf_counter() - started
+            # Réponse en streaming : seules les phases terminées avant l'envoi des en-têtes y figurent
+            response.headers["Server-Timing"] = registry.server_timing(g.request_timings, elapsed)
+            route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            registry.observe_request(request.method, route, response.status_code, elapsed)
+            return response
+
+metrics = Metrics()
@@ -0,0 +1,129 @@
+import asyncio
+import json
+import logging
+import time
+
+from metrics import metrics
+from models.llm_handler import llm, StreamingResponseParser
+from models.llm_queue import llm_queue, QueueFullError
+
+logger = logging.getLogger(__name__)
+
+class AsyncLLMHandler:
+    """
+    Variante asynchrone des appels Ollama pour le mode ASGI (asgi.py). Les appels passent par la même
+    file que le mode synchrone (models/llm_queue.py) : la boucle d'événements attend le Future du job
+    sans bloquer de thread. Le streaming réserve un worker de la file et lit Ollama via httpx.
+    """
+
+    def __init__(self, handler=None, queue=None):
+        self.handler = handler or llm
+        self.queue = queue or llm_queue
+        self._client = None
+
+    def _get_client(self):
+        if self._client is None:
+            import httpx
+            # Mêmes timeouts et reprises (connexion) que le client synchrone OllamaClient
+            ollama = self.handler.client
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(ollama.read_timeout, connect=ollama.connect_timeout),
+                limits=httpx.Limits(max_connections=self.queue.workers * 2),
+                transport=httpx.AsyncHTTPTransport(retries=ollama.retries)
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def wait(self, job):
+        """Attend le résultat d'un job ; shield : un client parti n'annule pas un job partagé."""
+        future = asyncio.wrap_future(job.future)
+        return await asyncio.wait_for(asyncio.shield(future), timeout=self.queue.wait_timeout)
+
+    async def generate_sql(self, user_query, mode="editor"):
+        """Lève QueueFullError si la file est pleine."""
+        # Cache (éventuellement SQLite) et construction de la clé hors de la boucle d'événements
+        job, result = await asyncio.to_thread(self.handler.submit_generation, user_query, mode)
+        if job is None:
+            return result
+        try:
+            return await self.wait(job)
+        except asyncio.TimeoutError:
+            return "Error: Délai d'attente de la file IA dépassé"
+
+    async def generate_sql_stream(self, user_query, mode="editor"):
+        """Même séquence d'événements que LLMHandler.generate_sql_stream, en générateur asynchrone."""
+        handler = self.handler
+        if handler.is_invalid_query(user_query):
+            yield {"event": "done", "sql": "INVALID_QUERY", "explanation": "Erreur ou requête invalide."}
+            return
+
+        key = await asyncio.to_thread(handler.cache_key, user_query, mode)
+        cached = await asyncio.to_thread(handler.cache.get, key)
+        if cached is not None:
+            yield {"event": "done", "sql": cached.get("sql", ""), "explanation": cached.get("explanation", "Voici votre requête."), "cached": True}
+            return
+
+        payload = {
+            "model": handler.model_name,
+            "prompt": await asyncio.to_thread(handler.build_prompt, user_query, mode),
+            "stream": True,
+            "keep_alive": handler.keep_alive,
+            "options": {
+                "temperature": 0
+            }
+        }
+
+        try:
+            _, granted, release = self.queue.hold_slot(handler.priority(mode), kind="stream")
+        except QueueFullError as e:
+            yield {"event": "error", "error": str(e), "retry_after": e.retry_after}
+            return
+        try:
+            await asyncio.wait_for(asyncio.wrap_future(granted), timeout=self.queue.wait_timeout)
+            logger.debug("Envoi à Ollama en streaming (%s) [Mode: %s, async]...", handler.model_name, mode)
+            started = time.perf_counter()
+            first_token = True
+            # Sortie du bloc (client déconnecté compris) : la connexion est fermée, Ollama s'arrête
+            async with self._get_client().stream("POST", handler.client.generate_url, json=payload) as response:
+                response.raise_for_status()
+                parser = StreamingResponseParser()
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    token = chunk.get("response", "")
+                    if token:
+                        if first_token:
+                            first_token = False
+                            metrics.record("ttft", time.perf_counter() - started)
+                        yield {"event": "token", "token": token}
+                        for event in parser.feed(token):
+                            yield event
+                    if chunk.get("done"):
+                        break
+
+            for event in parser.flush():
+                yield event
+            metrics.record("generation", time.perf_counter() - started)
+            raw = parser.text.strip()
+            logger.debug("Réponse brute Ollama (stream): %s", raw)
+            result = handler.parse_response(raw)
+            if isinstance(result, str):
+                yield {"event": "done", "sql": result, "explanation": "Erreur ou requête invalide."}
+            else:
+                await asyncio.to_thread(handler.cache.set, key, result, handler.get_schema_version())
+                yield {"event": "done", "sql": result.get("sql", ""), "explanation": result.get("explanation", "Voici votre requête.")}
+        except asyncio.TimeoutError:
+            yield {"event": "error", "error": "Error: Délai d'attente de la file IA dépassé"}
+        except Exception as e:
+            err_msg = f"Error: Impossible de contacter Ollama ({str(e)})"
+            logger.error(err_msg)
+            yield {"event": "error", "error": err_msg}
+        finally:
+            release()
+
+async_llm = AsyncLLMHandler()
@@ -0,0 +1,242 @@
+import concurrent.futures
+import logging
+import math
+import os
+import threading
+import time
+
+from models.llm_handler import llm
+from models.llm_queue import llm_queue
+from db.explain import explain_gate
+from db.sql_safety import sql_safety
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class CandidateGenerator:
+    """
+    Génération multi-candidats ({"candidates": N} sur /api/generate, ou GENERATION_CANDIDATES) : N réponses du
+    modèle demandées en parallèle sur le même prompt (préfixe partagé dans le cache KV d'Ollama), la première à
+    température 0, les suivantes à des températures et graines différentes. Chaque candidat est validé sans être
+    exécuté (contrôle de sécurité, puis EXPLAIN PLAN) et le candidat valide de plus faible coût estimé est retenu.
+    L'ensemble forme un seul job de la file IA ; les candidats sans réponse après GENERATION_CANDIDATES_BUDGET
+    secondes sont ignorés. Prévoir OLLAMA_NUM_PARALLEL >= N pour que les candidats soient réellement simultanés.
+    """
+
+    def __init__(self, handler=None, queue=None, count=None, max_count=None, budget=None, max_temperature=None):
+        self.handler = handler or llm
+        self.queue = queue or llm_queue
+        # 1 = un seul candidat (génération classique)
+        self.count = count or int(os.getenv("GENERATION_CANDIDATES", "1"))
+        self.max_count = max_count or int(os.getenv("GENERATION_CANDIDATES_MAX", "5"))
+        self.budget = budget or float(os.getenv("GENERATION_CANDIDATES_BUDGET", "20"))
+        # Températures réparties de 0 (premier candidat) à ce maximum
+        self.max_temperature = max_temperature if max_temperature is not None else float(os.getenv("GENERATION_CANDIDATES_TEMPERATURE", "0.8"))
+
+        self._executor = None
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.validated = 0      # un candidat valide a été trouvé
+        self.not_baseline = 0   # ... et ce n'est pas celui à température 0
+        self.timeouts = 0       # candidats abandonnés (budget dépassé)
+
+    def resolve_count(self, requested=None):
+        """Nombre de candidats demandé (ou configuré), borné par GENERATION_CANDIDATES_MAX. Lève ValueError."""
+        if requested in (None, ""):
+            return max(1, min(self.count, self.max_count))
+        try:
+            if isinstance(requested, bool):
+                raise ValueError
+            count = int(requested)
+        except (TypeError, ValueError):
+            raise ValueError(f"candidates={requested!r} (entier attendu)")
+        return max(1, min(count, self.max_count))
+
+    def resolve_budget(self, requested=None):
+        """Budget (s) demandé, sans dépasser GENERATION_CANDIDATES_BUDGET. Lève ValueError."""
+        if requested in (None, ""):
+            return self.budget
+        try:
+            # 0, négatif ou nan : as_completed expirerait aussitôt, les appels Ollama continuant en arrière-plan
+            if isinstance(requested, bool) or not math.isfinite(float(requested)) or float(requested) <= 0:
+                raise ValueError
+        except (TypeError, ValueError):
+            raise ValueError(f"budget={requested!r} (nombre de secondes positif attendu)")
+        return min(float(requested), self.budget)
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    # Un job de la file occupe au plus max_count threads
+                    self._executor = concurrent.futures.ThreadPoolExecutor(
+                        max_workers=self.max_count * self.queue.workers, thread_name_prefix="llm-candidate"
+                    )
+        return self._executor
+
+    def temperature(self, index, count):
+        return 0 if count < 2 else round(self.max_temperature * index / (count - 1), 2)
+
+    def cache_key(self, user_query, mode, count):
+        return self.handler.cache_key(user_query, f"{mode}:candidates:{count}")
+
+    def submit(self, user_query, db_manager, mode="editor", count=None, budget=None):
+        """
+        Mise en file de la génération multi-candidats (lève QueueFullError).
+        Renvoie (job, None), ou (None, résultat) si la réponse est immédiate (cache, requête invalide).
+        """
+        if self.handler.is_invalid_query(user_query):
+            return None, "INVALID_QUERY"
+        count = self.resolve_count(count)
+        budget = self.resolve_budget(budget)
+
+        key = self.cache_key(user_query, mode, count)
+        cached = self.handler.cache.get(key)
+        if cached is not None:
+            return None, cached
+
+        job = self.queue.submit(key, lambda: self._generate(user_query, mode, count, budget, db_manager, key),
+                                self.handler.priority(mode), kind="generate")
+        return job, None
+
+    def generate(self, user_query, db_manager, mode="editor", count=None, budget=None):
+        """Version synchrone de submit : attend le résultat du job."""
+        job, result = self.submit(user_query, db_manager, mode, count, budget)
+        if job is None:
+            return result
+        try:
+            return job.future.result(timeout=self.queue.wait_timeout)
+        except concurrent.futures.TimeoutError:
+            err_msg = "Error: Délai d'attente de la file IA dépassé"
+            logger.warning(err_msg)
+            return err_msg
+
+    def _generate(self, user_query, mode, count, budget, db_manager, key):
+        """Job de la file : candidats en parallèle, validation, choix."""
+        prompt = self.handler.build_prompt(user_query, mode)
+        started = time.perf_counter()
+        futures = [self._get_executor().submit(self._candidate, prompt, i, count, budget, db_manager, started)
+                   for i in range(count)]
+
+        candidates = []
+        with metrics.phase("generation"):
+            try:
+                # Ordre d'arrivée : à coût égal, le premier candidat valide l'emporte
+                for future in concurrent.futures.as_completed(futures, timeout=budget):
+                    candidates.append(future.result())
+            except concurrent.futures.TimeoutError:
+                pass
+        done = {candidate["index"] for candidate in candidates}
+        for i, future in enumerate(futures):
+            if i not in done:
+                # Appel Ollama encore en cours : sa réponse sera ignorée
+                future.cancel()
+                candidates.append({"index": i, "temperature": self.temperature(i, count), "valid": False,
+                                   "error": f"Pas de réponse dans le budget ({budget:g} s)."})
+
+        result = self.select(candidates)
+        with self._lock:
+            self.runs += 1
+            self.timeouts += count - len(done)
+            if isinstance(result, dict) and result["validated"]:
+                self.validated += 1
+                if result["selected"] != 0:
+                    self.not_baseline += 1
+        if isinstance(result, dict):
+            logger.debug("Candidats [Mode: %s] : %d/%d valides, retenu n°%s (coût %s) en %.1f s", mode,
+                         sum(1 for c in candidates if c["valid"]), count, result["selected"], result.get("cost"),
+                         time.perf_counter() - started)
+            if result["validated"]:
+                self.handler.cache.set(key, result, self.handler.get_schema_version())
+        return result
+
+    def _candidate(self, prompt, index, count, budget, db_manager, started):
+        """Un candidat : appel Ollama, extraction du SQL, contrôle de sécurité et EXPLAIN PLAN (sans exécution)."""
+        temperature = self.temperature(index, count)
+        candidate = {"index": index, "temperature": temperature, "valid": False}
+        payload = {
+            "model": self.handler.model_name,
+            "prompt": prompt,
+            "stream": False,
+            "keep_alive": self.handler.keep_alive,
+            "options": {
+                "temperature": temperature,
+                "seed": index
+            }
+        }
+        try:
+            raw = self.handler.client.generate(payload, read_timeout=budget).strip()
+        except Exception as e:
+            candidate["error"] = f"Error: Impossible de contacter Ollama ({str(e)})"
+            return candidate
+        finally:
+            candidate["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+        parsed = self.handler.parse_response(raw)
+        if isinstance(parsed, str):
+            candidate["error"] = parsed
+            return candidate
+        sql = parsed.get("sql", "").strip()
+        if sql.endswith(";"):
+            sql = sql[:-1].strip()
+        candidate.update(sql=sql, explanation=parsed.get("explanation", "Voici votre requête."))
+        if not sql:
+            candidate["error"] = "Réponse du modèle sans SQL."
+            return candidate
+
+        error = sql_safety.check(sql)
+        if error:
+            candidate["error"] = error
+            return candidate
+
+        # Erreur Oracle (colonne inconnue, syntaxe...) détectée ici plutôt qu'à l'exécution
+        with metrics.phase("explain"):
+            plan, error = explain_gate.plan(db_manager, sql)
+        if error:
+            candidate["error"] = error
+            return candidate
+        candidate.update(valid=True, cost=plan["cost"], cardinality=plan["cardinality"],
+                         issues=[issue["message"] for issue in plan["issues"] if issue["blocking"]])
+        return candidate
+
+    def select(self, candidates):
+        """
+        Candidat valide de plus faible coût (ceux qui dépassent les seuils d'EXPLAIN en dernier), sinon le premier
+        SQL obtenu, non validé. Renvoie le résultat de la génération, ou un message d'erreur comme generate_sql.
+        """
+        valid = [c for c in candidates if c["valid"]]
+        if valid:
+            best = min(valid, key=lambda c: (bool(c["issues"]), c["cost"] if c["cost"] is not None else float("inf")))
+        else:
+            with_sql = sorted((c for c in candidates if c.get("sql")), key=lambda c: c["index"])
+            if not with_sql:
+                errors = [c.get("error", "") for c in candidates]
+                if errors and all(error == "INVALID_QUERY" for error in errors):
+                    return "INVALID_QUERY"
+                return next((error for error in errors if error.startswith("Error:")), "Error: Aucun candidat exploitable")
+            best = with_sql[0]
+
+        return {
+            "sql": best["sql"],
+            "explanation": best["explanation"],
+            "validated": best["valid"],
+            "cost": best.get("cost"),
+            "selected": best["index"],
+            "candidates": sorted(({key: value for key, value in c.items() if key != "explanation"} for c in candidates),
+                                 key=lambda c: c["index"])
+        }
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "count": self.count,
+                "max_count": self.max_count,
+                "budget_s": self.budget,
+                "max_temperature": self.max_temperature,
+                "runs": self.runs,
+                "validated": self.validated,
+                "not_baseline": self.not_baseline,
+                "timeouts": self.timeouts
+            }
+
+candidate_generator = CandidateGenerator()
@@ -0,0 +1,148 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+class GenerationCache:
+    """
+    Cache des générations NL -> SQL (LRU + TTL en mémoire, SQLite optionnel sur disque).
+    La génération est déterministe (temperature 0) : même modèle, même mode, même demande
+    et même schéma donnent la même réponse.
+    """
+
+    def __init__(self, max_entries=None, ttl=None, db_path=None):
+        self.max_entries = max_entries or int(os.getenv("GENERATION_CACHE_SIZE", "256"))
+        self.ttl = ttl or int(os.getenv("GENERATION_CACHE_TTL", "86400"))
+        # Chemin du fichier SQLite : vide = cache uniquement en mémoire
+        self.db_path = db_path if db_path is not None else os.getenv("GENERATION_CACHE_DB", "")
+        self.enabled = os.getenv("GENERATION_CACHE_ENABLED", "1") == "1"
+
+        self._entries = OrderedDict()  # clé -> (expiration, version du schéma, valeur)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if self.db_path:
+            self._init_db()
+
+    @staticmethod
+    def make_key(model_name, mode, user_query, schema_version):
+        # Les espaces superflus ne changent pas la demande
+        normalized_query = " ".join(user_query.split())
+        raw = json.dumps([model_name, mode, normalized_query, schema_version], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _init_db(self):
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS generations (
+                    key TEXT PRIMARY KEY,
+                    schema_version TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_generations_schema ON generations (schema_version)")
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, _, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return dict(value)
+                del self._entries[key]
+
+        if self.db_path:
+            try:
+                with self._connect() as conn:
+                    row = conn.execute(
+                        "SELECT schema_version, value, expires_at FROM generations WHERE key = ?", (key,)
+                    ).fetchone()
+                if row and row[2] > now:
+                    value = json.loads(row[1])
+                    self._remember(key, value, row[0], row[2])
+                    with self._lock:
+                        self.hits += 1
+                    return dict(value)
+            except sqlite3.Error as e:
+                logger.warning("Cache de génération indisponible (%s)", e)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _remember(self, key, value, schema_version, expires_at):
+        with self._lock:
+            self._entries[key] = (expires_at, schema_version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def set(self, key, value, schema_version):
+        if not self.enabled:
+            return
+        expires_at = time.time() + self.ttl
+        self._remember(key, dict(value), schema_version, expires_at)
+        if self.db_path:
+            try:
+                with self._connect() as conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO generations (key, schema_version, value, expires_at) VALUES (?, ?, ?, ?)",
+                        (key, schema_version, json.dumps(value, ensure_ascii=False), expires_at)
+                    )
+                    conn.execute("DELETE FROM generations WHERE expires_at <= ?", (time.time(),))
+            except sqlite3.Error as e:
+                logger.warning("Cache de génération indisponible (%s)", e)
+
+    def invalidate_schema(self, current_version):
+        """Purge les entrées générées avec une autre version du schéma."""
+        with self._lock:
+            stale = [k for k, (_, version, _) in self._entries.items() if version != current_version]
+            for k in stale:
+                del self._entries[k]
+        if self.db_path:
+            try:
+                with self._connect() as conn:
+                    conn.execute("DELETE FROM generations WHERE schema_version != ?", (current_version,))
+            except sqlite3.Error as e:
+                logger.warning("Cache de génération indisponible (%s)", e)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.db_path:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM generations")
+
+    def get_stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "backend": "sqlite" if self.db_path else "memory",
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_s": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0
+            }
+
+generation_cache = GenerationCache()
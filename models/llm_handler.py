@@ -1,29 +1,202 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
+import logging
 import os
+import re
+import hashlib
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from models.generation_cache import generation_cache
+from models.llm_queue import llm_queue, QueueFullError, MODE_PRIORITIES, PRIORITY_CHAT
+from models.schema_index import SchemaIndex
+from db.schema_catalog import schema_catalog
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+def parse_keep_alive(value):
+    """
+    Valeur de `keep_alive` pour Ollama : un nombre (secondes, -1 = indéfiniment) doit être envoyé en entier JSON,
+    une chaîne "-1" est lue comme une durée Go sans unité et refusée ; les durées ("30m", "1h") restent des chaînes.
+    """
+    value = str(value).strip()
+    return int(value) if value.lstrip("-").isdigit() else value
+
+class OllamaClient:
+    """
+    Accès HTTP unique à Ollama : session requests partagée (pool de connexions keep-alive), timeouts de
+    connexion/lecture et reprises sur erreurs transitoires configurés en un seul endroit. Chaque appel
+    envoie `keep_alive` pour que le modèle reste chargé entre deux requêtes.
+    """
+
+    def __init__(self, base_url, keep_alive=None):
+        self.base_url = base_url
+        self.generate_url = f"{base_url}/api/generate"
+        self.keep_alive = parse_keep_alive(keep_alive if keep_alive is not None else os.getenv("OLLAMA_KEEP_ALIVE", "30m"))
+        self.connect_timeout = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))
+        # Attente max entre deux paquets (génération complète en mode non streamé)
+        self.read_timeout = float(os.getenv("OLLAMA_READ_TIMEOUT", "45"))
+        self.retries = int(os.getenv("OLLAMA_RETRIES", "2"))
+        self.pool_size = int(os.getenv("OLLAMA_POOL_SIZE", "8"))
+        self._session = None
+        self._lock = threading.Lock()
+
+    def _get_session(self):
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    # Reprise avec backoff sur connexion refusée/coupée et 502/503/504 (Ollama qui redémarre
+                    # ou charge le modèle) ; pas sur timeout de lecture, la génération a pu aboutir côté Ollama
+                    retry = Retry(
+                        total=self.retries,
+                        connect=self.retries,
+                        read=0,
+                        status=self.retries,
+                        status_forcelist=(502, 503, 504),
+                        allowed_methods=frozenset(["GET", "POST"]),
+                        backoff_factor=0.5,
+                        raise_on_status=False
+                    )
+                    session = requests.Session()
+                    session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry))
+                    session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry))
+                    self._session = session
+        return self._session
+
+    def _timeout(self, read_timeout=None):
+        return (self.connect_timeout, read_timeout or self.read_timeout)
+
+    def post(self, payload, stream=False, read_timeout=None):
+        """POST /api/generate ; la réponse est renvoyée telle quelle (à fermer par l'appelant en streaming)."""
+        payload = dict(payload)
+        payload.setdefault("keep_alive", self.keep_alive)
+        response = self._get_session().post(self.generate_url, json=payload, stream=stream, timeout=self._timeout(read_timeout))
+        response.raise_for_status()
+        return response
+
+    def generate(self, payload, read_timeout=None):
+        """Appel non streamé ; renvoie le texte brut de la réponse."""
+        return self.generate_json(payload, read_timeout).get("response", "")
+
+    def generate_json(self, payload, read_timeout=None):
+        """Appel non streamé ; renvoie la réponse complète (texte et durées mesurées par Ollama)."""
+        payload = dict(payload, stream=False)
+        return self.post(payload, read_timeout=read_timeout).json()
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
 
 class LLMHandler:
-    def __init__(self, model_name="sqlcoder:7b", base_url=None):
+    def __init__(self, model_name="sqlcoder:7b", base_url=None, cache=None, catalog=None):
         self.model_name = model_name
+        self.cache = cache if cache is not None else generation_cache
+        # Source du schéma : "catalog" (introspection Oracle), "markdown" (docs/database_schema.md)
+        # ou "auto" (catalogue s'il est disponible, sinon markdown)
+        self.catalog = catalog if catalog is not None else schema_catalog
+        self.schema_source = os.getenv("SCHEMA_SOURCE", "auto")
         # Si base_url n'est pas fourni, on regarde la variable d'env, sinon valeur par défaut locale
         if base_url is None:
             self.base_url = os.getenv("OLLAMA_BASE_URL", "http://127.0.0.1:11434")
         else:
             self.base_url = base_url
             
-        self.api_url = f"{self.base_url}/api/generate"
+        # Durée de maintien du modèle en mémoire côté Ollama : le runner garde aussi son
+        # cache KV, donc le préfixe (schéma + règles) n'est pas réévalué d'une requête à l'autre.
+        self.keep_alive = parse_keep_alive(os.getenv("OLLAMA_KEEP_ALIVE", "30m"))
+        self.client = OllamaClient(self.base_url, self.keep_alive)
 
-    def get_schema(self):
-        schema_path = os.path.join(os.path.dirname(__file__), '..', 'docs', 'database_schema.md')
+        # Schéma et prompts construits une seule fois, reconstruits si le fichier change
+        self._schema_state = None
+        self._schema_lock = threading.Lock()
+
+    def get_schema_path(self):
+        return os.path.join(os.path.dirname(__file__), '..', 'docs', 'database_schema.md')
+
+    def uses_catalog(self):
+        if self.schema_source == "markdown":
+            return False
+        return self.schema_source == "catalog" or self.catalog.is_loaded()
+
+    def _schema_signature(self):
+        if self.uses_catalog():
+            return ("catalog", self.catalog.version)
         try:
-            with open(schema_path, 'r', encoding='utf-8') as f:
-                return f.read()
+            st = os.stat(self.get_schema_path())
+            return (st.st_mtime_ns, st.st_size)
         except FileNotFoundError:
-            return "Documentation du schéma non disponible."
+            return None
+
+    def _load_schema_state(self):
+        """Renvoie le schéma et les prompts en mémoire, relus seulement si le fichier a changé (mtime/taille)."""
+        signature = self._schema_signature()
+        state = self._schema_state
+        if state is not None and state["signature"] == signature:
+            return state
+
+        with self._schema_lock:
+            state = self._schema_state
+            if state is not None and state["signature"] == signature:
+                return state
+            try:
+                if signature and signature[0] == "catalog":
+                    if not self.catalog.is_loaded():
+                        raise FileNotFoundError("catalogue vide")
+                    schema_doc = self.catalog.to_markdown()
+                else:
+                    with open(self.get_schema_path(), 'r', encoding='utf-8') as f:
+                        schema_doc = f.read()
+                version = hashlib.sha256(schema_doc.encode("utf-8")).hexdigest()[:16]
+            except FileNotFoundError:
+                schema_doc = "Documentation du schéma non disponible."
+                version = "no-schema"
+            index = SchemaIndex(schema_doc)
+            # Réglages d'élagage (SCHEMA_TOP_K, SCHEMA_TOKEN_BUDGET) dans la version : le cache de génération
+            # persistant ne resert pas une réponse construite sur une autre sélection de tables
+            version = f"{version}-k{index.top_k}-t{index.token_budget}"
+            state = {
+                "signature": signature,
+                "schema": schema_doc,
+                "version": version,
+                "index": index,
+                "prompts": {
+                    "editor": self.render_editor_prompt(schema_doc),
+                    "chat": self.render_chat_prompt(schema_doc)
+                }
+            }
+            self._schema_state = state
+            logger.debug("Schéma chargé et prompts construits (version %s)", version)
+            return state
+
+    def invalidate_schema(self):
+        """Invalidation explicite (ex: après /api/upload_schema)."""
+        with self._schema_lock:
+            self._schema_state = None
+
+    def get_schema_version(self):
+        """Empreinte du schéma courant."""
+        return self._load_schema_state()["version"]
+
+    def cache_key(self, user_query, mode):
+        return self.cache.make_key(self.model_name, mode, user_query, self.get_schema_version())
+
+    def get_schema(self):
+        return self._load_schema_state()["schema"]
 
     def get_editor_prompt(self):
+        return self._load_schema_state()["prompts"]["editor"]
+
+    def get_chat_prompt(self):
+        return self._load_schema_state()["prompts"]["chat"]
+
+    def render_editor_prompt(self, schema_doc):
         # Prompt STICT pour l'éditeur : SQL pur, règles rigides
-        schema_doc = self.get_schema()
         return f"""### Task
 Translate the natural language query into a valid Oracle SQL query.
 Use the following database schema:
@@ -43,11 +216,10 @@ Use the following database schema:
 SELECT ...
 """
 
-    def get_chat_prompt(self):
+    def render_chat_prompt(self, schema_doc):
         # Prompt pour le CHAT (Index) : Peut être un peu plus complet ou conversationnel si besoin
         # Pour l'instant on garde une structure similaire mais on peut l'adapter facilement
         # Le user veut "deux fichiers différents" -> ici deux méthodes distinctes.
-        schema_doc = self.get_schema()
         return f"""### Task
 You are an intelligent Oracle SQL Assistant. Your goal is to help the user by generating the correct SQL query based on their request.
 Use the following database schema:
@@ -68,90 +240,308 @@ Use the following database schema:
 SELECT ...
 """
 
-    def generate_sql(self, user_query, mode="editor"):
-        # Vérification rapide
-        if len(user_query.strip()) < 3 or user_query.strip().lower() in ["abc", "test", "test1"]:
-            return "INVALID_QUERY"
+    def get_relevant_schema(self, user_query):
+        """Schéma élagué aux tables pertinentes (ou complet s'il tient dans le budget de tokens)."""
+        return self._load_schema_state()["index"].relevant_schema(user_query)
+
+    def build_prompt(self, user_query, mode="editor"):
+        with metrics.phase("prompt"):
+            return self._build_prompt(user_query, mode)
+
+    def _build_prompt(self, user_query, mode):
+        state = self._load_schema_state()
+        schema_doc = state["index"].relevant_schema(user_query)
 
         # Choix du prompt selon le mode
-        if mode == "chat":
-            system_prompt = self.get_chat_prompt()
+        if schema_doc is state["schema"]:
+            # Schéma complet : prompt pré-construit, préfixe identique d'une requête à l'autre
+            system_prompt = state["prompts"]["chat" if mode == "chat" else "editor"]
+        elif mode == "chat":
+            system_prompt = self.render_chat_prompt(schema_doc)
         else:
-            system_prompt = self.get_editor_prompt()
+            system_prompt = self.render_editor_prompt(schema_doc)
 
-        prompt = f"{system_prompt}\n\nDemande utilisateur : {user_query}\nSQL :"
+        return f"{system_prompt}\n\nDemande utilisateur : {user_query}\nSQL :"
+
+    def warm_up(self, mode="editor"):
+        """
+        Charge le modèle et fait évaluer le préfixe statique du prompt (schéma + règles).
+        Les requêtes suivantes partagent ce préfixe octet pour octet : le runner Ollama
+        réutilise son cache KV au lieu de le réévaluer sur CPU.
+        """
+        prefix = self.get_chat_prompt() if mode == "chat" else self.get_editor_prompt()
+        payload = {
+            "model": self.model_name,
+            "prompt": prefix,
+            "stream": False,
+            "keep_alive": self.keep_alive,
+            "options": {"temperature": 0, "num_predict": 1}
+        }
+        try:
+            # Le premier chargement du modèle peut être long
+            self.client.generate(payload, read_timeout=120)
+            logger.info("Préfixe du prompt préchargé dans Ollama [Mode: %s]", mode)
+        except Exception as e:
+            logger.warning("Préchauffage Ollama impossible (%s)", e)
+
+    def warm_up_async(self, modes=("editor",)):
+        def run():
+            for mode in modes:
+                self.warm_up(mode)
+        threading.Thread(target=run, daemon=True).start()
+
+    def is_invalid_query(self, user_query):
+        # Vérification rapide
+        return len(user_query.strip()) < 3 or user_query.strip().lower() in ["abc", "test", "test1"]
+
+    def parse_response(self, sql_code):
+        """Extrait le SQL et l'explication de la réponse brute du modèle."""
+        with metrics.phase("sql_parse"):
+            return self._parse_response(sql_code)
+
+    def _parse_response(self, sql_code):
+        if "INVALID_QUERY" in sql_code:
+            return "INVALID_QUERY"
+
+        # Tentative d'extraction du JSON plus robuste pour Python re
+        first_brace = sql_code.find('{')
+        last_brace = sql_code.rfind('}')
+
+        if first_brace != -1 and last_brace != -1:
+            try:
+                json_str = sql_code[first_brace:last_brace+1]
+                data_json = json.loads(json_str)
+                if 'sql' in data_json:
+                    return data_json
+            except:
+                pass
+
+        # Fallback : Si l'IA n'a pas respecté le JSON, on cherche le SQL intelligemment
+        sql_only = sql_code
+        explanation = "Requête générée."
+
+        # Extraction de l'explication depuis les commentaires (si présents)
+        comments = re.findall(r'^--\s*(.*)', sql_code, re.MULTILINE)
+        if comments:
+            # On concatène les premières lignes de commentaires pour l'explication
+            explanation = " ".join(comments[:2])
+            if "Explication:" in explanation:
+                explanation = explanation.split("Explication:")[1].strip()
+
+        # 1. On cherche par blocs markdown
+        if "```sql" in sql_code:
+            sql_only = sql_code.split("```sql")[1].split("```")[0].strip()
+        elif "```" in sql_code:
+            sql_only = sql_code.split("```")[1].split("```")[0].strip()
+        # 2. On tente d'extraire la valeur après "sql":
+        elif '"sql":' in sql_code:
+            try:
+                # On prend ce qu'il y a entre les guillemets après "sql":
+                parts = sql_code.split('"sql":')[1].strip()
+                if parts.startswith('"'):
+                    sql_only = parts[1:].split('"', 1)[0]
+            except:
+                pass
+
+        # Nettoyage final pour Oracle (virer les résidus de JSON ou caractères spéciaux en début)
+        sql_only = sql_only.replace('\\n', '\n').replace('\\"', '"')
+        # Supprimer tout ce qui n'est pas une lettre, un chiffre, un commentaire ou un espace au tout début
+        sql_only = re.sub(r'^[^a-zA-Z0-9\-\s/]+', '', sql_only).strip()
+
+        return {"sql": sql_only, "explanation": explanation}
+
+    def complete(self, payload):
+        """Appel non streamé à /api/generate ; renvoie le texte brut de la réponse."""
+        with metrics.phase("generation"):
+            data = self.client.generate_json(payload)
+        # Premier jeton = chargement du modèle + évaluation du prompt (durées Ollama en nanosecondes)
+        if "prompt_eval_duration" in data:
+            metrics.record("ttft", (data.get("load_duration", 0) + data["prompt_eval_duration"]) / 1e9)
+        return data.get("response", "")
+
+    def priority(self, mode):
+        return MODE_PRIORITIES.get(mode, PRIORITY_CHAT)
+
+    def generate_sql(self, user_query, mode="editor"):
+        """Génération synchrone via la file d'attente (lève QueueFullError si elle est pleine)."""
+        if self.is_invalid_query(user_query):
+            return "INVALID_QUERY"
+
+        key = self.cache_key(user_query, mode)
+        cached = self.cache.get(key)
+        if cached is not None:
+            logger.debug("Génération servie depuis le cache [Mode: %s]", mode)
+            return cached
+
+        job = llm_queue.submit(key, lambda: self._generate_uncached(user_query, mode, key), self.priority(mode), kind="generate")
+        try:
+            return job.future.result(timeout=llm_queue.wait_timeout)
+        except FutureTimeoutError:
+            err_msg = "Error: Délai d'attente de la file IA dépassé"
+            logger.warning(err_msg)
+            return err_msg
+
+    def submit_generation(self, user_query, mode="editor"):
+        """
+        Mise en file sans attente, le résultat se consulte par /api/jobs/<id>.
+        Renvoie (job, None), ou (None, résultat) si la réponse est immédiate (cache, requête invalide).
+        """
+        if self.is_invalid_query(user_query):
+            return None, "INVALID_QUERY"
+
+        key = self.cache_key(user_query, mode)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return None, cached
+
+        job = llm_queue.submit(key, lambda: self._generate_uncached(user_query, mode, key), self.priority(mode), kind="generate")
+        return job, None
+
+    def _generate_uncached(self, user_query, mode, key):
+        """Appel Ollama proprement dit, exécuté par un worker de la file."""
+        prompt = self.build_prompt(user_query, mode)
 
         payload = {
             "model": self.model_name,
             "prompt": prompt,
             "stream": False,
+            "keep_alive": self.keep_alive,
             "options": {
                 "temperature": 0
             }
         }
 
         try:
-            print(f"DEBUG: Envoi à Ollama ({self.model_name}) [Mode: {mode}]...")
-            response = requests.post(self.api_url, json=payload, timeout=45)
-            response.raise_for_status()
-            data = response.json()
-            sql_code = data.get("response", "").strip()
-
-            print(f"DEBUG: Réponse brute Ollama: {sql_code}")
-
-            if "INVALID_QUERY" in sql_code:
-                return "INVALID_QUERY"
-
-            # Tentative d'extraction du JSON plus robuste pour Python re
-            import re
-            first_brace = sql_code.find('{')
-            last_brace = sql_code.rfind('}')
-
-            if first_brace != -1 and last_brace != -1:
-                try:
-                    json_str = sql_code[first_brace:last_brace+1]
-                    data_json = json.loads(json_str)
-                    if 'sql' in data_json:
-                        return data_json
-                except:
-                    pass
-
-            # Fallback : Si l'IA n'a pas respecté le JSON, on cherche le SQL intelligemment
-            sql_only = sql_code
-            explanation = "Requête générée."
-
-            # Extraction de l'explication depuis les commentaires (si présents)
-            comments = re.findall(r'^--\s*(.*)', sql_code, re.MULTILINE)
-            if comments:
-                # On concatène les premières lignes de commentaires pour l'explication
-                explanation = " ".join(comments[:2])
-                if "Explication:" in explanation:
-                    explanation = explanation.split("Explication:")[1].strip()
-
-            # 1. On cherche par blocs markdown
-            if "```sql" in sql_code:
-                sql_only = sql_code.split("```sql")[1].split("```")[0].strip()
-            elif "```" in sql_code:
-                sql_only = sql_code.split("```")[1].split("```")[0].strip()
-            # 2. On tente d'extraire la valeur après "sql":
-            elif '"sql":' in sql_code:
-                try:
-                    # On prend ce qu'il y a entre les guillemets après "sql":
-                    parts = sql_code.split('"sql":')[1].strip()
-                    if parts.startswith('"'):
-                        sql_only = parts[1:].split('"', 1)[0]
-                except:
-                    pass
-
-            # Nettoyage final pour Oracle (virer les résidus de JSON ou caractères spéciaux en début)
-            sql_only = sql_only.replace('\\n', '\n').replace('\\"', '"')
-            # Supprimer tout ce qui n'est pas une lettre, un chiffre, un commentaire ou un espace au tout début
-            sql_only = re.sub(r'^[^a-zA-Z0-9\-\s/]+', '', sql_only).strip()
-
-            return {"sql": sql_only, "explanation": explanation}
+            logger.debug("Envoi à Ollama (%s) [Mode: %s]...", self.model_name, mode)
+            sql_code = self.complete(payload).strip()
+
+            logger.debug("Réponse brute Ollama: %s", sql_code)
+
+            result = self.parse_response(sql_code)
+            if isinstance(result, dict):
+                self.cache.set(key, result, self.get_schema_version())
+            return result
         except Exception as e:
             err_msg = f"Error: Impossible de contacter Ollama ({str(e)})"
-            print(f"DEBUG: {err_msg}")
+            logger.error(err_msg)
             return err_msg
 
+    def generate_sql_stream(self, user_query, mode="editor"):
+        """
+        Variante streaming de generate_sql : générateur d'événements au fil des tokens.
+        Fermer le générateur (client déconnecté) ferme la connexion HTTP, ce qui
+        interrompt la génération côté Ollama.
+        """
+        if self.is_invalid_query(user_query):
+            yield {"event": "done", "sql": "INVALID_QUERY", "explanation": "Erreur ou requête invalide."}
+            return
+
+        key = self.cache_key(user_query, mode)
+        cached = self.cache.get(key)
+        if cached is not None:
+            yield {"event": "done", "sql": cached.get("sql", ""), "explanation": cached.get("explanation", "Voici votre requête."), "cached": True}
+            return
+
+        payload = {
+            "model": self.model_name,
+            "prompt": self.build_prompt(user_query, mode),
+            "stream": True,
+            "keep_alive": self.keep_alive,
+            "options": {
+                "temperature": 0
+            }
+        }
+
+        # Un worker de la file est réservé pendant toute la durée du flux
+        try:
+            _, granted, release = llm_queue.hold_slot(self.priority(mode), kind="stream")
+        except QueueFullError as e:
+            yield {"event": "error", "error": str(e), "retry_after": e.retry_after}
+            return
+
+        response = None
+        try:
+            granted.result(timeout=llm_queue.wait_timeout)
+            logger.debug("Envoi à Ollama en streaming (%s) [Mode: %s]...", self.model_name, mode)
+            started = time.perf_counter()
+            first_token = True
+            # Le timeout s'applique à l'attente entre deux paquets, pas à la génération complète
+            response = self.client.post(payload, stream=True)
+
+            parser = StreamingResponseParser()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                token = chunk.get("response", "")
+                if token:
+                    if first_token:
+                        first_token = False
+                        metrics.record("ttft", time.perf_counter() - started)
+                    yield {"event": "token", "token": token}
+                    yield from parser.feed(token)
+                if chunk.get("done"):
+                    break
+
+            yield from parser.flush()
+            metrics.record("generation", time.perf_counter() - started)
+            raw = parser.text.strip()
+            logger.debug("Réponse brute Ollama (stream): %s", raw)
+            result = self.parse_response(raw)
+            if isinstance(result, str):
+                yield {"event": "done", "sql": result, "explanation": "Erreur ou requête invalide."}
+            else:
+                self.cache.set(key, result, self.get_schema_version())
+                yield {"event": "done", "sql": result.get("sql", ""), "explanation": result.get("explanation", "Voici votre requête.")}
+        except FutureTimeoutError:
+            yield {"event": "error", "error": "Error: Délai d'attente de la file IA dépassé"}
+        except Exception as e:
+            err_msg = f"Error: Impossible de contacter Ollama ({str(e)})"
+            logger.error(err_msg)
+            yield {"event": "error", "error": err_msg}
+        finally:
+            if response is not None:
+                response.close()
+            release()
+
+class StreamingResponseParser:
+    """
+    Découpe incrémentale de la réponse du modèle : les commentaires de tête (-- ...)
+    alimentent l'explication, les lignes suivantes le SQL. Une ligne n'est classée
+    qu'une fois terminée (retour à la ligne reçu).
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._pending = ""
+        self._in_sql = False
+
+    def feed(self, token):
+        self.text += token
+        self._pending += token
+        events = []
+        while "\n" in self._pending:
+            line, self._pending = self._pending.split("\n", 1)
+            event = self._classify(line)
+            if event:
+                events.append(event)
+        return events
+
+    def flush(self):
+        line, self._pending = self._pending, ""
+        event = self._classify(line)
+        return [event] if event else []
+
+    def _classify(self, line):
+        stripped = line.strip()
+        if not stripped or stripped.startswith("```"):
+            return None
+        if not self._in_sql and stripped.startswith("--"):
+            text = stripped.lstrip("-").strip()
+            if text.startswith("Explication:"):
+                text = text[len("Explication:"):].strip()
+            return {"event": "explanation", "text": text}
+        self._in_sql = True
+        return {"event": "sql", "text": line}
+
 llm = LLMHandler()
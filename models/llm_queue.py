@@ -0,0 +1,254 @@
+import contextvars
+import heapq
+import itertools
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+
+from metrics import metrics
+
+# Priorités (plus petit = servi en premier) : l'éditeur et la correction sont interactifs
+PRIORITY_EDITOR = 0
+PRIORITY_FIX = 0
+PRIORITY_CHAT = 1
+
+MODE_PRIORITIES = {"editor": PRIORITY_EDITOR, "chat": PRIORITY_CHAT}
+
+class QueueFullError(Exception):
+    """File d'attente pleine : la demande est refusée (HTTP 429)."""
+
+    def __init__(self, queue_size, max_size, retry_after):
+        super().__init__("Serveur IA saturé, réessayez dans quelques instants.")
+        self.queue_size = queue_size
+        self.max_size = max_size
+        self.retry_after = retry_after
+
+    def to_dict(self):
+        return {
+            "error": str(self),
+            "position": self.queue_size + 1,
+            "queue_size": self.queue_size,
+            "max_size": self.max_size,
+            "retry_after": self.retry_after
+        }
+
+class LLMJob:
+    def __init__(self, key, fn, priority, kind):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.fn = fn
+        self.priority = priority
+        self.kind = kind
+        self.status = "queued"  # queued, running, done, error, cancelled
+        self.future = Future()
+        # Contexte de la requête qui soumet le job : mesures (metrics.py) rattachées à cette requête
+        self.context = contextvars.copy_context()
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.coalesced = 0
+
+    def to_dict(self):
+        data = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "coalesced": self.coalesced,
+            "wait_ms": round(((self.started_at or time.time()) - self.created_at) * 1000, 1)
+        }
+        if self.finished_at and self.started_at:
+            data["run_ms"] = round((self.finished_at - self.started_at) * 1000, 1)
+        return data
+
+class LLMQueue:
+    """
+    File d'attente devant Ollama : un nombre fixe de workers (LLM_QUEUE_WORKERS, à aligner sur
+    OLLAMA_NUM_PARALLEL), priorités, fusion des demandes identiques en cours et refus quand la file
+    est pleine. Les résultats restent consultables LLM_JOB_TTL secondes.
+    """
+
+    def __init__(self, workers=None, max_size=None, result_ttl=None, wait_timeout=None):
+        self.workers = workers or int(os.getenv("LLM_QUEUE_WORKERS", "1"))
+        self.max_size = max_size or int(os.getenv("LLM_QUEUE_MAX", "32"))
+        self.result_ttl = result_ttl or int(os.getenv("LLM_JOB_TTL", "300"))
+        # Attente max (s) d'un appel synchrone, file + génération
+        self.wait_timeout = wait_timeout or float(os.getenv("LLM_QUEUE_WAIT_TIMEOUT", "120"))
+
+        self._heap = []  # (priorité, ordre d'arrivée, job)
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._jobs = {}      # id -> job (y compris terminés, pour la consultation)
+        self._inflight = {}  # clé -> job en file ou en cours
+        self._threads = []
+        self.running = 0
+        self.completed = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self._avg_run = 5.0
+
+    def _ensure_workers(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"llm-queue-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, key, fn, priority=PRIORITY_EDITOR, kind="generate"):
+        """Ajoute un job (ou renvoie le job identique déjà en file/en cours). Lève QueueFullError."""
+        with self._cond:
+            self._ensure_workers()
+            self._purge()
+            if key is not None:
+                existing = self._inflight.get(key)
+                if existing is not None:
+                    existing.coalesced += 1
+                    self.coalesced += 1
+                    # Une demande plus prioritaire remonte le job déjà en file
+                    if priority < existing.priority and existing.status == "queued":
+                        existing.priority = priority
+                        self._heap = [(existing.priority if job is existing else p, seq, job) for p, seq, job in self._heap]
+                        heapq.heapify(self._heap)
+                    return existing
+
+            queued = self._queued()
+            if queued >= self.max_size:
+                self.rejected += 1
+                raise QueueFullError(queued, self.max_size, self._retry_after(queued))
+
+            job = LLMJob(key, fn, priority, kind)
+            self._jobs[job.id] = job
+            if key is not None:
+                self._inflight[key] = job
+            heapq.heappush(self._heap, (priority, next(self._counter), job))
+            self._cond.notify()
+            return job
+
+    def run(self, key, fn, priority=PRIORITY_EDITOR, kind="generate"):
+        """Version synchrone : soumet puis attend le résultat (exceptions du job propagées)."""
+        job = self.submit(key, fn, priority, kind)
+        return job.future.result(timeout=self.wait_timeout)
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                _, _, job = heapq.heappop(self._heap)
+                if job.status == "cancelled" or not job.future.set_running_or_notify_cancel():
+                    # Annulé en file (ou Future annulé directement par l'appelant)
+                    job.status = "cancelled"
+                    job.finished_at = job.finished_at or time.time()
+                    if self._inflight.get(job.key) is job:
+                        del self._inflight[job.key]
+                    continue
+                job.status = "running"
+                job.started_at = time.time()
+                self.running += 1
+
+            try:
+                result = job.context.run(self._run, job)
+                job.status = "done"
+                job.future.set_result(result)
+            except Exception as e:
+                job.status = "error"
+                job.future.set_exception(e)
+            finally:
+                with self._cond:
+                    job.finished_at = time.time()
+                    self.running -= 1
+                    self.completed += 1
+                    self._avg_run = 0.8 * self._avg_run + 0.2 * (job.finished_at - job.started_at)
+                    if self._inflight.get(job.key) is job:
+                        del self._inflight[job.key]
+                    job.fn = None
+                    job.context = None
+
+    def _run(self, job):
+        metrics.record("queue_wait", job.started_at - job.created_at)
+        return job.fn()
+
+    def cancel(self, job):
+        """Retire un job encore en file (client parti) ; sans effet s'il a démarré."""
+        with self._cond:
+            if job.status != "queued" or job.coalesced:
+                return False
+            job.status = "cancelled"
+            job.finished_at = time.time()
+            if self._inflight.get(job.key) is job:
+                del self._inflight[job.key]
+            job.future.cancel()
+            return True
+
+    def hold_slot(self, priority=PRIORITY_EDITOR, kind="stream"):
+        """
+        Réserve un worker pour un appel en streaming : renvoie (job, accordé, libérer).
+        `accordé` est un Future résolu quand le worker est attribué ; appeler `libérer()` à la fin.
+        """
+        granted = Future()
+        released = threading.Event()
+
+        def hold():
+            # Appelant parti (Future annulé) : le worker est rendu aussitôt
+            if granted.set_running_or_notify_cancel():
+                granted.set_result(True)
+                released.wait()
+
+        job = self.submit(None, hold, priority, kind)
+
+        def release():
+            released.set()
+            if granted.cancel():
+                self.cancel(job)
+
+        return job, granted, release
+
+    def _retry_after(self, queued):
+        # Estimation (s) du temps d'écoulement des jobs en file et en cours
+        return max(1, int(self._avg_run * (queued + self.running) / self.workers))
+
+    def retry_after(self):
+        with self._cond:
+            return self._retry_after(self._queued())
+
+    def _queued(self):
+        # Les jobs annulés restent dans le tas jusqu'à leur sortie
+        return sum(1 for _, _, job in self._heap if job.status == "queued")
+
+    def position(self, job):
+        """Rang dans la file (1 = prochain servi), 0 si le job a démarré ou est terminé."""
+        with self._cond:
+            if job.status != "queued":
+                return 0
+            rank = next(((p, seq) for p, seq, other in self._heap if other is job), None)
+            if rank is None:
+                return 0
+            return 1 + sum(1 for p, seq, other in self._heap if other.status == "queued" and (p, seq) < rank)
+
+    def get(self, job_id):
+        with self._cond:
+            self._purge()
+            return self._jobs.get(job_id)
+
+    def _purge(self):
+        limit = time.time() - self.result_ttl
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished_at and job.finished_at < limit]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def get_stats(self):
+        with self._cond:
+            return {
+                "workers": self.workers,
+                "queued": self._queued(),
+                "running": self.running,
+                "max_size": self.max_size,
+                "completed": self.completed,
+                "coalesced": self.coalesced,
+                "rejected": self.rejected,
+                "avg_run_s": round(self._avg_run, 2)
+            }
+
+llm_queue = LLMQueue()
@@ -0,0 +1,186 @@
+import math
+import os
+import re
+import unicodedata
+from collections import Counter
+
+# Mots vides FR/EN ignorés par le retriever
+STOP_WORDS = {
+    "le", "la", "les", "un", "une", "des", "du", "de", "d", "l", "et", "ou", "a", "au", "aux", "en", "par",
+    "pour", "sur", "dans", "avec", "qui", "que", "quel", "quelle", "quels", "quelles", "est", "sont", "moi",
+    "donne", "liste", "affiche", "montre", "tous", "toutes", "tout", "plus", "ont", "ayant", "leur", "leurs",
+    "the", "of", "and", "or", "to", "in", "for", "by", "with", "a", "an", "is", "are", "all", "show", "list",
+    "give", "me", "what", "which"
+}
+
+IDENTIFIER_RE = re.compile(r'[A-Za-z_][A-Za-z0-9_$#]*')
+FK_RE = re.compile(r'FK\s*->\s*([A-Za-z_][A-Za-z0-9_$#]*)', re.IGNORECASE)
+COLUMN_RE = re.compile(r'`([A-Za-z_][A-Za-z0-9_$#]*)`')
+
+def estimate_tokens(text):
+    # Approximation suffisante pour un budget : ~4 caractères par token
+    return len(text) // 4 + 1
+
+def _strip_accents(text):
+    return "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+
+def tokenize(text):
+    """Tokens normalisés : minuscules, sans accents, identifiants découpés sur '_', pluriels simples retirés."""
+    tokens = []
+    for word in re.split(r'[^a-z0-9_]+', _strip_accents(text.lower())):
+        if not word:
+            continue
+        parts = [word] + ([p for p in word.split("_") if p] if "_" in word else [])
+        for part in parts:
+            if part in STOP_WORDS or len(part) < 2:
+                continue
+            if len(part) > 3 and part.endswith(("s", "x")):
+                part = part[:-1]
+            tokens.append(part)
+    return tokens
+
+class SchemaChunk:
+    def __init__(self, name, kind, text):
+        self.name = name
+        self.kind = kind  # "table", "view" ou "section"
+        self.text = text
+        self.columns = COLUMN_RE.findall(text)
+        self.references = {ref.upper() for ref in FK_RE.findall(text)}
+        self.tokens = estimate_tokens(text)
+        # Le nom de l'objet et ses colonnes pèsent plus que les descriptions
+        self.terms = Counter(tokenize(text))
+        for term in tokenize(name):
+            self.terms[term] += 3
+        for column in self.columns:
+            for term in tokenize(column):
+                self.terms[term] += 1
+        self.length = sum(self.terms.values())
+
+class SchemaIndex:
+    """
+    Découpe la documentation markdown du schéma en un bloc par table/vue et sélectionne
+    les blocs pertinents pour une demande (BM25 sur noms, colonnes et descriptions,
+    puis ajout des tables voisines par clé étrangère), dans un budget de tokens.
+    """
+
+    def __init__(self, schema_doc, top_k=None, token_budget=None, k1=1.2, b=0.75):
+        self.schema_doc = schema_doc
+        self.top_k = top_k or int(os.getenv("SCHEMA_TOP_K", "6"))
+        self.token_budget = token_budget or int(os.getenv("SCHEMA_TOKEN_BUDGET", "3000"))
+        self.k1 = k1
+        self.b = b
+        self.header, self.chunks, self.sections = self._split(schema_doc)
+        self.by_name = {chunk.name: chunk for chunk in self.chunks}
+
+        # Liens FK dans les deux sens pour l'expansion
+        self.neighbours = {chunk.name: set() for chunk in self.chunks}
+        for chunk in self.chunks:
+            for ref in chunk.references:
+                if ref in self.neighbours and ref != chunk.name:
+                    self.neighbours[chunk.name].add(ref)
+                    self.neighbours[ref].add(chunk.name)
+
+        # Statistiques BM25
+        self.avg_length = (sum(c.length for c in self.chunks) / len(self.chunks)) if self.chunks else 0
+        doc_freq = Counter()
+        for chunk in self.chunks:
+            doc_freq.update(chunk.terms.keys())
+        n = len(self.chunks)
+        self.idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freq.items()}
+
+    def _split(self, schema_doc):
+        header_lines = []
+        chunks = []
+        sections = []
+        current = None  # (kind, heading, lignes)
+        section_kind = "table"
+
+        def close(block):
+            if block is None:
+                return
+            kind, heading, lines = block
+            text = "\n".join(lines).strip()
+            if kind == "section":
+                if text:
+                    sections.append(SchemaChunk(heading, "section", text))
+                return
+            cleaned = re.sub(r'^\s*\d+[.)]\s*', '', heading)
+            match = IDENTIFIER_RE.search(cleaned)
+            if match:
+                chunks.append(SchemaChunk(match.group(0).upper(), kind, text))
+
+        for line in schema_doc.splitlines():
+            if line.startswith("### "):
+                close(current)
+                current = (section_kind, line[4:].strip(), [line])
+            elif line.startswith("## "):
+                close(current)
+                title = _strip_accents(line[3:].lower())
+                if "vue" in title or "view" in title:
+                    section_kind = "view"
+                elif "table" in title:
+                    section_kind = "table"
+                else:
+                    section_kind = "section"
+                current = ("section", line[3:].strip(), [line]) if section_kind == "section" else None
+            elif current is not None:
+                current[2].append(line)
+            else:
+                header_lines.append(line)
+        close(current)
+        return "\n".join(header_lines).strip(), chunks, sections
+
+    def total_tokens(self):
+        return estimate_tokens(self.schema_doc)
+
+    def score(self, query):
+        terms = tokenize(query)
+        scores = {}
+        for chunk in self.chunks:
+            total = 0.0
+            for term in terms:
+                tf = chunk.terms.get(term)
+                if not tf:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * chunk.length / self.avg_length)
+                total += self.idf.get(term, 0.0) * tf * (self.k1 + 1) / (tf + norm)
+            if total > 0:
+                scores[chunk.name] = total
+        return scores
+
+    def select(self, query):
+        """Noms des tables/vues retenues, par ordre de pertinence."""
+        scores = self.score(query)
+        ranked = sorted(scores, key=lambda name: -scores[name])[:self.top_k]
+
+        # Expansion FK : les voisins d'une table retenue sont utiles pour les jointures
+        expanded = dict((name, scores[name]) for name in ranked)
+        for name in ranked:
+            for neighbour in self.neighbours.get(name, ()):
+                candidate = scores[name] * 0.5
+                if expanded.get(neighbour, 0) < candidate:
+                    expanded[neighbour] = candidate
+        return sorted(expanded, key=lambda name: -expanded[name])
+
+    def relevant_schema(self, query):
+        """Schéma à injecter dans le prompt : complet s'il tient dans le budget, sinon élagué."""
+        if self.total_tokens() <= self.token_budget or not self.chunks:
+            return self.schema_doc
+
+        parts = [self.header] if self.header else []
+        used = estimate_tokens(self.header)
+        selected = self.select(query)
+        if not selected:
+            # Rien de pertinent trouvé : on garde les premières tables dans le budget
+            selected = [chunk.name for chunk in self.chunks]
+        for name in selected:
+            chunk = self.by_name[name]
+            if used + chunk.tokens > self.token_budget:
+                continue
+            parts.append(chunk.text)
+            used += chunk.tokens
+        for section in self.sections:
+            if used + section.tokens <= self.token_budget:
+                parts.append(section.text)
+                used += section.tokens
+        return "\n\n".join(parts)
@@ -1,8 +1,102 @@
 from flask import request, jsonify
 from models.llm_handler import llm
+from models.llm_queue import llm_queue, QueueFullError, PRIORITY_FIX
+from db.schema_catalog import schema_catalog
+from db.sql_fixer import sql_fixer
+from metrics import metrics
+from concurrent.futures import TimeoutError as FutureTimeoutError
+import logging
 import sqlparse
+import hashlib
+import json
 import re
 
+logger = logging.getLogger(__name__)
+
+def apply_local_rules(sql, error):
+    """Corrections déterministes (db/sql_fixer.py). Renvoie (sql corrigé, explication) ou None."""
+    fixed = sql_fixer.fix(sql, error)
+    if fixed is None:
+        return None
+    fixed_sql, rules = fixed
+    explanation = "Correction syntaxe : " + " ; ".join(rule.explanation for rule in rules) + "."
+    return format_sql(fixed_sql), explanation
+
+def build_fix_prompt(sql, error):
+    # Tables de la requête connues du catalogue Oracle : une ligne compacte par table
+    schema_hint = ""
+    if schema_catalog.is_loaded():
+        referenced = sorted(set(re.findall(r'[A-Z_][A-Z0-9_$#]*', sql.upper())) & set(schema_catalog.objects))
+        if referenced:
+            schema_hint = "\n * Tables:\n" + "\n".join(f" *   {line}" for line in schema_catalog.compact_schema(referenced).splitlines())
+
+    # Prompt simplifié au maximum pour éviter que le modèle ne s'embrouille
+    return f"""/*
+ * Database: Oracle SQL
+ * Task: Fix the query below based on the error message.
+ * Error Message: {error}{schema_hint}
+ */
+
+-- Original Query:
+{sql}
+
+-- Corrected Query (Oracle Syntax):
+"""
+
+def build_fix_payload(prompt):
+    return {
+        "model": llm.model_name,
+        "prompt": prompt,
+        "stream": False,
+        "options": {
+            "temperature": 0.1, # Très faible créativité pour rester factuel
+            "stop": [";", "```"] # Stop dès que la requête est finie
+        }
+    }
+
+def clean_fix_response(raw_response):
+    """Extrait le SQL de la réponse brute du modèle ; None si rien d'exploitable."""
+    # Nettoyage
+    cleaned_response = re.sub(r'</?s>', '', raw_response) # Supprime balises de fin de phrase
+    cleaned_response = re.sub(r'```sql', '', cleaned_response)
+    cleaned_response = re.sub(r'```', '', cleaned_response)
+    cleaned_response = cleaned_response.strip()
+    
+    # Si la réponse commence par "SELECT" (ou autre) c'est gagné
+    # Sinon, on cherche le premier bloc SQL valide
+    if not re.match(r'^(SELECT|INSERT|UPDATE|DELETE|WITH)', cleaned_response, re.IGNORECASE):
+        # Recherche d'un motif SQL
+        match = re.search(r'(SELECT|INSERT|UPDATE|DELETE|WITH).*', cleaned_response, re.IGNORECASE | re.DOTALL)
+        if match:
+            cleaned_response = match.group(0)
+    
+    # Validation minimale
+    if len(cleaned_response) < 10:
+        return None
+    return cleaned_response
+
+def format_sql(sql):
+    with metrics.phase("sql_parse"):
+        try:
+            return sqlparse.format(sql, reindent=True, keyword_case='upper', strip_comments=False)
+        except:
+            return sql
+
+def fix_result(sql, error, raw_response):
+    """Réponse de l'API à partir de la sortie brute du modèle."""
+    logger.debug("Réponse IA brute: %s", raw_response)
+    cleaned_response = clean_fix_response(raw_response.strip())
+    if cleaned_response is None:
+        return {"fixed_sql": sql, "explanation": "L'IA n'a pas pu identifier la correction."}
+    return {"fixed_sql": format_sql(cleaned_response), "explanation": f"Correction suggérée pour l'erreur : {error}"}
+
+def submit_fix(sql, error):
+    """Met l'appel au modèle dans la file (lève QueueFullError) ; le job renvoie la réponse de l'API."""
+    payload = build_fix_payload(build_fix_prompt(sql, error))
+    # Même SQL + même erreur = même prompt : les demandes identiques en cours sont fusionnées
+    key = "fix:" + hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+    return llm_queue.submit(key, lambda: fix_result(sql, error, llm.complete(payload)), PRIORITY_FIX, kind="fix")
+
 def fix_sql_route():
     """
     Endpoint de correction SQL.
@@ -15,108 +109,37 @@ def fix_sql_route():
     if not sql or not error:
         return jsonify({"error": "SQL et erreur requis"}), 400
     
-    explanation = ""
-    fixed_sql = sql
-    
     # ---------------------------------------------------------
     # 1. CORRECTION ALGORITHMIQUE (RÈGLES LOCALES)
     # ---------------------------------------------------------
     
-    corrected_locally = False
-    
-    # Règle 1: LIMIT -> FETCH FIRST
-    if "LIMIT" in fixed_sql.upper() and ("ORA-00933" in error or "ORA-00900" in error or "ORA-03049" in error):
-        if re.search(r'\bLIMIT\s+\d+', fixed_sql, re.IGNORECASE):
-            fixed_sql = re.sub(
-                r'\bLIMIT\s+(\d+)(\s*;)?',
-                r'FETCH FIRST \1 ROWS ONLY',
-                fixed_sql,
-                flags=re.IGNORECASE
-            )
-            explanation = "Correction syntaxe : LIMIT remplacé par FETCH FIRST (Oracle)."
-            corrected_locally = True
-
-    # Règle 2: NOW() -> SYSDATE
-    if "NOW()" in fixed_sql.upper():
-        fixed_sql = fixed_sql.replace("NOW()", "SYSDATE").replace("now()", "SYSDATE")
-        explanation = "Correction syntaxe : NOW() remplacé par SYSDATE (Oracle)."
-        corrected_locally = True
-
-    if corrected_locally:
-        try:
-            fixed_sql = sqlparse.format(fixed_sql, reindent=True, keyword_case='upper', strip_comments=False)
-        except:
-            pass
+    local_fix = apply_local_rules(sql, error)
+    if local_fix:
+        fixed_sql, explanation = local_fix
         return jsonify({"fixed_sql": fixed_sql, "explanation": explanation})
         
     # ---------------------------------------------------------
     # 2. APPEL À L'IA (Style Autocomplétion)
     # ---------------------------------------------------------
     
-    # Prompt simplifié au maximum pour éviter que le modèle ne s'embrouille
-    fix_prompt = f"""/*
- * Database: Oracle SQL
- * Task: Fix the query below based on the error message.
- * Error Message: {error}
- */
-
--- Original Query:
-{sql}
-
--- Corrected Query (Oracle Syntax):
-"""
-    
     try:
-        from models.llm_handler import LLMHandler
-        llm_instance = LLMHandler()
-        
-        import requests
-        payload = {
-            "model": llm_instance.model_name,
-            "prompt": fix_prompt,
-            "stream": False,
-            "options": {
-                "temperature": 0.1, # Très faible créativité pour rester factuel
-                "stop": [";", "```"] # Stop dès que la requête est finie
-            }
-        }
-        
-        response = requests.post(llm_instance.api_url, json=payload, timeout=45)
-        response.raise_for_status()
-        llm_data = response.json()
-        raw_response = llm_data.get("response", "").strip()
-        
-        print(f"DEBUG: Réponse IA brute: {raw_response}")
-        
-        # Nettoyage
-        cleaned_response = re.sub(r'</?s>', '', raw_response) # Supprime balises de fin de phrase
-        cleaned_response = re.sub(r'```sql', '', cleaned_response)
-        cleaned_response = re.sub(r'```', '', cleaned_response)
-        cleaned_response = cleaned_response.strip()
-        
-        # Si la réponse commence par "SELECT" (ou autre) c'est gagné
-        # Sinon, on cherche le premier bloc SQL valide
-        if not re.match(r'^(SELECT|INSERT|UPDATE|DELETE|WITH)', cleaned_response, re.IGNORECASE):
-            # Recherche d'un motif SQL
-            match = re.search(r'(SELECT|INSERT|UPDATE|DELETE|WITH).*', cleaned_response, re.IGNORECASE | re.DOTALL)
-            if match:
-                cleaned_response = match.group(0)
-        
-        # Validation minimale
-        if len(cleaned_response) < 10:
-             return jsonify({"fixed_sql": sql, "explanation": "L'IA n'a pas pu identifier la correction."})
+        job = submit_fix(sql, error)
+        if data.get("async"):
+            return jsonify({"job_id": job.id, "status": job.status, "position": llm_queue.position(job)}), 202
+        return jsonify(job.future.result(timeout=llm_queue.wait_timeout))
 
-        fixed_sql = cleaned_response
-        explanation = f"Correction suggérée pour l'erreur : {error}"
-
-        # Formatage
-        try:
-            fixed_sql = sqlparse.format(fixed_sql, reindent=True, keyword_case='upper', strip_comments=False)
-        except:
-            pass
-        
-        return jsonify({"fixed_sql": fixed_sql, "explanation": explanation})
-        
+    except QueueFullError as e:
+        response = jsonify(e.to_dict())
+        response.headers["Retry-After"] = str(e.retry_after)
+        return response, 429
+    except FutureTimeoutError:
+        # Le job reste en file : son résultat reste consultable via /api/jobs/<job_id>
+        logger.warning("Correction IA : délai d'attente de la file dépassé (%ss)", llm_queue.wait_timeout)
+        retry_after = llm_queue.retry_after()
+        response = jsonify({"error": "Error: Délai d'attente de la file IA dépassé", "job_id": job.id,
+                            "retry_after": retry_after})
+        response.headers["Retry-After"] = str(retry_after)
+        return response, 504
     except Exception as e:
-        print(f"DEBUG: Erreur IA: {str(e)}")
+        logger.error("Erreur IA: %s", e)
         return jsonify({"error": f"Erreur technique: {str(e)}"}), 500
@@ -96,7 +96,9 @@ document.addEventListener('DOMContentLoaded', () => {
                         body: formData
                     });
                     const data = await resp.json();
-                    if (data.status) {
+                    if (data.warning) {
+                        addMessage("⚠️ " + data.status + " : " + data.warning, 'ai');
+                    } else if (data.status) {
                         addMessage("✅ " + data.status, 'ai');
                     } else {
                         addMessage("❌ Erreur : " + data.error, 'ai');
@@ -142,6 +144,8 @@ async function handleSendMessage() {
             saveToHistory(query, data.sql);
         } else if (data.sql && data.sql.startsWith("Error:")) {
             addMessage(`Erreur : ${data.sql}`, 'ai');
+        } else if (response.status === 429) {
+            addMessage(`${data.error} (position ${data.position}, réessayez dans ${data.retry_after} s)`, 'ai');
         } else {
             addMessage("Désolé, je n'ai pas pu générer une requête. Vérifiez Ollama.", 'ai');
         }
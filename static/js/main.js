@@ -1,7 +1,7 @@
-import { dom } from './modules/state.js';
+import { state, dom } from './modules/state.js';
 import { loadHistory, loadToEditor, openHistoryModal, closeHistoryModal, copyModalSQL } from './modules/history.js';
 import { handleSendMessage } from './modules/chat.js';
-import { executeSQL, fixSQL, initDatabase, seedDatabase } from './modules/editor_actions.js';
+import { executeSQL, cancelSQL, fixSQL, initDatabase, seedDatabase, exportServer } from './modules/editor_actions.js';
 import { toggleThemePopover, toggleExportMenu, switchTab } from './modules/utils.js';
 import { copyRow, copyCell, exportData, sortResults } from './modules/results_render.js';
 
@@ -17,6 +17,7 @@ window.copyModalSQL = copyModalSQL;
 window.copyRow = copyRow;
 window.copyCell = copyCell;
 window.exportData = exportData;
+window.exportServer = exportServer;
 window.sortResults = sortResults;
 window.toggleExportMenu = toggleExportMenu;
 window.toggleThemePopover = toggleThemePopover;
@@ -40,7 +41,8 @@ document.addEventListener('DOMContentLoaded', () => {
     }
 
     if (dom.sendBtn) dom.sendBtn.addEventListener('click', handleSendMessage);
-    if (dom.runBtn) dom.runBtn.addEventListener('click', () => executeSQL(dom.sqlEditor.value));
+    // Pendant l'exécution, le bouton sert à annuler la requête
+    if (dom.runBtn) dom.runBtn.addEventListener('click', () => state.runningQueryId ? cancelSQL() : executeSQL(dom.sqlEditor.value));
     if (dom.fixBtn) dom.fixBtn.addEventListener('click', fixSQL);
 
     // Theme logic
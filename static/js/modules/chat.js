@@ -2,6 +2,9 @@ import { dom } from './state.js';
 import { switchTab } from './utils.js';
 import { saveToHistory } from './history.js';
 
+// Génération en cours : annulée si l'utilisateur relance une demande (le serveur coupe alors Ollama)
+let currentGeneration = null;
+
 export async function handleSendMessage() {
     const query = dom.chatInput.value.trim();
     if (!query) return;
@@ -10,24 +13,67 @@ export async function handleSendMessage() {
     switchTab('ai');
     const loadingId = addChatMessage('Génération du SQL...', 'ai', true);
 
+    if (currentGeneration) currentGeneration.abort();
+    const controller = new AbortController();
+    currentGeneration = controller;
+
     try {
-        const response = await fetch('/api/generate', {
+        const response = await fetch('/api/generate/stream', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ query, mode: 'editor' })
+            body: JSON.stringify({ query, mode: 'editor' }),
+            signal: controller.signal
+        });
+
+        let explanation = '';
+        let streamedSql = '';
+        let result = null;
+        const bubble = document.querySelector(`#${loadingId} .message-bubble`);
+
+        await readServerSentEvents(response, (event, data) => {
+            if (event === 'explanation') {
+                explanation += (explanation ? ' ' : '') + data.text;
+                if (bubble) bubble.innerText = explanation;
+            } else if (event === 'sql') {
+                streamedSql += data.text + '\n';
+                dom.sqlEditor.value = streamedSql;
+            } else if (event === 'done' || event === 'error') {
+                result = data;
+            }
         });
-        const data = await response.json();
+
         removeChatMessage(loadingId);
-        if (data.sql && !data.sql.startsWith("Error:") && data.sql !== "INVALID_QUERY") {
-            dom.sqlEditor.value = data.sql;
-            addChatMessage(data.explanation || "Requête générée !", 'ai');
-            saveToHistory(query, data.sql);
+        if (result && result.sql && !result.sql.startsWith("Error:") && result.sql !== "INVALID_QUERY") {
+            dom.sqlEditor.value = result.sql;
+            addChatMessage(result.explanation || "Requête générée !", 'ai');
+            saveToHistory(query, result.sql);
         } else {
             addChatMessage("Désolé, je n'ai pas pu générer cette requête.", 'ai');
         }
     } catch (e) {
         removeChatMessage(loadingId);
-        addChatMessage("Erreur de connexion.", 'ai');
+        if (e.name !== 'AbortError') addChatMessage("Erreur de connexion.", 'ai');
+    } finally {
+        if (currentGeneration === controller) currentGeneration = null;
+    }
+}
+
+async function readServerSentEvents(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let sep;
+        while ((sep = buffer.indexOf('\n\n')) !== -1) {
+            const block = buffer.slice(0, sep);
+            buffer = buffer.slice(sep + 2);
+            const event = (block.match(/^event: (.*)$/m) || [])[1];
+            const data = (block.match(/^data: (.*)$/m) || [])[1];
+            if (event && data) onEvent(event, JSON.parse(data));
+        }
     }
 }
 
@@ -1,29 +1,18 @@
 import { state, dom } from './state.js';
-import { renderResultsTable, renderStats } from './results_render.js';
+import { renderResultsTable, renderStats, renderPlan } from './results_render.js';
 import { saveToHistory } from './history.js';
 import { addChatMessage } from './chat.js';
 import { showToast } from './utils.js';
 
 export async function executeSQL(sql) {
-    if (!sql.trim()) return;
-
-    // --- VALIDATION SÉCURITÉ ---
-    const forbidden = ["DROP", "DELETE", "TRUNCATE", "UPDATE", "ALTER", "CREATE", "GRANT", "REVOKE", "INSERT"];
-    const sqlUpper = sql.toUpperCase();
-    for (const kw of forbidden) {
-        if (new RegExp(`\\b${kw}\\b`).test(sqlUpper)) {
-            dom.resultsArea.innerHTML = `<div style="color:#ef4444; padding:1rem; border:1px solid #ef4444; border-radius:8px; background:rgba(239, 68, 68, 0.05);">
-                <strong>Sécurité :</strong> L'instruction <code>${kw}</code> est bloquée. Cet éditeur est configuré en mode consultation uniquement.
-            </div>`;
-            state.lastOracleError = null;
-            // fixBtn always visible but logic cleans error state
-            return;
-        }
-    }
+    if (!sql.trim() || state.runningQueryId) return;
 
     const oldBtn = dom.runBtn.innerHTML;
-    dom.runBtn.disabled = true;
-    dom.runBtn.innerHTML = '<i data-lucide="loader-2" class="spin"></i>';
+    const oldTitle = dom.runBtn.title;
+    const queryId = crypto.randomUUID();
+    state.runningQueryId = queryId;
+    dom.runBtn.innerHTML = '<i data-lucide="square"></i>';
+    dom.runBtn.title = 'Annuler la requête';
     if (window.lucide) window.lucide.createIcons();
     dom.resultsArea.innerHTML = '<div class="empty-stats">Exécution...</div>';
 
@@ -35,27 +24,42 @@ export async function executeSQL(sql) {
         const resp = await fetch('/api/execute', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ sql })
+            body: JSON.stringify({ sql, query_id: queryId, format: 'columnar' })
         });
         const data = await resp.json();
         if (data.execution_time) {
             if (mTime) mTime.style.display = 'flex';
-            if (eTime) eTime.innerText = `${data.execution_time}ms`;
+            if (eTime) eTime.innerText = `${data.execution_time}ms${data.cached ? ' (cache)' : ''}`;
         }
 
-        if (data.error) {
+        if (data.error && resp.status === 403) {
+            // Contrôle de sécurité côté serveur (db/sql_safety.py) : rien à corriger par l'IA
+            dom.resultsArea.innerHTML = `<div style="color:#ef4444; padding:1rem; border:1px solid #ef4444; border-radius:8px; background:rgba(239, 68, 68, 0.05);">
+                ${data.error} Cet éditeur est configuré en mode consultation uniquement.
+            </div>`;
+            if (mRows) mRows.style.display = 'none';
+            state.lastOracleError = null;
+        } else if (data.error && resp.status === 422) {
+            // Refus du contrôle EXPLAIN PLAN : ce n'est pas une erreur Oracle à corriger
+            dom.resultsArea.innerHTML = renderPlan(data.plan) || `<div style="color:#ef4444; padding:1rem;">${data.error}</div>`;
+            if (mRows) mRows.style.display = 'none';
+            state.lastOracleError = null;
+        } else if (data.error) {
             dom.resultsArea.innerHTML = `<div style="color:#ef4444; padding:1rem;">Erreur : ${data.error}</div>`;
             if (mRows) mRows.style.display = 'none';
             state.lastOracleError = data.error;
         } else if (data.columns && data.data) {
+            // Format "columnar" : data[c][r] ; order = indices des lignes dans l'ordre affiché
             state.currentResults.columns = data.columns;
             state.currentResults.data = data.data;
+            state.currentResults.order = Array.from({ length: data.data.length ? data.data[0].length : 0 }, (_, r) => r);
             state.currentResults.sortCol = null;
             state.currentResults.sortDir = 1;
 
             renderResultsTable();
+            if (data.plan) dom.resultsArea.insertAdjacentHTML('afterbegin', renderPlan(data.plan));
             if (mRows) mRows.style.display = 'flex';
-            if (dom.resultsCount) dom.resultsCount.innerText = `${data.data.length} ligne${data.data.length > 1 ? 's' : ''}`;
+            if (dom.resultsCount) dom.resultsCount.innerText = `${data.row_count} ligne${data.row_count > 1 ? 's' : ''}`;
             if (data.stats) renderStats(data.stats);
 
             saveToHistory(sql.substring(0, 30) + (sql.length > 30 ? '...' : ''), sql);
@@ -70,12 +74,64 @@ export async function executeSQL(sql) {
         state.lastOracleError = e.message || 'Erreur serveur.';
     }
     finally {
+        state.runningQueryId = null;
         dom.runBtn.disabled = false;
         dom.runBtn.innerHTML = oldBtn;
+        dom.runBtn.title = oldTitle;
         if (window.lucide) window.lucide.createIcons();
     }
 }
 
+export async function cancelSQL() {
+    const queryId = state.runningQueryId;
+    if (!queryId) return;
+    dom.runBtn.disabled = true;
+    try {
+        const resp = await fetch(`/api/queries/${queryId}/cancel`, { method: 'POST' });
+        // 404 : la requête venait de se terminer
+        if (!resp.ok && resp.status !== 404) showToast("Annulation impossible.");
+    } catch (e) {
+        showToast("Annulation impossible.");
+    }
+}
+
+export function exportServer(format, compression) {
+    // Export du résultat complet (au-delà de ce qui est affiché) : formulaire POST classique, le navigateur
+    // écrit le fichier sur disque au fil du flux au lieu de le garder en mémoire
+    const sql = dom.sqlEditor.value.trim();
+    if (!sql) return;
+
+    let frame = document.getElementById('export-frame');
+    if (!frame) {
+        frame = document.createElement('iframe');
+        frame.id = 'export-frame';
+        frame.name = 'export-frame';
+        frame.style.display = 'none';
+        // Un téléchargement ne charge pas la page : "load" ne survient que pour une réponse d'erreur (JSON)
+        frame.addEventListener('load', () => {
+            let message = "Export impossible.";
+            try { message = JSON.parse(frame.contentDocument.body.innerText).error || message; } catch (e) {}
+            showToast(message);
+        });
+        document.body.appendChild(frame);
+    }
+
+    const form = document.createElement('form');
+    form.method = 'POST';
+    form.action = '/api/export';
+    form.target = 'export-frame';
+    form.style.display = 'none';
+    Object.entries({ sql, format, compression }).forEach(([name, value]) => {
+        const input = document.createElement('input');
+        input.type = 'hidden'; input.name = name; input.value = value;
+        form.appendChild(input);
+    });
+    document.body.appendChild(form);
+    form.submit();
+    form.remove();
+    showToast("Export en cours...");
+}
+
 export async function fixSQL() {
     const sql = dom.sqlEditor.value.trim();
     if (!sql) {
@@ -106,6 +162,8 @@ export async function fixSQL() {
             dom.sqlEditor.value = data.fixed_sql;
             addChatMessage(data.explanation || "Requête corrigée par l'IA.", 'ai');
             state.lastOracleError = null;
+        } else if (response.status === 429 || response.status === 504) {
+            addChatMessage(`${data.error} (réessayez dans ${data.retry_after} s)`, 'ai');
         } else {
             addChatMessage("Désolé, je n'ai pas pu corriger cette requête.", 'ai');
         }
@@ -120,7 +178,41 @@ export async function fixSQL() {
 
 export async function initDatabase() {
     if (!confirm("Initialiser ?")) return;
-    try { const r = await fetch('/api/init_db', { method: 'POST' }); const d = await r.json(); alert(d.message || d.error); } catch (e) { alert("Erreur."); }
+    // Progression NDJSON (start, skip, error, progress, done) affichée dans le chat
+    const msgId = addChatMessage("Initialisation de la base...", 'ai', true);
+    const bubble = document.querySelector(`#${msgId} .message-bubble`);
+    bubble.style.whiteSpace = 'pre-line';
+    const errors = [];
+    let summary = null;
+    try {
+        const r = await fetch('/api/init_db', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ stream: true })
+        });
+        if (!r.ok) { const d = await r.json(); bubble.textContent = d.error; return; }
+        const reader = r.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            let sep;
+            while ((sep = buffer.indexOf('\n')) !== -1) {
+                const event = JSON.parse(buffer.slice(0, sep));
+                buffer = buffer.slice(sep + 1);
+                if (event.event === 'progress') bubble.textContent = `Initialisation : ${event.done}/${event.total} instructions...`;
+                else if (event.event === 'error') errors.push(event.line ? `Ligne ${event.line} : ${event.error}` : event.error);
+                else if (event.event === 'done') summary = event;
+            }
+        }
+        if (!summary) bubble.textContent = "Initialisation interrompue.";
+        else if (errors.length) bubble.textContent = `${summary.ok} commandes exécutées, ${summary.errors} erreurs.\n${errors.join('\n')}`;
+        else bubble.textContent = `Base de données initialisée avec succès ! (${summary.ok} commandes, ${(summary.elapsed_ms / 1000).toFixed(1)} s)`;
+    } catch (e) {
+        bubble.textContent = "Erreur.";
+    }
 }
 
 export async function seedDatabase() {
@@ -1,15 +1,20 @@
 import { state, dom } from './state.js';
 import { showToast } from './utils.js';
 
+// Résultats au format "columnar" : data[c] = valeurs de la colonne c, order = indices des lignes affichées
+function rowAt(r) {
+    return state.currentResults.data.map(values => values[r]);
+}
+
 export function renderResultsTable() {
-    const { columns, data, sortCol, sortDir } = state.currentResults;
-    if (!data.length) {
+    const { columns, data, order, sortCol, sortDir } = state.currentResults;
+    if (!order.length) {
         dom.resultsArea.innerHTML = '<div style="padding:1rem;">Aucun résultat.</div>';
         return;
     }
 
     const colTypes = columns.map((_, i) => {
-        const val = data.find(r => r[i] !== null)?.[i];
+        const val = data[i].find(v => v !== null);
         if (typeof val === 'number') return { icon: 'hash' };
         if (val && !isNaN(Date.parse(val)) && String(val).length > 10) return { icon: 'calendar' };
         return { icon: 'type' };
@@ -25,8 +30,8 @@ export function renderResultsTable() {
         </div></th>`;
     });
     html += '</tr></thead><tbody>';
-    html += data.map((row, rIdx) => `<tr><td class="col-copy" onclick="window.copyRow(${rIdx})"><i data-lucide="copy"></i></td>
-        ${row.map(c => `<td ondblclick="window.copyCell(this)" title="Double-clic pour copier">
+    html += order.map(r => `<tr><td class="col-copy" onclick="window.copyRow(${r})"><i data-lucide="copy"></i></td>
+        ${data.map(values => values[r]).map(c => `<td ondblclick="window.copyCell(this)" title="Double-clic pour copier">
             ${c !== null ? String(c).replace(/&/g, "&amp;").replace(/</g, "&lt;") : '<span style="opacity:0.3">NULL</span>'}
         </td>`).join('')}</tr>`).join('');
     html += '</tbody></table>';
@@ -34,6 +39,19 @@ export function renderResultsTable() {
     if (window.lucide) window.lucide.createIcons();
 }
 
+export function renderPlan(plan) {
+    // Avertissements du contrôle EXPLAIN PLAN + plan estimé repliable
+    if (!plan || !plan.issues || !plan.issues.length) return '';
+    const color = plan.verdict === 'reject' ? '#ef4444' : '#f59e0b';
+    const escape = v => String(v ?? '').replace(/&/g, "&amp;").replace(/</g, "&lt;");
+    return `<div class="plan-warning" style="color:${color}; padding:0.75rem 1rem; border:1px solid ${color}; border-radius:8px; margin-bottom:0.75rem;">
+        <strong>Plan d'exécution :</strong> coût ${plan.cost ?? '?'}, ~${plan.cardinality ?? '?'} lignes estimées
+        <ul style="margin:0.25rem 0 0 1rem;">${plan.issues.map(i => `<li>${escape(i.message)}</li>`).join('')}</ul>
+        <details style="margin-top:0.25rem;"><summary>Voir le plan</summary><pre style="margin:0.25rem 0 0;">${plan.plan.map(p =>
+            `${'  '.repeat(p.depth || 0)}${escape(p.operation)} ${escape(p.object || '')}  (coût ${p.cost ?? '?'}, ${p.rows ?? '?'} lignes)`).join('\n')}</pre></details>
+    </div>`;
+}
+
 export function renderStats(stats) {
     if (!dom.columnStatsArea || !stats) return;
     dom.columnStatsArea.innerHTML = stats.map(s => `
@@ -54,7 +72,7 @@ export function renderStats(stats) {
 }
 
 export function copyRow(idx) {
-    const text = state.currentResults.data[idx].join('\t');
+    const text = rowAt(idx).join('\t');
     navigator.clipboard.writeText(text).then(() => showToast("Ligne copiée !"));
 }
 
@@ -71,8 +89,10 @@ export function sortResults(idx) {
     if (state.currentResults.sortCol === idx) state.currentResults.sortDir *= -1;
     else { state.currentResults.sortCol = idx; state.currentResults.sortDir = 1; }
 
-    state.currentResults.data.sort((a, b) => {
-        let vA = a[idx], vB = b[idx];
+    // Tri d'une permutation : les colonnes ne sont pas déplacées
+    const values = state.currentResults.data[idx];
+    state.currentResults.order.sort((a, b) => {
+        let vA = values[a], vB = values[b];
         if (vA === null) return 1; if (vB === null) return -1;
         if (typeof vA === 'string') return vA.localeCompare(vB) * state.currentResults.sortDir;
         return (vA - vB) * state.currentResults.sortDir;
@@ -81,8 +101,9 @@ export function sortResults(idx) {
 }
 
 export function exportData(format) {
-    const { columns, data } = state.currentResults;
-    if (!data.length) return;
+    const { columns, order } = state.currentResults;
+    if (!order.length) return;
+    const data = order.map(rowAt);
     let content = '', filename = `export_${Date.now()}`;
     if (format === 'csv') {
         content = [columns.join(','), ...data.map(r => r.map(c => `"${String(c).replace(/"/g, '""')}"`).join(','))].join('\n');
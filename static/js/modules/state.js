@@ -1,6 +1,7 @@
 export const state = {
-    currentResults: { columns: [], data: [], sortCol: null, sortDir: 1 },
+    currentResults: { columns: [], data: [], order: [], sortCol: null, sortDir: 1 },
     lastOracleError: null,
+    runningQueryId: null,
     historyData: []
 };
 